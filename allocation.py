@@ -0,0 +1,292 @@
+"""Allocate many students to rooms in one pass.
+
+Room capacities and current occupancy are read in one grouped query, the
+students are assigned in memory by a policy backed by a heap over the
+remaining beds, and the plan is written as one batched insert into
+``allocated`` inside a single transaction. Planning never writes, so a plan
+can be reviewed (dry run) before it is applied.
+
+Policies:
+    fill-first   top up the fullest rooms first, keeping empty rooms free
+    spread       always use the room with the lowest occupancy ratio
+    same-hostel  place each student in their preferred hostel, otherwise
+                 next to the previous student; fill-first within a hostel
+
+Example:
+    python allocation.py --policy spread --limit 5000           # dry run
+    python allocation.py --policy same-hostel --students intake.csv --apply
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import heapq
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import db
+from db import Error, MySQLConnection
+
+pd = db.lazy_import('pandas')
+
+
+POLICIES = ('fill-first', 'spread', 'same-hostel')
+
+
+@dataclass
+class Room:
+    room_id: int
+    hostel_id: int
+    capacity: int
+    occupants: int
+
+    @property
+    def free(self) -> int:
+        return max(0, self.capacity - self.occupants)
+
+
+@dataclass
+class AllocationPlan:
+    """Assignments computed by plan_allocation, not yet written."""
+    policy: str
+    assignments: List[Tuple[int, int]] = field(default_factory=list)  # (student_id, room_id)
+    unplaced: List[int] = field(default_factory=list)
+    rooms: Dict[int, Room] = field(default_factory=dict)  # occupancy after the plan
+
+    def summary(self) -> pd.DataFrame:
+        """Students placed, rooms used and beds left per hostel."""
+        placed: Dict[int, int] = {}
+        used: Dict[int, set] = {}
+        for _, room_id in self.assignments:
+            hostel_id = self.rooms[room_id].hostel_id
+            placed[hostel_id] = placed.get(hostel_id, 0) + 1
+            used.setdefault(hostel_id, set()).add(room_id)
+        free: Dict[int, int] = {}
+        for room in self.rooms.values():
+            free[room.hostel_id] = free.get(room.hostel_id, 0) + room.free
+        return pd.DataFrame([{'hostel_id': h, 'students placed': placed.get(h, 0),
+                              'rooms used': len(used.get(h, ())), 'beds free after': free[h]}
+                             for h in sorted(free)])
+
+
+def load_rooms(conn: MySQLConnection, hostel_ids: Optional[Iterable[int]] = None) -> List[Room]:
+    """Every room with its capacity and current occupants, from one grouped query."""
+    columns, rows = db.room_occupancy(conn)
+    wanted = set(hostel_ids) if hostel_ids else None
+    i = {name: columns.index(name) for name in ('room_id', 'hostel_id', 'capacity', 'occupants')}
+    return [Room(row[i['room_id']], row[i['hostel_id']], int(row[i['capacity']] or 0), int(row[i['occupants']]))
+            for row in rows if wanted is None or row[i['hostel_id']] in wanted]
+
+
+def _fill_first(rooms: List[Room], students: List[int], plan: AllocationPlan) -> None:
+    # Fewest free beds first; a room stays on top until it is full.
+    heap = [(room.free, room.room_id) for room in rooms if room.free]
+    heapq.heapify(heap)
+    for student_id in students:
+        if not heap:
+            plan.unplaced.append(student_id)
+            continue
+        free, room_id = heapq.heappop(heap)
+        _assign(plan, student_id, room_id)
+        if free > 1:
+            heapq.heappush(heap, (free - 1, room_id))
+
+
+def _spread(rooms: List[Room], students: List[int], plan: AllocationPlan) -> None:
+    # Lowest occupancy ratio first, larger rooms breaking ties.
+    heap = [(room.occupants / room.capacity, -room.capacity, room.room_id) for room in rooms if room.free]
+    heapq.heapify(heap)
+    for student_id in students:
+        if not heap:
+            plan.unplaced.append(student_id)
+            continue
+        _, _, room_id = heapq.heappop(heap)
+        room = _assign(plan, student_id, room_id)
+        if room.free:
+            heapq.heappush(heap, (room.occupants / room.capacity, -room.capacity, room_id))
+
+
+def _same_hostel(rooms: List[Room], students: List[int], plan: AllocationPlan,
+                 preferences: Dict[int, int]) -> None:
+    # One fill-first heap per hostel, plus a heap of hostels by free beds
+    # (lazily refreshed) for students without a usable preference.
+    heaps: Dict[int, List[Tuple[int, int]]] = {}
+    free: Dict[int, int] = {}
+    for room in rooms:
+        if room.free:
+            heaps.setdefault(room.hostel_id, []).append((room.free, room.room_id))
+            free[room.hostel_id] = free.get(room.hostel_id, 0) + room.free
+    for heap in heaps.values():
+        heapq.heapify(heap)
+    roomiest = [(-beds, hostel_id) for hostel_id, beds in free.items()]
+    heapq.heapify(roomiest)
+
+    previous: Optional[int] = None
+    for student_id in students:
+        hostel_id = preferences.get(student_id, previous)
+        if not free.get(hostel_id):
+            hostel_id = None
+            while roomiest:
+                beds, candidate = roomiest[0]
+                if -beds == free[candidate] and free[candidate]:
+                    hostel_id = candidate
+                    break
+                heapq.heappop(roomiest)
+                if free[candidate]:
+                    heapq.heappush(roomiest, (-free[candidate], candidate))
+        if hostel_id is None:
+            plan.unplaced.append(student_id)
+            continue
+        beds, room_id = heapq.heappop(heaps[hostel_id])
+        _assign(plan, student_id, room_id)
+        if beds > 1:
+            heapq.heappush(heaps[hostel_id], (beds - 1, room_id))
+        free[hostel_id] -= 1
+        previous = hostel_id
+
+
+def _assign(plan: AllocationPlan, student_id: int, room_id: int) -> Room:
+    room = plan.rooms[room_id]
+    room.occupants += 1
+    plan.assignments.append((student_id, room_id))
+    return room
+
+
+def plan_allocation(conn: MySQLConnection, students: Iterable[int], policy: str = 'fill-first',
+                    hostel_ids: Optional[Iterable[int]] = None,
+                    preferences: Optional[Dict[int, int]] = None) -> AllocationPlan:
+    """Assign students to rooms in memory without writing anything.
+
+    Students who already have a room, or appear twice, are skipped.
+    Args:
+        conn: Database connection
+        students: Student IDs in the order they should be placed
+        policy: One of POLICIES
+        hostel_ids: Only use rooms in these hostels
+        preferences: student_id -> preferred hostel_id, for 'same-hostel'
+    Returns:
+        An AllocationPlan; students that did not fit are in plan.unplaced
+    """
+    if policy not in POLICIES:
+        raise ValueError(f'Unknown policy {policy!r}; expected one of {", ".join(POLICIES)}')
+    rooms = load_rooms(conn, hostel_ids)
+    plan = AllocationPlan(policy, rooms={room.room_id: room for room in rooms})
+    waiting = set(db.unallocated_students(conn))
+    queue = []
+    for student_id in students:
+        if student_id in waiting:
+            queue.append(student_id)
+            waiting.discard(student_id)
+    if policy == 'fill-first':
+        _fill_first(rooms, queue, plan)
+    elif policy == 'spread':
+        _spread(rooms, queue, plan)
+    else:
+        _same_hostel(rooms, queue, plan, preferences or {})
+    return plan
+
+
+def apply_plan(conn: MySQLConnection, plan: AllocationPlan, batch_size: int = 1000) -> db.BatchResult:
+    """Write a plan's assignments in one transaction.
+
+    The planned rooms are locked and their occupancy re-read first, and the
+    planned students' existing allocations are locked too. If a room no
+    longer has the beds the plan counted on, or a student got a room in the
+    meantime, nothing is written and Error is raised, so the plan can be
+    recomputed. Any failing insert batch rolls back the whole plan.
+    """
+    if not plan.assignments:
+        return db.BatchResult()
+    needed: Dict[int, int] = {}
+    for _, room_id in plan.assignments:
+        needed[room_id] = needed.get(room_id, 0) + 1
+    with db.transaction(conn):
+        cur = conn.cursor()
+        try:
+            room_ids = list(needed)
+            free: Dict[int, int] = {}
+            for start in range(0, len(room_ids), batch_size):
+                chunk = room_ids[start:start + batch_size]
+                cur.execute(f"""
+                    SELECT r.room_id, r.capacity - (SELECT COUNT(*) FROM allocated a WHERE a.room_id = r.room_id)
+                    FROM room r WHERE r.room_id IN ({', '.join(['%s'] * len(chunk))})
+                    FOR UPDATE""", chunk)
+                free.update((room_id, int(beds or 0)) for room_id, beds in cur.fetchall())
+            # allocated's key is (student_id, room_id), so it would accept a second room for a student
+            student_ids = [student_id for student_id, _ in plan.assignments]
+            placed: List[int] = []
+            for start in range(0, len(student_ids), batch_size):
+                chunk = student_ids[start:start + batch_size]
+                cur.execute(f"""
+                    SELECT student_id FROM allocated WHERE student_id IN ({', '.join(['%s'] * len(chunk))})
+                    FOR UPDATE""", chunk)
+                placed.extend(student_id for (student_id,) in cur.fetchall())
+        finally:
+            cur.close()
+        short = [room_id for room_id, count in needed.items() if free.get(room_id, 0) < count]
+        if short:
+            raise Error(f'{len(short)} planned room(s) no longer have enough free beds '
+                        f'(e.g. room {short[0]}); plan again')
+        if placed:
+            raise Error(f'{len(set(placed))} planned student(s) were allocated a room since the plan was made '
+                        f'(e.g. student {placed[0]}); plan again')
+        result = db.insert_records(conn, 'allocated', ({'student_id': s, 'room_id': r} for s, r in plan.assignments),
+                                   batch_size=batch_size)
+        if not result.ok:
+            raise Error(f'Allocation batch {result.errors[0][0]} failed: {result.errors[0][2]}')
+    return result
+
+
+def parse_students(lines: Iterable[str]) -> Tuple[List[int], Dict[int, int]]:
+    """student_id[,hostel_id] rows from CSV text lines (a header row is optional)."""
+    students, preferences = [], {}
+    for row in csv.reader(lines):
+        if not row or not row[0].strip().isdigit():
+            continue
+        students.append(int(row[0]))
+        if len(row) > 1 and row[1].strip():
+            preferences[int(row[0])] = int(row[1])
+    return students, preferences
+
+
+def _read_students(path: str) -> Tuple[List[int], Dict[int, int]]:
+    with open(path, newline='') as f:
+        return parse_students(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--database', help='Schema to use (default: DB_DATABASE)')
+    parser.add_argument('--policy', choices=POLICIES, default='fill-first')
+    parser.add_argument('--students', help='CSV of student_id[,preferred hostel_id]; default: all unallocated')
+    parser.add_argument('--limit', type=int, help='Place at most this many students')
+    parser.add_argument('--hostel', type=int, action='append', default=[], help='Only use rooms in this hostel')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--apply', action='store_true', help='Write the plan (default: dry run)')
+    args = parser.parse_args()
+
+    if args.database:
+        os.environ['DB_DATABASE'] = args.database
+    conn = db.get_connection()
+    try:
+        if args.students:
+            students, preferences = _read_students(args.students)
+        else:
+            students, preferences = db.unallocated_students(conn), {}
+        students = students[:args.limit] if args.limit else students
+        plan = plan_allocation(conn, students, args.policy, args.hostel, preferences)
+        print(plan.summary().to_string(index=False))
+        print(f'\n{len(plan.assignments):,} students placed, {len(plan.unplaced):,} without a free bed '
+              f'({args.policy})')
+        if args.apply:
+            result = apply_plan(conn, plan, args.batch_size)
+            print(f'Wrote {result.rows:,} allocations in {result.batches} batches')
+        else:
+            print('Dry run: nothing written (use --apply)')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
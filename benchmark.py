@@ -0,0 +1,253 @@
+"""Time the db.py functions against a loaded database and keep JSON results.
+
+Run datagen.py first to get realistic volumes. Every case runs --repeat
+times after --warmup untimed runs, with the result cache disabled unless
+--with-cache is given. Writes (procedures, insert/update/delete) run inside
+a transaction that is rolled back, so repeated runs see the same data.
+
+Example:
+    python benchmark.py --output bench/baseline.json
+    python benchmark.py --output bench/new.json --compare bench/baseline.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import db
+
+
+class _Rollback(Exception):
+    """Raised to undo a write case once it has been timed."""
+
+
+def _scalar(conn, sql: str, params=()) -> Any:
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, params)
+        row = cur.fetchone()
+        return row[0] if row else None
+    finally:
+        cur.close()
+
+
+def _column(conn, sql: str, params=()) -> List[Any]:
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, params)
+        return [row[0] for row in cur.fetchall()]
+    finally:
+        cur.close()
+
+
+class Fixtures:
+    """Random but valid IDs drawn from the loaded data."""
+
+    def __init__(self, conn, rng: random.Random, sample: int = 1000):
+        self.rng = rng
+        self.students = _column(conn, "SELECT student_id FROM student ORDER BY RAND() LIMIT %s", (sample,))
+        self.visitors = _column(conn, "SELECT visitor_id FROM visitor ORDER BY RAND() LIMIT %s", (sample,))
+        self.rooms = _column(conn, "SELECT room_id FROM room ORDER BY RAND() LIMIT %s", (sample,))
+        self.hostels = _column(conn, "SELECT hostel_id FROM hostel")
+        self.open_receipts = _column(conn, "SELECT receipt_no FROM fees WHERE date_paid IS NULL LIMIT %s", (sample,))
+        self.receipts = _column(conn, "SELECT receipt_no FROM fees ORDER BY RAND() LIMIT %s", (sample,))
+        # A visits key from the middle of the table for deep keyset pages
+        total = _scalar(conn, "SELECT COUNT(*) FROM visits") or 0
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT student_id, visitor_id, visit_date FROM visits "
+                        "ORDER BY student_id, visitor_id, visit_date LIMIT 1 OFFSET %s", (total // 2,))
+            self.mid_visit = cur.fetchone()
+        finally:
+            cur.close()
+
+    def pick(self, values: List[Any]) -> Any:
+        return self.rng.choice(values) if values else 1
+
+    def routine_args(self, params) -> List[Any]:
+        """Guess plausible arguments from routine parameter names and types."""
+        args = []
+        for param_name, _, param_type in params:
+            lowered = (param_name or '').lower()
+            if 'receipt' in lowered:
+                args.append(self.pick(self.open_receipts or self.receipts))
+            elif 'student' in lowered:
+                args.append(self.pick(self.students))
+            elif 'visitor' in lowered:
+                args.append(self.pick(self.visitors))
+            elif 'room' in lowered:
+                args.append(self.pick(self.rooms))
+            elif 'hostel' in lowered:
+                args.append(self.pick(self.hostels))
+            elif 'date' in (param_type or '').lower() or 'date' in lowered:
+                args.append(datetime.date.today().isoformat())
+            elif 'int' in (param_type or '').lower():
+                args.append(1)
+            elif 'decimal' in (param_type or '').lower():
+                args.append(1000)
+            else:
+                args.append('')
+        return args
+
+
+def build_cases(conn, fixtures: Fixtures) -> Dict[str, Callable[[], Any]]:
+    schema = db.get_schema(conn)
+
+    def rolled_back(write: Callable[[], Any]) -> Callable[[], Any]:
+        def run():
+            try:
+                with db.transaction(conn):
+                    write()
+                    raise _Rollback
+            except _Rollback:
+                pass
+        return run
+
+    cases: Dict[str, Callable[[], Any]] = {
+        'list_tables': lambda: db.list_tables(conn),
+        'describe_table(student)': lambda: db.describe_table(conn, 'student'),
+        'fetch_table(student, 1000)': lambda: db.fetch_table(conn, 'student', limit=1000),
+        'fetch_table(visits, 1000)': lambda: db.fetch_table(conn, 'visits', limit=1000),
+        'fetch_columnar(visits, 1000)': lambda: db.fetch_columnar(conn, 'visits', limit=1000),
+        'fetch_page(visits, first)': lambda: db.fetch_page(conn, 'visits', 50),
+        'get_record_by_id(student)': lambda: db.get_record_by_id(conn, 'student', 'student_id', fixtures.pick(fixtures.students)),
+        'get_record_by_id(fees)': lambda: db.get_record_by_id(conn, 'fees', 'receipt_no', fixtures.pick(fixtures.receipts)),
+        'iter_table_chunks(room)': lambda: sum(len(chunk) for chunk in db.iter_table_chunks(conn, 'room')),
+        'insert_record(visitor)': rolled_back(lambda: db.insert_record(conn, 'visitor', {'f_name': 'Bench', 'l_name': 'Mark'})),
+        'update_record(student)': rolled_back(lambda: db.update_record(
+            conn, 'student', {'age': 21, 'age_group': '18-22'}, {'student_id': fixtures.pick(fixtures.students)})),
+        'delete_record(fees)': rolled_back(lambda: db.delete_record(conn, 'fees', {'receipt_no': fixtures.pick(fixtures.receipts)})),
+    }
+    if fixtures.mid_visit:
+        cases['fetch_page(visits, middle)'] = lambda: db.fetch_page(conn, 'visits', 50, after=fixtures.mid_visit)
+
+    for routine_type in ('FUNCTION', 'PROCEDURE'):
+        for name in schema.routine_names(routine_type):
+            params, _ = schema.procedure_info(name, routine_type)
+
+            def call(name=name, routine_type=routine_type, params=params):
+                return db.call_routine(conn, name, fixtures.routine_args(params), routine_type)
+            label = f'call_routine({name})'
+            cases[label] = call if routine_type == 'FUNCTION' else rolled_back(call)
+    return cases
+
+
+def run_case(fn: Callable[[], Any], repeat: int, warmup: int) -> Dict[str, Any]:
+    timings = []
+    errors = 0
+    last_error: Optional[str] = None
+    for i in range(warmup + repeat):
+        started = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            errors += 1
+            last_error = str(e)
+            continue
+        if i >= warmup:
+            timings.append(time.perf_counter() - started)
+    result: Dict[str, Any] = {'runs': len(timings), 'errors': errors}
+    if last_error:
+        result['last_error'] = last_error
+    if timings:
+        ordered = sorted(timings)
+        result.update({
+            'mean_ms': statistics.fmean(timings) * 1000,
+            'p50_ms': ordered[len(ordered) // 2] * 1000,
+            'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+            'p99_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+            'min_ms': ordered[0] * 1000,
+            'max_ms': ordered[-1] * 1000,
+        })
+    return result
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Print p50/p95 changes per case and return the cases that regressed."""
+    regressions = []
+    print(f"\n{'case':40} {'base p50':>10} {'p50':>10} {'change':>8}   {'base p95':>10} {'p95':>10}")
+    for case, result in current['results'].items():
+        base = baseline['results'].get(case)
+        if not base or 'p50_ms' not in base or 'p50_ms' not in result:
+            continue
+        change = result['p50_ms'] / base['p50_ms'] - 1 if base['p50_ms'] else 0.0
+        flag = '  REGRESSION' if change > threshold else ''
+        print(f"{case:40} {base['p50_ms']:10.2f} {result['p50_ms']:10.2f} {change:+8.1%}   "
+              f"{base['p95_ms']:10.2f} {result['p95_ms']:10.2f}{flag}")
+        if flag:
+            regressions.append(case)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--database', help='Schema to benchmark (default: DB_DATABASE)')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--only', action='append', default=[], help='Run only cases containing this text')
+    parser.add_argument('--with-cache', action='store_true', help='Keep the db.py result cache enabled')
+    parser.add_argument('--output', default='bench_results.json', help='Where to write the JSON results')
+    parser.add_argument('--compare', help='Earlier results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='p50 slowdown that counts as a regression')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if args.database:
+        os.environ['DB_DATABASE'] = args.database
+    if not args.with_cache:
+        # Nothing fits in a zero budget, so every read goes to the server.
+        db.result_cache.max_bytes = 0
+
+    conn = db.get_connection()
+    try:
+        fixtures = Fixtures(conn, random.Random(args.seed))
+        cases = build_cases(conn, fixtures)
+        if args.only:
+            cases = {k: v for k, v in cases.items() if any(text in k for text in args.only)}
+        row_counts = {table: _scalar(conn, f"SELECT COUNT(*) FROM `{table}`") for table in db.get_schema(conn).tables}
+        results = {}
+        for case, fn in cases.items():
+            results[case] = run_case(fn, args.repeat, args.warmup)
+            r = results[case]
+            timing = f"p50 {r['p50_ms']:8.2f} ms  p95 {r['p95_ms']:8.2f} ms" if 'p50_ms' in r else 'no successful runs'
+            errors = f"  ({r['errors']} errors: {r.get('last_error')})" if r['errors'] else ''
+            print(f'{case:40} {timing}{errors}')
+        report = {
+            'meta': {
+                'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                'server_version': _scalar(conn, 'SELECT VERSION()'),
+                'python': platform.python_version(),
+                'repeat': args.repeat,
+                'warmup': args.warmup,
+                'cache': args.with_cache,
+                'row_counts': row_counts,
+            },
+            'results': results,
+        }
+    finally:
+        conn.close()
+
+    out_dir = os.path.dirname(args.output)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f'\nWrote {args.output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} case(s) regressed by more than {args.threshold:.0%}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""Generate consistent synthetic hostel data at realistic scale.
+
+Rows are generated lazily and loaded through db.insert_records, so memory
+stays bounded however many rows are requested. Primary keys are assigned
+explicitly, continuing after the current maximum, which lets a run append to
+an existing database without breaking foreign keys.
+
+Example:
+    python datagen.py --students 100000 --rooms 5000 --visits 10000000 --fees 2000000
+"""
+import argparse
+import datetime
+import os
+import random
+import time
+from typing import Iterator, List, Tuple
+
+from db import get_connection, insert_records, MySQLConnection, calculate_age_group
+
+
+ROOM_TYPES = [('Single', 1), ('Double', 2), ('Triple', 3)]  # same casing as mysql.sql
+FIRST_NAMES = ['Arjun', 'Sneha', 'Karthik', 'Priya', 'Rahul', 'Ananya', 'Vikram', 'Divya', 'Rohan', 'Meera',
+               'Aditya', 'Kavya', 'Siddharth', 'Pooja', 'Nikhil', 'Lakshmi', 'Varun', 'Shreya', 'Manoj', 'Sujatha']
+LAST_NAMES = ['Reddy', 'Patil', 'Prasad', 'Menon', 'Kumar', 'Rao', 'Sharma', 'Iyer', 'Nair', 'Gowda',
+              'Shetty', 'Joshi', 'Kulkarni', 'Pillai', 'Hegde', 'Bhat', 'Naidu', 'Desai', 'Verma', 'Das']
+CITIES = [('Bangalore', '5600'), ('Mysore', '5700'), ('Mangalore', '5750'), ('Hubli', '5800')]
+
+
+def next_id(conn: MySQLConnection, table: str, column: str) -> int:
+    cur = conn.cursor()
+    try:
+        cur.execute(f"SELECT COALESCE(MAX(`{column}`), 0) + 1 FROM `{table}`")
+        return int(cur.fetchone()[0])
+    finally:
+        cur.close()
+
+
+def phone(rng: random.Random) -> str:
+    return str(rng.randint(6000000000, 9999999999))
+
+
+def name(rng: random.Random) -> Tuple[str, str]:
+    return rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+
+
+def wardens(rng: random.Random, first: int, count: int) -> Iterator[dict]:
+    for warden_id in range(first, first + count):
+        f_name, l_name = name(rng)
+        yield {'warden_id': warden_id, 'f_name': f_name, 'l_name': l_name, 'phone_no': phone(rng),
+               'salary': rng.randrange(25000, 60000, 500)}
+
+
+def hostels(rng: random.Random, first: int, count: int, warden_ids: List[int], rooms_per_hostel: int) -> Iterator[dict]:
+    for i, hostel_id in enumerate(range(first, first + count)):
+        city, pin = rng.choice(CITIES)
+        yield {'hostel_id': hostel_id, 'name': f'Block {hostel_id}', 'total_room': rooms_per_hostel,
+               'street': f'{rng.randint(1, 200)} Main Road', 'city': city, 'pincode': f'{pin}{rng.randint(10, 99)}',
+               'warden_id': warden_ids[i % len(warden_ids)] if warden_ids else None}
+
+
+def people(rng: random.Random, first: int, count: int, with_age: bool) -> Iterator[dict]:
+    for person_id in range(first, first + count):
+        f_name, l_name = name(rng)
+        row = {'f_name': f_name, 'l_name': l_name}
+        if with_age:
+            age = rng.randint(17, 30)
+            row.update(student_id=person_id, age=age, age_group=calculate_age_group(age))
+        else:
+            row['visitor_id'] = person_id
+        yield row
+
+
+def phones(rng: random.Random, id_column: str, ids: range, per_person: float) -> Iterator[dict]:
+    for person_id in ids:
+        count = int(per_person) + (rng.random() < per_person % 1)
+        for number in {phone(rng) for _ in range(count)}:
+            yield {id_column: person_id, 'phone_no': number}
+
+
+def allocations(rng: random.Random, rooms: List[Tuple[int, int]], student_ids: range, fill_ratio: float) -> Iterator[dict]:
+    """Assign each student at most one room without exceeding any room's capacity."""
+    students = list(student_ids)
+    rng.shuffle(students)
+    students = students[:int(len(students) * fill_ratio)]
+    position = 0
+    for room_id, capacity in rooms:
+        for _ in range(capacity):
+            if position >= len(students):
+                return
+            yield {'student_id': students[position], 'room_id': room_id}
+            position += 1
+
+
+def visits(rng: random.Random, student_ids: range, visitor_ids: range, total: int, start: datetime.date,
+           days: int) -> Iterator[dict]:
+    """Spread ``total`` visits over the students. A student gets at most one visit
+    a day until every day is used, then more visitors per day, so
+    (student_id, visitor_id, visit_date) never repeats.
+
+    Raises:
+        ValueError: if ``total`` exceeds ``len(student_ids) * len(visitor_ids) * days``.
+    """
+    if total > len(student_ids) * len(visitor_ids) * days:
+        raise ValueError(f'{total:,} visits need more than {len(student_ids):,} students x '
+                         f'{len(visitor_ids):,} visitors x {days:,} days')
+    per_student, extra = divmod(total, len(student_ids))
+    for n, student_id in enumerate(student_ids):
+        rounds, rest = divmod(per_student + (n < extra), days)
+        busy = set(rng.sample(range(days), rest))
+        for day in range(days) if rounds else sorted(busy):
+            date = start + datetime.timedelta(days=day)
+            for visitor_id in rng.sample(visitor_ids, rounds + (day in busy)):
+                yield {'student_id': student_id, 'visitor_id': visitor_id, 'visit_date': date}
+
+
+def fees(rng: random.Random, first: int, student_ids: range, total: int, start: datetime.date,
+         paid_ratio: float) -> Iterator[dict]:
+    """Monthly fee rows per student; all but the last three months are paid,
+    and those with probability ``paid_ratio``."""
+    per_student, extra = divmod(total, len(student_ids))
+    receipt_no = first
+    for n, student_id in enumerate(student_ids):
+        count = per_student + (n < extra)
+        for month in range(count):
+            due = datetime.date(start.year + (start.month - 1 + month) // 12, (start.month - 1 + month) % 12 + 1, 1)
+            paid = rng.random() < paid_ratio or month < count - 3
+            yield {'receipt_no': receipt_no, 'due_date': due, 'amount': rng.choice([12000, 15000, 18000]),
+                   'date_paid': due + datetime.timedelta(days=rng.randint(0, 20)) if paid else None,
+                   'student_id': student_id}
+            receipt_no += 1
+
+
+def load(conn: MySQLConnection, table: str, rows: Iterator[dict], batch_size: int) -> int:
+    started = time.perf_counter()
+    result = insert_records(conn, table, rows, batch_size=batch_size)
+    elapsed = time.perf_counter() - started
+    print(f'{table:15} {result.rows:>11,} rows in {elapsed:8.1f}s ({result.rows / max(elapsed, 1e-9):,.0f} rows/s)')
+    for number, offset, message in result.errors[:5]:
+        print(f'  batch {number} (row {offset}) failed: {message}')
+    if len(result.errors) > 5:
+        print(f'  ... {len(result.errors) - 5} more failed batches')
+    return result.rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--database', help='Schema to load (default: DB_DATABASE)')
+    parser.add_argument('--students', type=int, default=100_000)
+    parser.add_argument('--visitors', type=int, default=50_000)
+    parser.add_argument('--wardens', type=int, default=60)
+    parser.add_argument('--hostels', type=int, default=50)
+    parser.add_argument('--rooms', type=int, default=5_000)
+    parser.add_argument('--visits', type=int, default=10_000_000)
+    parser.add_argument('--fees', type=int, default=2_000_000)
+    parser.add_argument('--fill-ratio', type=float, default=0.9,
+                        help='Share of students to allocate (bounded by total room capacity)')
+    parser.add_argument('--paid-ratio', type=float, default=0.85, help='Share of recent fee rows already paid')
+    parser.add_argument('--start-date', type=datetime.date.fromisoformat, default=datetime.date(2022, 1, 1))
+    parser.add_argument('--days', type=int, default=1095, help='Length of the visit history in days')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    if args.visits > args.students * args.visitors * args.days:
+        parser.error(f'--visits {args.visits:,} exceeds --students x --visitors x --days '
+                     f'({args.students * args.visitors * args.days:,} distinct visits)')
+
+    if args.database:
+        os.environ['DB_DATABASE'] = args.database
+    conn = get_connection()
+    rng = random.Random(args.seed)
+    batch = args.batch_size
+
+    try:
+        first_warden = next_id(conn, 'warden', 'warden_id')
+        load(conn, 'warden', wardens(rng, first_warden, args.wardens), batch)
+        warden_ids = list(range(first_warden, first_warden + args.wardens))
+        load(conn, 'phone_warden', phones(rng, 'warden_id', range(first_warden, first_warden + args.wardens), 1.5), batch)
+
+        first_hostel = next_id(conn, 'hostel', 'hostel_id')
+        rooms_per_hostel = max(1, args.rooms // max(1, args.hostels))
+        load(conn, 'hostel', hostels(rng, first_hostel, args.hostels, warden_ids, rooms_per_hostel), batch)
+
+        first_room = next_id(conn, 'room', 'room_id')
+        rooms = []
+        for offset in range(args.rooms):
+            room_type, capacity = rng.choices(ROOM_TYPES, weights=[2, 5, 3])[0]
+            rooms.append((first_room + offset, room_type, capacity, first_hostel + offset % max(1, args.hostels)))
+        load(conn, 'room', ({'room_id': r, 'type': t, 'capacity': c, 'hostel_id': h} for r, t, c, h in rooms), batch)
+
+        first_student = next_id(conn, 'student', 'student_id')
+        student_ids = range(first_student, first_student + args.students)
+        load(conn, 'student', people(rng, first_student, args.students, with_age=True), batch)
+        load(conn, 'phone_student', phones(rng, 'student_id', student_ids, 1.2), batch)
+
+        first_visitor = next_id(conn, 'visitor', 'visitor_id')
+        visitor_ids = range(first_visitor, first_visitor + args.visitors)
+        load(conn, 'visitor', people(rng, first_visitor, args.visitors, with_age=False), batch)
+        load(conn, 'phone_visitor', phones(rng, 'visitor_id', visitor_ids, 1.0), batch)
+
+        load(conn, 'allocated', allocations(rng, [(r, c) for r, _, c, _ in rooms], student_ids, args.fill_ratio), batch)
+        if args.visits:
+            loaded = load(conn, 'visits', visits(rng, student_ids, visitor_ids, args.visits, args.start_date,
+                                                 args.days), batch)
+            if loaded < args.visits:
+                print(f'  only {loaded:,} of the {args.visits:,} requested visits were inserted')
+        if args.fees:
+            first_receipt = next_id(conn, 'fees', 'receipt_no')
+            load(conn, 'fees', fees(rng, first_receipt, student_ids, args.fees, args.start_date, args.paid_ratio), batch)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
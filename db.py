@@ -1,58 +1,535 @@
+from __future__ import annotations
+
+import asyncio
+import atexit
+import bisect
+import contextvars
+import csv
+import datetime
+import gzip
+import importlib.util
+import json
+import logging
 import os
-from typing import Optional, List, Any, Tuple
+import re
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from decimal import Decimal
+from functools import lru_cache
+from typing import Optional, List, Any, Tuple, Dict, Iterable, Iterator, Set, Callable
 
 import mysql.connector
-from mysql.connector import MySQLConnection, connect, Error
+from mysql.connector import MySQLConnection, FieldType, connect, Error
 from dotenv import load_dotenv
 
 
+class _DeferredModule:
+    """Stands in for a module and imports it for real on first attribute access.
+
+    The import runs through importlib.import_module under a lock, so threads
+    that touch the proxy at the same moment (run_parallel workers, Streamlit
+    sessions) all wait for and then see the fully initialised module.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+                module = self._module
+        return module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        state = 'loaded' if self._module is not None else 'not loaded yet'
+        return f'<deferred module {self._name!r} ({state})>'
+
+
+def lazy_import(name: str):
+    """Return a module that is only imported when one of its attributes is used.
+
+    pandas and numpy cost far more to import than the rest of the app, and
+    many paths (schema pickers, CLI tools, CRUD forms) never touch them.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    if importlib.util.find_spec(name) is None:
+        raise ImportError(f'No module named {name!r}')
+    return _DeferredModule(name)
+
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+
 load_dotenv()
 
 
+def _env_config() -> dict:
+    """Build a connection config from the DB_* environment variables."""
+    return {
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'port': int(os.getenv('DB_PORT', '3306')),
+        'user': os.getenv('DB_USER', 'root'),
+        'password': os.getenv('DB_PASSWORD', ''),
+        'database': os.getenv('DB_DATABASE', None),
+        'autocommit': True,
+    }
+
+
 def get_connection(config: Optional[dict] = None) -> MySQLConnection:
     """Return a mysql.connector connection.
 
     If config is None, read DB_* variables from environment.
     """
     if config is None:
-        config = {
-            'host': os.getenv('DB_HOST', 'localhost'),
-            'port': int(os.getenv('DB_PORT', '3306')),
-            'user': os.getenv('DB_USER', 'root'),
-            'password': os.getenv('DB_PASSWORD', ''),
-            'database': os.getenv('DB_DATABASE', None),
-            'autocommit': True,
-        }
+        config = _env_config()
     try:
         conn = connect(**config)
-        return conn
     except Error as e:
         raise
+    # Remembered so background work (schema snapshot checks) can open its own
+    # connection, and so the default schema is known without a query.
+    _configs[conn] = config
+    if config.get('database'):
+        _identities[conn] = (conn.server_host, conn.server_port, config['database'])
+    return conn
+
+
+class PoolTimeout(Error):
+    """Raised when no pooled connection became free within the timeout."""
+
+
+class ConnectionPool:
+    """Thread-safe pool of connections that share one config.
+
+    Idle connections are reused most-recently-used first, pinged on checkout
+    when they have been idle longer than ``health_check_interval`` and closed
+    once they have been idle longer than ``idle_timeout``. At most
+    ``max_size`` connections are open at a time; further checkouts wait up to
+    ``checkout_timeout`` seconds for one to be returned.
+    """
+
+    def __init__(self, config: Optional[dict] = None, max_size: int = 5,
+                 idle_timeout: float = 300.0, checkout_timeout: float = 30.0,
+                 health_check_interval: float = 5.0):
+        self.config = dict(config) if config is not None else _env_config()
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        self._idle = deque()  # (conn, returned_at), most recent on the right
+        self._size = 0  # open connections, idle or checked out
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {'hits': 0, 'misses': 0, 'waits': 0, 'wait_time': 0.0,
+                       'timeouts': 0, 'busy': 0, 'evicted': 0, 'discarded': 0}
+
+    def acquire(self, timeout: Optional[float] = None) -> MySQLConnection:
+        """Check out a connection, opening a new one if the pool has room."""
+        return self._checkout(self.checkout_timeout if timeout is None else timeout)
+
+    def try_acquire(self) -> Optional[MySQLConnection]:
+        """Check out a connection only if one is free right now, else return None.
+
+        A refusal is counted as ``busy`` rather than as a timeout.
+        """
+        return self._checkout(None)
+
+    def _checkout(self, timeout: Optional[float]) -> Optional[MySQLConnection]:
+        # timeout None: return None instead of waiting for a free slot
+        deadline = time.monotonic() + (timeout or 0.0)
+        waited = 0.0
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise Error('Connection pool is closed')
+                self._evict_expired()
+                conn, returned_at = None, None
+                while not self._idle and self._size >= self.max_size:
+                    if timeout is None:
+                        self._stats['busy'] += 1
+                        return None
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(f'No connection available within {timeout:.1f}s '
+                                          f'(max_size={self.max_size})')
+                    started = time.monotonic()
+                    self._stats['waits'] += 1
+                    self._cond.wait(remaining)
+                    waited += time.monotonic() - started
+                    if self._closed:
+                        raise Error('Connection pool is closed')
+                    self._evict_expired()
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                else:
+                    self._size += 1  # reserve the slot before connecting
+            if conn is None:
+                try:
+                    conn = get_connection(self.config)
+                except Exception:
+                    self._forget()
+                    raise
+                self._record_checkout('misses', waited)
+                return conn
+            if time.monotonic() - returned_at < self.health_check_interval or self._healthy(conn):
+                self._record_checkout('hits', waited)
+                return conn
+            # Stale connection: drop it and try again with the same deadline.
+            self._discard(conn)
+
+    def release(self, conn: MySQLConnection) -> None:
+        """Return a connection to the pool, resetting any open transaction."""
+        try:
+            if conn.unread_result:
+                conn.consume_results()
+            if conn.in_transaction:
+                conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                _close_quietly(conn)
+                return
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[MySQLConnection]:
+        """Borrow a connection for the duration of a ``with`` block."""
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def evict_idle(self) -> int:
+        """Close connections idle longer than ``idle_timeout``; return how many."""
+        with self._cond:
+            return self._evict_expired()
+
+    def close(self) -> None:
+        """Close idle connections and refuse further checkouts.
+
+        Connections still checked out are closed when they are released.
+        """
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            _close_quietly(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return checkout counters plus the current pool occupancy."""
+        with self._cond:
+            stats = dict(self._stats)
+            checkouts = stats['hits'] + stats['misses']
+            stats['hit_rate'] = stats['hits'] / checkouts if checkouts else 0.0
+            stats['avg_wait'] = stats['wait_time'] / checkouts if checkouts else 0.0
+            stats['size'] = self._size
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._size - len(self._idle)
+            stats['max_size'] = self.max_size
+            return stats
+
+    def _evict_expired(self) -> int:
+        # Caller holds self._cond. Oldest idle connections sit on the left.
+        now = time.monotonic()
+        evicted = 0
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            conn, _ = self._idle.popleft()
+            self._size -= 1
+            evicted += 1
+            _close_quietly(conn)
+        if evicted:
+            self._stats['evicted'] += evicted
+            self._cond.notify_all()
+        return evicted
+
+    def _healthy(self, conn: MySQLConnection) -> bool:
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _record_checkout(self, kind: str, waited: float) -> None:
+        with self._cond:
+            self._stats[kind] += 1
+            self._stats['wait_time'] += waited
+        _record(QueryEvent('pool.acquire', None, '', wall_time=waited, wait_time=waited))
+
+    def _forget(self) -> None:
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _discard(self, conn: MySQLConnection) -> None:
+        _close_quietly(conn)
+        with self._cond:
+            self._stats['discarded'] += 1
+        self._forget()
+
+
+def _close_quietly(conn: MySQLConnection) -> None:
+    close_statements(conn)
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+_pools: Dict[tuple, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def _config_key(config: dict) -> tuple:
+    return tuple(sorted((k, repr(v)) for k, v in config.items()))
+
+
+def get_pool(config: Optional[dict] = None, **pool_options) -> ConnectionPool:
+    """Return the process-wide pool for a config, creating it on first use.
+
+    Pools are keyed by the config dict, so every caller passing the same
+    settings shares one set of connections. ``pool_options`` are forwarded
+    to ``ConnectionPool`` and only apply when the pool is created.
+    """
+    if config is None:
+        config = _env_config()
+    key = _config_key(config)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(config, **pool_options)
+        return pool
+
+
+def close_all_pools() -> None:
+    """Close every pool created through get_pool."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_all_pools)
+
+
+@dataclass
+class QueryEvent:
+    """One statement (or cache hit) issued through this module."""
+    function: str
+    table: Optional[str]
+    sql: str
+    params_shape: str = ''
+    rows: int = 0
+    bytes: int = 0
+    wall_time: float = 0.0
+    wait_time: float = 0.0
+    cached: bool = False
+    error: Optional[str] = None
+    explain: Optional[List[Tuple]] = None
+    # Bound values, kept so tools can re-run the statement (e.g. EXPLAIN it)
+    params: Any = field(default=None, repr=False)
+
+    def result(self, rows: Any) -> None:
+        """Record the row count and approximate size of a fetched result."""
+        self.rows = len(rows) if isinstance(rows, (list, tuple)) else int(rows is not None)
+        self.bytes = _estimate_size(rows)
+
+
+SLOW_QUERY_SECONDS = float(os.getenv('DB_SLOW_QUERY_MS', '200')) / 1000
+EXPLAIN_SLOW_QUERIES = os.getenv('DB_EXPLAIN_SLOW', '0') == '1'
+slow_log = logging.getLogger('db.slow')
+
+_query_hooks: List[Callable[[QueryEvent], None]] = []
+_capture: ContextVar[Optional[List[QueryEvent]]] = ContextVar('db_query_capture', default=None)
+_timings: Dict[Tuple[str, Optional[str]], deque] = {}
+_timings_lock = threading.Lock()
+
+
+def add_query_hook(hook: Callable[[QueryEvent], None]) -> None:
+    """Call ``hook(event)`` after every statement issued through this module."""
+    _query_hooks.append(hook)
+
+
+def remove_query_hook(hook: Callable[[QueryEvent], None]) -> None:
+    _query_hooks.remove(hook)
+
+
+@contextmanager
+def capture_queries() -> Iterator[List[QueryEvent]]:
+    """Collect the QueryEvents issued in this context (e.g. one Streamlit rerun)."""
+    events: List[QueryEvent] = []
+    token = _capture.set(events)
+    try:
+        yield events
+    finally:
+        _capture.reset(token)
+
+
+def query_stats() -> List[Dict[str, Any]]:
+    """Latency percentiles per (function, table) over recent executions."""
+    with _timings_lock:
+        samples = {key: sorted(values) for key, values in _timings.items()}
+    stats = []
+    for (function, table), values in sorted(samples.items(), key=lambda item: (item[0][0], item[0][1] or '')):
+        def pct(p: float) -> float:
+            return values[min(len(values) - 1, int(p * len(values)))]
+        stats.append({'function': function, 'table': table, 'count': len(values),
+                      'p50': pct(0.50), 'p95': pct(0.95), 'p99': pct(0.99), 'max': values[-1]})
+    return stats
+
+
+def _params_shape(params: Any) -> str:
+    if not params:
+        return ''
+    if isinstance(params, dict):
+        params = list(params.values())
+    if isinstance(params[0], (list, tuple)):
+        return f"{len(params)} x ({', '.join(type(v).__name__ for v in params[0])})"
+    return f"({', '.join(type(v).__name__ for v in params)})"
+
+
+def _record(event: QueryEvent, conn: Optional[MySQLConnection] = None, params: Any = None) -> None:
+    if not event.cached:
+        with _timings_lock:
+            samples = _timings.get((event.function, event.table))
+            if samples is None:
+                samples = _timings[(event.function, event.table)] = deque(maxlen=2048)
+            samples.append(event.wall_time)
+        if event.wall_time >= SLOW_QUERY_SECONDS and event.sql:
+            if EXPLAIN_SLOW_QUERIES and conn is not None and not event.error:
+                event.explain = _explain(conn, event.sql, params)
+            slow_log.warning('slow query %.1f ms in %s(%s), %d rows: %s%s',
+                             event.wall_time * 1000, event.function, event.table or '', event.rows,
+                             ' '.join(event.sql.split()), f'\n  plan: {event.explain}' if event.explain else '')
+    captured = _capture.get()
+    if captured is not None:
+        captured.append(event)
+    for hook in list(_query_hooks):
+        try:
+            hook(event)
+        except Exception:
+            logging.getLogger(__name__).exception('query hook failed')
+
+
+def _explain(conn: MySQLConnection, sql: str, params: Any) -> Optional[List[Tuple]]:
+    """EXPLAIN a SELECT on the same connection, or None if that is not safe."""
+    if not sql.lstrip().upper().startswith('SELECT') or conn.unread_result:
+        return None
+    cur = conn.cursor()
+    try:
+        cur.execute('EXPLAIN ' + sql, params or ())
+        return cur.fetchall()
+    except Error:
+        return None
+    finally:
+        cur.close()
+
+
+@contextmanager
+def _track(conn: Optional[MySQLConnection], function: str, table: Optional[str], sql: str,
+           params: Any = None) -> Iterator[QueryEvent]:
+    """Time a statement and record it as a QueryEvent once it finishes."""
+    event = QueryEvent(function, table, sql, _params_shape(params), params=params)
+    started = time.perf_counter()
+    try:
+        yield event
+    except Exception as e:
+        event.error = str(e)
+        raise
+    finally:
+        event.wall_time = time.perf_counter() - started
+        _record(event, conn, params)
+
+
+def _fetch(conn: MySQLConnection, cur, function: str, table: Optional[str], sql: str,
+           params: Any = None) -> List[Tuple]:
+    """Execute ``sql`` on ``cur`` and return all rows, recording a QueryEvent."""
+    with _track(conn, function, table, sql, params) as event:
+        cur.execute(sql, params or ())
+        rows = cur.fetchall()
+        event.result(rows)
+    return rows
 
 
 def list_tables(conn: MySQLConnection) -> List[str]:
     cur = conn.cursor()
-    cur.execute('SHOW TABLES')
-    rows = [r[0] for r in cur.fetchall()]
+    rows = [r[0] for r in _fetch(conn, cur, 'list_tables', None, 'SHOW TABLES')]
     cur.close()
     return rows
 
 
 def fetch_table(conn: MySQLConnection, table: str, limit: int = 200) -> Tuple[List[str], List[Tuple[Any]]]:
-    cur = conn.cursor()
-    cur.execute(f"SELECT * FROM `{table}` LIMIT {limit}")
-    cols = [d[0] for d in cur.description]
-    rows = cur.fetchall()
-    cur.close()
-    return cols, rows
+    def load():
+        cur = conn.cursor()
+        rows = _fetch(conn, cur, 'fetch_table', table, f"SELECT * FROM `{table}` LIMIT {int(limit)}")
+        cols = [d[0] for d in cur.description]
+        cur.close()
+        return cols, rows
+    return _cached_read(conn, [table], ('fetch_table', table, limit), load)
 
 
 def describe_table(conn: MySQLConnection, table: str) -> List[Tuple[str, str]]:
-    cur = conn.cursor()
-    cur.execute(f"DESCRIBE `{table}`")
-    rows = cur.fetchall()
-    cur.close()
-    return rows
+    def load():
+        cur = conn.cursor()
+        rows = _fetch(conn, cur, 'describe_table', table, f"DESCRIBE `{table}`")
+        cur.close()
+        return rows
+    return _cached_read(conn, [table], ('describe_table', table), load)
+
+
+def count_rows(conn: MySQLConnection, table: str, exact: bool = False,
+               filters: Optional[Iterable[Tuple]] = None) -> int:
+    """Row count of a table.
+
+    By default this is InnoDB's estimate from INFORMATION_SCHEMA.TABLES,
+    which costs nothing however large the table is; ``exact=True`` runs
+    COUNT(*), a full index scan. With ``filters`` (see where_clause) the
+    matching rows are always counted exactly.
+    """
+    filters = normalize_filters(filters)
+    exact = exact or bool(filters)
+
+    def load():
+        cur = conn.cursor()
+        try:
+            if filters:
+                clause, params = where_clause(conn, table, filters)
+                rows = _fetch(conn, cur, 'count_rows', table, f"SELECT COUNT(*) FROM `{table}` WHERE {clause}", params)
+            elif exact:
+                rows = _fetch(conn, cur, 'count_rows', table, f"SELECT COUNT(*) FROM `{table}`")
+            else:
+                rows = _fetch(conn, cur, 'count_rows', table, """
+                    SELECT TABLE_ROWS FROM INFORMATION_SCHEMA.TABLES
+                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s""", (table,))
+        finally:
+            cur.close()
+        return int(rows[0][0] or 0) if rows else 0
+    return _cached_read(conn, [table], ('count_rows', table, exact, filters), load)
 
 
 def get_procedure_info(conn: MySQLConnection, routine_name: str, schema: Optional[str] = None, routine_type: str = 'PROCEDURE') -> Tuple[List[Tuple[str, str, str]], str]:
@@ -63,7 +540,7 @@ def get_procedure_info(conn: MySQLConnection, routine_name: str, schema: Optiona
     try:
         # Get routine parameters
         if schema:
-            cur.execute("""
+            params = _fetch(conn, cur, 'get_procedure_info', routine_name, """
                 SELECT PARAMETER_NAME, PARAMETER_MODE, DTD_IDENTIFIER 
                 FROM INFORMATION_SCHEMA.PARAMETERS 
                 WHERE SPECIFIC_NAME=%s AND SPECIFIC_SCHEMA=%s AND ROUTINE_TYPE=%s
@@ -71,29 +548,28 @@ def get_procedure_info(conn: MySQLConnection, routine_name: str, schema: Optiona
                 ORDER BY ORDINAL_POSITION""", 
                 (routine_name, schema, routine_type))
         else:
-            cur.execute("""
+            params = _fetch(conn, cur, 'get_procedure_info', routine_name, """
                 SELECT PARAMETER_NAME, PARAMETER_MODE, DTD_IDENTIFIER 
                 FROM INFORMATION_SCHEMA.PARAMETERS 
                 WHERE SPECIFIC_NAME=%s AND ROUTINE_TYPE=%s
                   AND (PARAMETER_MODE IS NOT NULL OR ROUTINE_TYPE = 'PROCEDURE')  -- Skip return parameter for functions
                 ORDER BY ORDINAL_POSITION""", 
                 (routine_name, routine_type))
-        params = cur.fetchall()
         
         # Get routine definition/comments
         if schema:
-            cur.execute("""
+            info_rows = _fetch(conn, cur, 'get_procedure_info', routine_name, """
                 SELECT ROUTINE_DEFINITION, ROUTINE_COMMENT
                 FROM INFORMATION_SCHEMA.ROUTINES
                 WHERE ROUTINE_NAME=%s AND ROUTINE_SCHEMA=%s AND ROUTINE_TYPE=%s""",
                 (routine_name, schema, routine_type))
         else:
-            cur.execute("""
+            info_rows = _fetch(conn, cur, 'get_procedure_info', routine_name, """
                 SELECT ROUTINE_DEFINITION, ROUTINE_COMMENT
                 FROM INFORMATION_SCHEMA.ROUTINES
                 WHERE ROUTINE_NAME=%s AND ROUTINE_TYPE=%s""",
                 (routine_name, routine_type))
-        routine_info = cur.fetchone()
+        routine_info = info_rows[0] if info_rows else None
         routine_definition = routine_info[0] if routine_info else ""
         routine_comment = routine_info[1] if routine_info else ""
         
@@ -112,16 +588,16 @@ def list_routines(conn: MySQLConnection, routine_type: str = 'PROCEDURE', schema
     """
     cur = conn.cursor()
     if schema:
-        cur.execute(
+        rows = _fetch(conn, cur, 'list_routines', None,
             "SELECT ROUTINE_NAME FROM INFORMATION_SCHEMA.ROUTINES WHERE ROUTINE_TYPE=%s AND ROUTINE_SCHEMA=%s",
             (routine_type, schema)
         )
     else:
-        cur.execute(
+        rows = _fetch(conn, cur, 'list_routines', None,
             "SELECT ROUTINE_NAME FROM INFORMATION_SCHEMA.ROUTINES WHERE ROUTINE_TYPE=%s",
             (routine_type,)
         )
-    rows = [r[0] for r in cur.fetchall()]
+    rows = [r[0] for r in rows]
     cur.close()
     return rows
 
@@ -130,119 +606,2275 @@ def list_procedures(conn: MySQLConnection, schema: Optional[str] = None) -> List
     return list_routines(conn, 'PROCEDURE', schema)
 
 
-def call_routine(conn: MySQLConnection, name: str, args: List[Any] = None, routine_type: str = 'PROCEDURE') -> List[Any]:
-    """Call a stored procedure or function.
-    
-    Args:
-        conn: Database connection
-        name: Name of the procedure/function
-        args: List of arguments
-        routine_type: 'PROCEDURE' or 'FUNCTION'
-    Returns:
-        For procedures: List of result sets
-        For functions: Single result (the function return value)
+_identities: 'weakref.WeakKeyDictionary' = weakref.WeakKeyDictionary()
+_configs: 'weakref.WeakKeyDictionary' = weakref.WeakKeyDictionary()
+
+
+def connection_identity(conn: MySQLConnection) -> Tuple[str, int, Optional[str]]:
+    """Return (host, port, default schema) for a connection.
+
+    The schema is looked up once per connection and remembered, so callers
+    can key caches by it without a round trip.
     """
-    cur = conn.cursor()
-    args = args or []
-    try:
-        if routine_type == 'FUNCTION':
-            # For functions, we need to use SELECT func_name(args)
-            placeholders = ', '.join(['%s'] * len(args))
-            query = f"SELECT {name}({placeholders})"
-            cur.execute(query, args)
-            result = cur.fetchone()
-            return [[(result[0],)]] if result else []
-        else:
-            # For procedures, use callproc
-            cur.callproc(name, args)
-            results = []
-            # collect result sets
-            for result in cur.stored_results():
-                results.append(result.fetchall())
-            return results
-    finally:
-        cur.close()
+    ident = _identities.get(conn)
+    if ident is None:
+        cur = conn.cursor()
+        try:
+            schema = _fetch(conn, cur, 'connection_identity', None, 'SELECT DATABASE()')[0][0]
+        finally:
+            cur.close()
+        ident = _identities[conn] = (conn.server_host, conn.server_port, schema)
+    return ident
 
-def call_procedure(conn: MySQLConnection, name: str, args: Optional[List[Any]] = None) -> List[Any]:
-    """Legacy wrapper for call_routine with PROCEDURE type."""
-    return call_routine(conn, name, args, 'PROCEDURE')
 
-def insert_record(conn: MySQLConnection, table: str, data: dict) -> int:
-    """Insert a record into a table.
-    Args:
-        conn: Database connection
-        table: Table name
-        data: Dictionary of column_name: value pairs
-    Returns:
-        The ID of the inserted record
+@dataclass
+class SchemaMetadata:
+    """In-memory snapshot of one schema's tables, columns and routines.
+
+    ``columns`` holds rows shaped like ``DESCRIBE`` output
+    (Field, Type, Null, Key, Default, Extra) so it can stand in for
+    describe_table.
     """
-    columns = ', '.join(f"`{col}`" for col in data.keys())
-    placeholders = ', '.join(['%s'] * len(data))
-    query = f"INSERT INTO `{table}` ({columns}) VALUES ({placeholders})"
-    
+    schema: str
+    tables: List[str] = field(default_factory=list)
+    columns: Dict[str, List[Tuple]] = field(default_factory=dict)
+    primary_keys: Dict[str, List[str]] = field(default_factory=dict)
+    routines: Dict[str, List[str]] = field(default_factory=dict)
+    parameters: Dict[Tuple[str, str], List[Tuple[str, str, str]]] = field(default_factory=dict)
+    descriptions: Dict[Tuple[str, str], str] = field(default_factory=dict)
+    definitions: Dict[Tuple[str, str], str] = field(default_factory=dict)
+    # child table -> [(column, parent table, parent column, update rule, delete rule)]
+    foreign_keys: Dict[str, List[Tuple[str, str, str, str, str]]] = field(default_factory=dict)
+    # table -> tables written by its triggers
+    trigger_writes: Dict[str, Set[str]] = field(default_factory=dict)
+    checksum: str = ''
+    loaded_at: float = field(default_factory=time.monotonic)
+
+    def describe(self, table: str) -> List[Tuple]:
+        return self.columns[table]
+
+    def primary_key(self, table: str) -> List[str]:
+        """Primary key columns in key order (empty if the table has none)."""
+        return self.primary_keys.get(table, [])
+
+    def routine_names(self, routine_type: str = 'PROCEDURE') -> List[str]:
+        return self.routines.get(routine_type, [])
+
+    def procedure_info(self, routine_name: str, routine_type: str = 'PROCEDURE') -> Tuple[List[Tuple[str, str, str]], str]:
+        """Same result as get_procedure_info, served from memory."""
+        key = (routine_type, routine_name)
+        return self.parameters.get(key, []), self.descriptions.get(key, '')
+
+    def affected_tables(self, table: str) -> Set[str]:
+        """Tables whose contents can change when ``table`` is written.
+
+        Follows foreign keys with CASCADE/SET NULL/SET DEFAULT actions from
+        parent to child and the tables written by triggers, transitively.
+        """
+        children: Dict[str, Set[str]] = {}
+        for child, fks in self.foreign_keys.items():
+            for _, parent, _, update_rule, delete_rule in fks:
+                if update_rule not in _INERT_FK_RULES or delete_rule not in _INERT_FK_RULES:
+                    children.setdefault(parent, set()).add(child)
+        affected = {table}
+        pending = [table]
+        while pending:
+            current = pending.pop()
+            for nxt in children.get(current, set()) | self.trigger_writes.get(current, set()):
+                if nxt not in affected:
+                    affected.add(nxt)
+                    pending.append(nxt)
+        return affected
+
+    def routine_writes(self, routine_name: str, routine_type: str = 'PROCEDURE') -> Set[str]:
+        """Tables a routine may write, including trigger and FK fallout.
+
+        Every table named in a body that contains INSERT/UPDATE/DELETE counts.
+        If the body is not visible (missing privileges) all tables are assumed.
+        """
+        definition = self.definitions.get((routine_type, routine_name))
+        if not definition:
+            return set(self.tables)
+        affected = set()
+        for table in _written_tables(definition, self.tables):
+            affected |= self.affected_tables(table)
+        return affected
+
+
+_INERT_FK_RULES = {'RESTRICT', 'NO ACTION'}
+_WRITE_STATEMENT = re.compile(r'\b(INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+
+
+def _written_tables(body: str, tables: Iterable[str]) -> Set[str]:
+    """Conservatively list the tables a routine or trigger body may write."""
+    if not _WRITE_STATEMENT.search(body):
+        return set()
+    return {t for t in tables if re.search(rf'\b{re.escape(t)}\b', body, re.IGNORECASE)}
+
+
+def load_schema_metadata(conn: MySQLConnection, schema: str) -> SchemaMetadata:
+    """Read all table, key, trigger and routine metadata for a schema in bulk."""
+    meta = SchemaMetadata(schema)
     cur = conn.cursor()
     try:
-        cur.execute(query, list(data.values()))
-        conn.commit()
-        return cur.lastrowid
+        rows = _fetch(conn, cur, 'load_schema_metadata', None, """
+            SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE, COLUMN_KEY, COLUMN_DEFAULT, EXTRA
+            FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_SCHEMA=%s
+            ORDER BY TABLE_NAME, ORDINAL_POSITION""", (schema,))
+        for table, *column in rows:
+            if table not in meta.columns:
+                meta.tables.append(table)
+                meta.columns[table] = []
+            meta.columns[table].append(tuple(column))
+
+        rows = _fetch(conn, cur, 'load_schema_metadata', None, """
+            SELECT TABLE_NAME, COLUMN_NAME
+            FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE
+            WHERE TABLE_SCHEMA=%s AND CONSTRAINT_NAME='PRIMARY'
+            ORDER BY TABLE_NAME, ORDINAL_POSITION""", (schema,))
+        for table, column in rows:
+            meta.primary_keys.setdefault(table, []).append(column)
+
+        rows = _fetch(conn, cur, 'load_schema_metadata', None, """
+            SELECT ROUTINE_NAME, ROUTINE_TYPE, ROUTINE_DEFINITION, ROUTINE_COMMENT
+            FROM INFORMATION_SCHEMA.ROUTINES
+            WHERE ROUTINE_SCHEMA=%s
+            ORDER BY ROUTINE_NAME""", (schema,))
+        for name, routine_type, definition, comment in rows:
+            meta.routines.setdefault(routine_type, []).append(name)
+            meta.descriptions[(routine_type, name)] = comment or definition or ''
+            meta.definitions[(routine_type, name)] = definition or ''
+
+        rows = _fetch(conn, cur, 'load_schema_metadata', None, """
+            SELECT SPECIFIC_NAME, ROUTINE_TYPE, PARAMETER_NAME, PARAMETER_MODE, DTD_IDENTIFIER
+            FROM INFORMATION_SCHEMA.PARAMETERS
+            WHERE SPECIFIC_SCHEMA=%s
+              AND (PARAMETER_MODE IS NOT NULL OR ROUTINE_TYPE = 'PROCEDURE')  -- Skip return parameter for functions
+            ORDER BY SPECIFIC_NAME, ORDINAL_POSITION""", (schema,))
+        for name, routine_type, param_name, param_mode, param_type in rows:
+            meta.parameters.setdefault((routine_type, name), []).append((param_name, param_mode, param_type))
+
+        rows = _fetch(conn, cur, 'load_schema_metadata', None, """
+            SELECT k.TABLE_NAME, k.COLUMN_NAME, k.REFERENCED_TABLE_NAME, k.REFERENCED_COLUMN_NAME,
+                   r.UPDATE_RULE, r.DELETE_RULE
+            FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE k
+            JOIN INFORMATION_SCHEMA.REFERENTIAL_CONSTRAINTS r
+              ON r.CONSTRAINT_SCHEMA = k.CONSTRAINT_SCHEMA AND r.CONSTRAINT_NAME = k.CONSTRAINT_NAME
+             AND r.TABLE_NAME = k.TABLE_NAME
+            WHERE k.TABLE_SCHEMA=%s AND k.REFERENCED_TABLE_NAME IS NOT NULL
+            ORDER BY k.TABLE_NAME, k.CONSTRAINT_NAME, k.ORDINAL_POSITION""", (schema,))
+        for table, column, parent, parent_column, update_rule, delete_rule in rows:
+            meta.foreign_keys.setdefault(table, []).append((column, parent, parent_column, update_rule, delete_rule))
+
+        rows = _fetch(conn, cur, 'load_schema_metadata', None, """
+            SELECT EVENT_OBJECT_TABLE, ACTION_STATEMENT
+            FROM INFORMATION_SCHEMA.TRIGGERS
+            WHERE TRIGGER_SCHEMA=%s""", (schema,))
+        for table, statement in rows:
+            written = _written_tables(statement or '', meta.tables) - {table}
+            if written:
+                meta.trigger_writes.setdefault(table, set()).update(written)
     finally:
         cur.close()
+    return meta
 
-def update_record(conn: MySQLConnection, table: str, data: dict, where: dict) -> int:
-    """Update records in a table.
-    Args:
-        conn: Database connection
-        table: Table name
-        data: Dictionary of column_name: new_value pairs
-        where: Dictionary of column_name: value pairs for WHERE clause
-    Returns:
-        Number of rows affected
+
+def schema_checksum(conn: MySQLConnection, schema: str) -> str:
+    """A cheap fingerprint of a schema's tables, columns, keys, routines and triggers.
+
+    One single-row query over the data dictionary; any DDL that would change
+    load_schema_metadata's result changes the checksum.
     """
-    set_clause = ', '.join(f"`{col}` = %s" for col in data.keys())
-    where_clause = ' AND '.join(f"`{col}` = %s" for col in where.keys())
-    query = f"UPDATE `{table}` SET {set_clause} WHERE {where_clause}"
-    
     cur = conn.cursor()
     try:
-        cur.execute(query, list(data.values()) + list(where.values()))
-        conn.commit()
-        return cur.rowcount
+        row = _fetch(conn, cur, 'schema_checksum', None, """
+            SELECT
+              (SELECT CONCAT(COUNT(*), ':', COALESCE(SUM(CRC32(CONCAT_WS('|', TABLE_NAME, COLUMN_NAME,
+                      ORDINAL_POSITION, COLUMN_TYPE, IS_NULLABLE, COLUMN_KEY, COLUMN_DEFAULT, EXTRA))), 0))
+               FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA=%s),
+              (SELECT CONCAT(COUNT(*), ':', COALESCE(SUM(CRC32(CONCAT_WS('|', CONSTRAINT_NAME, TABLE_NAME,
+                      UPDATE_RULE, DELETE_RULE))), 0))
+               FROM INFORMATION_SCHEMA.REFERENTIAL_CONSTRAINTS WHERE CONSTRAINT_SCHEMA=%s),
+              (SELECT CONCAT(COUNT(*), ':', COALESCE(MAX(LAST_ALTERED), ''), ':',
+                      COALESCE(SUM(CRC32(CONCAT_WS('|', ROUTINE_NAME, CREATED))), 0))
+               FROM INFORMATION_SCHEMA.ROUTINES WHERE ROUTINE_SCHEMA=%s),
+              (SELECT CONCAT(COUNT(*), ':', COALESCE(SUM(CRC32(CONCAT_WS('|', TRIGGER_NAME, CREATED))), 0))
+               FROM INFORMATION_SCHEMA.TRIGGERS WHERE TRIGGER_SCHEMA=%s)""", (schema,) * 4)[0]
     finally:
         cur.close()
+    return '/'.join(str(part) for part in row)
 
-def delete_record(conn: MySQLConnection, table: str, where: dict) -> int:
-    """Delete records from a table.
-    Args:
-        conn: Database connection
-        table: Table name
-        where: Dictionary of column_name: value pairs for WHERE clause
-    Returns:
-        Number of rows affected
+
+def _text(value: Any) -> Any:
+    # Some server/connector combinations return INFORMATION_SCHEMA text as bytes
+    return value.decode() if isinstance(value, (bytes, bytearray)) else value
+
+
+def _metadata_to_json(meta: SchemaMetadata) -> dict:
+    return {
+        'schema': meta.schema,
+        'checksum': meta.checksum,
+        'tables': meta.tables,
+        'columns': {t: [[_text(v) for v in row] for row in rows] for t, rows in meta.columns.items()},
+        'primary_keys': meta.primary_keys,
+        'routines': meta.routines,
+        'parameters': [[t, n, [[_text(v) for v in p] for p in params]] for (t, n), params in meta.parameters.items()],
+        'descriptions': [[t, n, _text(d)] for (t, n), d in meta.descriptions.items()],
+        'definitions': [[t, n, _text(d)] for (t, n), d in meta.definitions.items()],
+        'foreign_keys': meta.foreign_keys,
+        'trigger_writes': {t: sorted(w) for t, w in meta.trigger_writes.items()},
+    }
+
+
+def _metadata_from_json(data: dict) -> SchemaMetadata:
+    return SchemaMetadata(
+        schema=data['schema'],
+        checksum=data['checksum'],
+        tables=data['tables'],
+        columns={t: [tuple(row) for row in rows] for t, rows in data['columns'].items()},
+        primary_keys=data['primary_keys'],
+        routines=data['routines'],
+        parameters={(t, n): [tuple(p) for p in params] for t, n, params in data['parameters']},
+        descriptions={(t, n): d for t, n, d in data['descriptions']},
+        definitions={(t, n): d for t, n, d in data['definitions']},
+        foreign_keys={t: [tuple(fk) for fk in fks] for t, fks in data['foreign_keys'].items()},
+        trigger_writes={t: set(w) for t, w in data['trigger_writes'].items()},
+    )
+
+
+class SchemaCache:
+    """TTL cache of SchemaMetadata keyed by server and schema.
+
+    Entries are loaded in bulk on first use and reused until they are older
+    than ``ttl`` seconds or invalidated, e.g. after DDL. An expired entry is
+    only reloaded if schema_checksum has changed.
+
+    With a ``snapshot_dir``, loaded metadata is also saved there as JSON. A
+    process that has nothing in memory yet serves the snapshot without any
+    metadata queries and checks its checksum in the background, replacing
+    the snapshot (and the cached entry) when the schema has changed.
     """
-    where_clause = ' AND '.join(f"`{col}` = %s" for col in where.keys())
-    query = f"DELETE FROM `{table}` WHERE {where_clause}"
-    
-    cur = conn.cursor()
-    try:
-        cur.execute(query, list(where.values()))
-        conn.commit()
-        return cur.rowcount
-    finally:
-        cur.close()
 
-def get_record_by_id(conn: MySQLConnection, table: str, id_column: str, id_value: Any) -> Optional[Tuple]:
-    """Get a single record by its ID.
-    Args:
-        conn: Database connection
-        table: Table name
-        id_column: Name of the ID column
-        id_value: Value of the ID to look up
-    Returns:
-        Record tuple or None if not found
+    SNAPSHOT_VERSION = 1
+
+    def __init__(self, ttl: float = 300.0, snapshot_dir: Optional[str] = None):
+        self.ttl = ttl
+        self.snapshot_dir = snapshot_dir
+        self._entries: Dict[Tuple[str, int, str], SchemaMetadata] = {}
+        self._refreshing: Set[Tuple[str, int, str]] = set()
+        self._lock = threading.Lock()
+
+    def _key(self, conn: MySQLConnection, schema: Optional[str]) -> Tuple[str, int, str]:
+        host, port, default_schema = connection_identity(conn)
+        return host, port, schema or default_schema or ''
+
+    def get(self, conn: MySQLConnection, schema: Optional[str] = None) -> SchemaMetadata:
+        key = self._key(conn, schema)
+        with self._lock:
+            meta = self._entries.get(key)
+        if meta is not None and time.monotonic() - meta.loaded_at < self.ttl:
+            return meta
+        if meta is None:
+            meta = self._read_snapshot(key)
+            if meta is not None:
+                with self._lock:
+                    self._entries.setdefault(key, meta)
+                self._refresh_in_background(conn, key, meta.checksum)
+                return meta
+        checksum = schema_checksum(conn, key[2])
+        if meta is not None and meta.checksum == checksum:
+            meta.loaded_at = time.monotonic()
+            return meta
+        return self._load(conn, key, checksum)
+
+    def _load(self, conn: MySQLConnection, key: Tuple[str, int, str], checksum: str) -> SchemaMetadata:
+        # The checksum is taken before loading, so DDL that lands during the
+        # load shows up as a mismatch next time rather than being missed.
+        meta = load_schema_metadata(conn, key[2])
+        meta.checksum = checksum
+        with self._lock:
+            self._entries[key] = meta
+        self._write_snapshot(key, meta)
+        return meta
+
+    def _refresh_in_background(self, conn: MySQLConnection, key: Tuple[str, int, str], checksum: str) -> None:
+        config = _configs.get(conn)
+        with self._lock:
+            if config is None or key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                check_conn = get_connection(dict(config, database=key[2] or config.get('database')))
+                try:
+                    current = schema_checksum(check_conn, key[2])
+                    if current != checksum:
+                        self._load(check_conn, key, current)
+                finally:
+                    check_conn.close()
+            except Error as e:
+                logging.getLogger('db').warning('Schema snapshot refresh failed: %s', e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+        _get_executor().submit(refresh)
+
+    def _snapshot_path(self, key: Tuple[str, int, str]) -> Optional[str]:
+        if not self.snapshot_dir:
+            return None
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', '_'.join(str(part) for part in key))
+        return os.path.join(self.snapshot_dir, f'{name}.json')
+
+    def _read_snapshot(self, key: Tuple[str, int, str]) -> Optional[SchemaMetadata]:
+        path = self._snapshot_path(key)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            if data.get('version') != self.SNAPSHOT_VERSION:
+                return None
+            return _metadata_from_json(data['metadata'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write_snapshot(self, key: Tuple[str, int, str], meta: SchemaMetadata) -> None:
+        path = self._snapshot_path(key)
+        if not path:
+            return
+        try:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            # Write then rename, so a concurrent reader never sees half a file
+            tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({'version': self.SNAPSHOT_VERSION, 'saved_at': time.time(),
+                           'metadata': _metadata_to_json(meta)}, f, default=str)
+            os.replace(tmp, path)
+        except OSError as e:
+            logging.getLogger('db').warning('Could not write schema snapshot %s: %s', path, e)
+
+    def invalidate(self, conn: Optional[MySQLConnection] = None, schema: Optional[str] = None) -> None:
+        """Drop the entry (and snapshot) for a connection's schema, or everything if conn is None."""
+        with self._lock:
+            if conn is None:
+                keys = list(self._entries)
+                self._entries.clear()
+            else:
+                keys = [self._key(conn, schema)]
+                self._entries.pop(keys[0], None)
+        for key in keys:
+            path = self._snapshot_path(key)
+            if path and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+schema_cache = SchemaCache(
+    ttl=float(os.getenv('DB_SCHEMA_CACHE_TTL', '300')),
+    snapshot_dir=os.getenv('DB_SCHEMA_SNAPSHOT_DIR',
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), '.schema_snapshots')) or None,
+)
+
+
+def get_schema(conn: MySQLConnection, schema: Optional[str] = None) -> SchemaMetadata:
+    """Return cached metadata for a schema (the connection's default if None)."""
+    return schema_cache.get(conn, schema)
+
+
+def invalidate_schema(conn: Optional[MySQLConnection] = None, schema: Optional[str] = None) -> None:
+    """Forget cached metadata so the next lookup reloads it.
+
+    Cached query results are dropped as well, since DDL can change them.
     """
-    cur = conn.cursor()
-    try:
-        cur.execute(f"SELECT * FROM `{table}` WHERE `{id_column}` = %s", (id_value,))
-        return cur.fetchone()
-    finally:
-        cur.close()
+    schema_cache.invalidate(conn, schema)
+    result_cache.clear()
+
+
+def _estimate_size(value: Any, _sample: int = 64) -> int:
+    """Approximate deep size of a query result in bytes.
+
+    Long lists/tuples are sized from a sample of their items.
+    """
+    if isinstance(value, ColumnarResult):
+        return value.nbytes
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)) and value:
+        items = value if len(value) <= _sample else value[:_sample]
+        size += sum(_estimate_size(item, _sample) for item in items) * len(value) // len(items)
+    elif isinstance(value, dict):
+        size += sum(_estimate_size(k, _sample) + _estimate_size(v, _sample) for k, v in value.items())
+    elif hasattr(value, '__dataclass_fields__'):
+        size += sum(_estimate_size(getattr(value, name), _sample) for name in value.__dataclass_fields__)
+    return size
+
+
+class TableVersions:
+    """Per-table write counters, keyed by (host, port, schema, table)."""
+
+    def __init__(self):
+        self._versions: Dict[Tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self, ident: Tuple, tables: Iterable[str]) -> Tuple[int, ...]:
+        with self._lock:
+            return tuple(self._versions.get(ident + (t,), 0) for t in tables)
+
+    def bump(self, ident: Tuple, tables: Iterable[str]) -> None:
+        with self._lock:
+            for t in tables:
+                key = ident + (t,)
+                self._versions[key] = self._versions.get(key, 0) + 1
+
+
+class ResultCache:
+    """LRU cache of read results bounded by entry count and memory.
+
+    Each entry remembers the versions of the tables it was read from and is
+    treated as a miss once any of them has been bumped by a write, or once
+    it is older than ``ttl`` (which bounds staleness from writes made by
+    other clients).
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_entries: int = 2048, ttl: float = 60.0):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: 'OrderedDict[tuple, Tuple[Any, Tuple[int, ...], int, float]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0, 'evictions': 0}
+
+    def get(self, key: tuple, versions: Tuple[int, ...]) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_versions, _, stored_at = entry
+                if stored_versions == versions and time.monotonic() - stored_at < self.ttl:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return True, value
+                self._drop(key)
+                self._stats['stale'] += 1
+            self._stats['misses'] += 1
+            return False, None
+
+    def put(self, key: tuple, versions: Tuple[int, ...], value: Any) -> None:
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, versions, size, time.monotonic())
+            self._bytes += size
+            while self._entries and (self._bytes > self.max_bytes or len(self._entries) > self.max_entries):
+                self._drop(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats['hits'] + stats['misses']
+            stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+            stats['max_bytes'] = self.max_bytes
+            return stats
+
+    def _drop(self, key: tuple) -> None:
+        # Caller holds self._lock.
+        self._bytes -= self._entries.pop(key)[2]
+
+
+table_versions = TableVersions()
+result_cache = ResultCache(
+    max_bytes=int(os.getenv('DB_RESULT_CACHE_MB', '64')) * 1024 * 1024,
+    ttl=float(os.getenv('DB_RESULT_CACHE_TTL', '60')),
+)
+
+
+def _cached_read(conn: MySQLConnection, tables: List[str], key: tuple, load):
+    """Serve ``load()`` from result_cache while none of ``tables`` was written."""
+    if conn in _transactions:
+        # Uncommitted writes may be visible here; neither serve nor share them.
+        return load()
+    ident = connection_identity(conn)
+    # Take the versions before reading so a write racing the read marks it stale.
+    versions = table_versions.snapshot(ident, tables)
+    started = time.perf_counter()
+    hit, value = result_cache.get(ident + key, versions)
+    if hit:
+        event = QueryEvent(key[0], key[1], '', cached=True)
+        if key[0] in ('fetch_table', 'fetch_date_range'):
+            rows = value[1]
+        elif key[0] == 'get_record_by_id':
+            # One record tuple (or None), not a list of rows
+            rows = [value] if value is not None else []
+        else:
+            rows = getattr(value, 'rows', value)
+        event.result(rows)
+        event.wall_time = time.perf_counter() - started
+        _record(event)
+        return value
+    value = load()
+    result_cache.put(ident + key, versions, value)
+    return value
+
+
+@dataclass
+class WriteEvent:
+    """A committed write made through this module, as passed to write listeners.
+
+    ``rows`` holds the values that identify the written rows: inserted rows
+    (with their AUTO_INCREMENT key filled in), update keys followed by the
+    same keys merged with the new values, or delete keys. It is None when
+    the rows are unknown, e.g. after a procedure call. ``tables`` is every
+    table the write may have changed through FK actions and triggers.
+    """
+    table: str
+    operation: str
+    rows: Optional[List[dict]]
+    tables: Set[str]
+
+
+_write_listeners: List[Callable[[MySQLConnection, WriteEvent], None]] = []
+
+
+def add_write_listener(listener: Callable[[MySQLConnection, WriteEvent], None]) -> None:
+    """Call ``listener(conn, event)`` after every committed write made through this module.
+
+    Writes inside transaction() are reported once the block commits, and
+    not at all if it rolls back.
+    """
+    _write_listeners.append(listener)
+
+
+def remove_write_listener(listener: Callable[[MySQLConnection, WriteEvent], None]) -> None:
+    _write_listeners.remove(listener)
+
+
+def note_write(conn: MySQLConnection, table: str, operation: str = 'write',
+               rows: Optional[List[dict]] = None) -> None:
+    """Record a write to ``table`` and everything its FKs and triggers touch.
+
+    Inside transaction() the cache and the write listeners are only told
+    once the block commits.
+    """
+    tables = get_schema(conn).affected_tables(table)
+    _bump_versions(conn, tables)
+    if _write_listeners:
+        _notify_write(conn, [WriteEvent(table, operation, rows, tables)])
+
+
+def _note_routine_call(conn: MySQLConnection, name: str, routine_type: str) -> None:
+    tables = get_schema(conn).routine_writes(name, routine_type)
+    _bump_versions(conn, tables)
+    if _write_listeners:
+        _notify_write(conn, [WriteEvent(table, 'call', None, {table}) for table in sorted(tables)])
+
+
+def _notify_write(conn: MySQLConnection, events: List[WriteEvent]) -> None:
+    state = _transactions.get(conn)
+    if state is not None:
+        state.events.extend(events)
+        return
+    for event in events:
+        for listener in list(_write_listeners):
+            try:
+                listener(conn, event)
+            except Exception:
+                logging.getLogger(__name__).exception('write listener failed')
+
+
+def _bump_versions(conn: MySQLConnection, tables: Set[str]) -> None:
+    state = _transactions.get(conn)
+    if state is not None:
+        state.written |= tables
+    else:
+        table_versions.bump(connection_identity(conn), tables)
+
+
+@dataclass
+class _TransactionState:
+    depth: int = 0
+    written: Set[str] = field(default_factory=set)
+    events: List[WriteEvent] = field(default_factory=list)
+
+
+_transactions: 'weakref.WeakKeyDictionary[MySQLConnection, _TransactionState]' = weakref.WeakKeyDictionary()
+
+
+@contextmanager
+def transaction(conn: MySQLConnection) -> Iterator[MySQLConnection]:
+    """Group writes into one atomic unit of work.
+
+    The outermost block starts a transaction and commits it once on success
+    or rolls it back on error; the write helpers called inside it skip their
+    own commits. Nested blocks become savepoints, so an inner failure can be
+    caught and rolled back without losing the outer work::
+
+        with transaction(conn):
+            student_id = insert_record(conn, 'student', {...})
+            insert_record(conn, 'fees', {..., 'student_id': student_id})
+    """
+    state = _transactions.get(conn)
+    if state is not None:
+        state.depth += 1
+        name = f'sp_{state.depth}'
+        pending = len(state.events)
+        cur = conn.cursor()
+        try:
+            cur.execute(f'SAVEPOINT {name}')
+            try:
+                yield conn
+            except BaseException:
+                cur.execute(f'ROLLBACK TO SAVEPOINT {name}')
+                del state.events[pending:]
+                raise
+            cur.execute(f'RELEASE SAVEPOINT {name}')
+        finally:
+            cur.close()
+            state.depth -= 1
+        return
+
+    if conn.in_transaction:
+        # Close the implicit transaction a non-autocommit connection keeps open.
+        conn.commit()
+    conn.start_transaction()
+    state = _transactions[conn] = _TransactionState()
+    try:
+        yield conn
+    except BaseException:
+        del _transactions[conn]
+        conn.rollback()
+        raise
+    del _transactions[conn]
+    conn.commit()
+    table_versions.bump(connection_identity(conn), state.written)
+    if state.events:
+        _notify_write(conn, state.events)
+
+
+def _commit(conn: MySQLConnection) -> None:
+    """Commit a helper's write unless an enclosing transaction() owns it."""
+    if conn not in _transactions:
+        conn.commit()
+
+
+MAX_PREPARED_PER_CONNECTION = int(os.getenv('DB_PREPARED_CACHE_SIZE', '64'))
+
+# connection -> OrderedDict(sql -> (sql, prepared cursor)), least recently used first
+_statements: 'weakref.WeakKeyDictionary[MySQLConnection, OrderedDict]' = weakref.WeakKeyDictionary()
+
+
+def _prepared(conn: MySQLConnection, sql: str):
+    """Return (sql, cursor) for a server-side prepared statement on conn.
+
+    Each SQL template gets its own ``cursor(prepared=True)`` that is kept in
+    a per-connection LRU, so repeated calls skip the parse/prepare step.
+    The cursor only reuses its statement when it is given the very same
+    string object, which is why the cached ``sql`` is returned as well.
+    """
+    cache = _statements.get(conn)
+    if cache is None:
+        cache = _statements[conn] = OrderedDict()
+    entry = cache.get(sql)
+    if entry is not None:
+        cache.move_to_end(sql)
+        return entry
+    entry = cache[sql] = (sql, conn.cursor(prepared=True))
+    while len(cache) > MAX_PREPARED_PER_CONNECTION:
+        _, (_, old) = cache.popitem(last=False)
+        old.close()
+    return entry
+
+
+def close_statements(conn: MySQLConnection) -> None:
+    """Deallocate the prepared statements cached for a connection."""
+    cache = _statements.pop(conn, None)
+    if cache:
+        for _, cur in cache.values():
+            try:
+                cur.close()
+            except Exception:
+                pass
+
+
+# Column kinds by the leading word of a DESCRIBE type, e.g. "decimal(10,2) unsigned"
+_COLUMN_KINDS = {
+    'tinyint': 'int', 'smallint': 'int', 'mediumint': 'int', 'int': 'int', 'integer': 'int',
+    'bigint': 'int', 'year': 'int', 'bit': 'int',
+    'decimal': 'decimal', 'numeric': 'decimal', 'float': 'float', 'double': 'float', 'real': 'float',
+    'date': 'date', 'datetime': 'datetime', 'timestamp': 'datetime', 'time': 'time',
+    'char': 'text', 'varchar': 'text', 'tinytext': 'text', 'text': 'text', 'mediumtext': 'text',
+    'longtext': 'text', 'enum': 'text', 'set': 'text',
+}
+_ORDERED_KINDS = {'int', 'decimal', 'float', 'date', 'datetime', 'time'}
+
+# Filter operator -> SQL comparison
+_COMPARISONS = {'eq': '=', 'ne': '<>', 'lt': '<', 'le': '<=', 'gt': '>', 'ge': '>='}
+_RANGE_OPS = {'lt', 'le', 'gt', 'ge', 'between'}
+FILTER_OPS = set(_COMPARISONS) | {'between', 'in', 'prefix', 'is_null', 'not_null'}
+
+
+def column_kind(column_type: str) -> str:
+    """Classify a DESCRIBE column type as int, decimal, float, date,
+    datetime, time, text or other."""
+    base = re.match(r'[a-z]+', (column_type or '').lower())
+    return _COLUMN_KINDS.get(base.group(0), 'other') if base else 'other'
+
+
+def _coerce(kind: str, value: Any) -> Any:
+    """Convert a filter value (often a string from a form) to the column's type."""
+    if value is None or not isinstance(value, str):
+        return value
+    value = value.strip()
+    if kind == 'int':
+        return int(value)
+    if kind == 'decimal':
+        return Decimal(value)
+    if kind == 'float':
+        return float(value)
+    if kind == 'date':
+        return datetime.date.fromisoformat(value)
+    if kind == 'datetime':
+        return datetime.datetime.fromisoformat(value)
+    return value
+
+
+def _like_prefix(value: str) -> str:
+    """LIKE pattern matching strings that start with ``value`` literally."""
+    return re.sub(r'([\\%_])', r'\\\1', value) + '%'
+
+
+def normalize_filters(filters: Optional[Iterable[Tuple]]) -> Tuple[Tuple, ...]:
+    """Filters as a hashable tuple of (column, op, value), usable in cache keys."""
+    normalized = []
+    for column, op, *value in filters or ():
+        value = value[0] if value else None
+        if isinstance(value, (list, set, frozenset)):
+            value = tuple(value)
+        normalized.append((column, op, value))
+    return tuple(normalized)
+
+
+def where_clause(conn: MySQLConnection, table: str, filters: Iterable[Tuple]) -> Tuple[str, List[Any]]:
+    """Build a parameterised WHERE condition from column filters.
+
+    Each filter is ``(column, op, value)``; all filters must match. Columns
+    and operators are checked against the table's DESCRIBE metadata and
+    values are converted to the column's type, so string input from a form
+    can be passed straight through. Operators:
+
+        eq, ne, lt, le, gt, ge   compare with value
+        between                  value is (low, high); either end may be None
+        in                       value is a sequence
+        prefix                   text columns only: LIKE 'value%', which can use an index
+        is_null, not_null        value is ignored
+
+    Range operators (lt/le/gt/ge/between) need a numeric or temporal column.
+    Args:
+        conn: Database connection
+        table: Table name
+        filters: (column, op, value) tuples
+    Returns:
+        Tuple of (condition SQL, parameters); the condition is "1=1" when
+        there are no filters
+    """
+    schema = get_schema(conn)
+    if table not in schema.columns:
+        raise Error(f'Unknown table: {table}')
+    kinds = {row[0]: column_kind(row[1]) for row in schema.describe(table)}
+    clauses: List[str] = []
+    params: List[Any] = []
+    for column, op, value in normalize_filters(filters):
+        if column not in kinds:
+            raise Error(f'Unknown column {column} in {table}')
+        if op not in FILTER_OPS:
+            raise Error(f'Unknown filter operator: {op}')
+        kind = kinds[column]
+        if op in _RANGE_OPS and kind not in _ORDERED_KINDS:
+            raise Error(f'{op} needs a numeric or date column; {column} is {kind}')
+        if op == 'prefix' and kind != 'text':
+            raise Error(f'prefix needs a text column; {column} is {kind}')
+
+        if op == 'is_null':
+            clauses.append(f"`{column}` IS NULL")
+        elif op == 'not_null':
+            clauses.append(f"`{column}` IS NOT NULL")
+        elif op == 'prefix':
+            clauses.append(f"`{column}` LIKE %s")
+            params.append(_like_prefix(str(value)))
+        elif op == 'in':
+            values = [_coerce(kind, v) for v in value or ()]
+            if not values:
+                clauses.append('1=0')
+                continue
+            clauses.append(f"`{column}` IN ({', '.join(['%s'] * len(values))})")
+            params.extend(values)
+        elif op == 'between':
+            low, high = (_coerce(kind, v) for v in value)
+            if low is not None:
+                clauses.append(f"`{column}` >= %s")
+                params.append(low)
+            if high is not None:
+                clauses.append(f"`{column}` <= %s")
+                params.append(high)
+        else:
+            clauses.append(f"`{column}` {_COMPARISONS[op]} %s")
+            params.append(_coerce(kind, value))
+    return ' AND '.join(clauses) or '1=1', params
+
+
+@dataclass
+class Page:
+    """One page of a keyset-paginated table read.
+
+    ``next_cursor``/``prev_cursor`` hold the key values to pass back as
+    ``after``/``before`` to fetch_page, or None at either end of the table.
+    """
+    columns: List[str]
+    rows: List[Tuple]
+    key_columns: List[str]
+    next_cursor: Optional[Tuple] = None
+    prev_cursor: Optional[Tuple] = None
+
+
+def _seek_predicate(key_columns: List[str], op: str, values: Tuple,
+                    nullable: Iterable[str] = ()) -> Tuple[str, List[Any]]:
+    """Build ``(k1, k2, ...) op (v1, v2, ...)`` in an index-friendly form.
+
+    Expands to ``k1 >= v1 AND (k1 > v1 OR (k2 >= v2 AND (k2 > v2 OR ...)))``
+    so MySQL can use a range scan on the leading key column. Columns in
+    ``nullable`` compare NULL as the smallest value, matching how MySQL
+    sorts them.
+    """
+    weak = op + '='
+    nullable = set(nullable)
+    clause: Optional[str] = None
+    params: List[Any] = []
+    for col, val in reversed(list(zip(key_columns, values))):
+        if col not in nullable:
+            if clause is None:
+                clause, params = f"`{col}` {op} %s", [val]
+            else:
+                clause, params = f"`{col}` {weak} %s AND (`{col}` {op} %s OR ({clause}))", [val, val] + params
+            continue
+        # Rows strictly past val, and rows tied with it
+        if val is None:
+            strict, equal, strict_params, equal_params = (
+                f"`{col}` IS NOT NULL" if op == '>' else None), f"`{col}` IS NULL", [], []
+        else:
+            strict = f"`{col}` > %s" if op == '>' else f"(`{col}` < %s OR `{col}` IS NULL)"
+            equal, strict_params, equal_params = f"`{col}` = %s", [val], [val]
+        if clause is None:
+            clause, params = strict or '1=0', strict_params
+        else:
+            tied = f"{equal} AND ({clause})"
+            clause = f"{strict} OR ({tied})" if strict else tied
+            params = (strict_params if strict else []) + equal_params + params
+    return clause, params
+
+
+def fetch_page(conn: MySQLConnection, table: str, page_size: int = 50,
+               after: Optional[Tuple] = None, before: Optional[Tuple] = None,
+               filters: Optional[Iterable[Tuple]] = None, order_by: Optional[List[str]] = None,
+               descending: bool = False) -> Page:
+    """Fetch one page of a table ordered by its primary key.
+
+    Uses keyset (seek) pagination: the page starts right after the ``after``
+    key or ends right before the ``before`` key, so the cost of a page does
+    not grow with its position in the table. Composite keys are supported.
+    Tables without a primary key are ordered by all of their columns.
+    Pages are served from result_cache until the table is written.
+
+    ``filters`` are applied on the server (see where_clause) and
+    ``order_by`` sorts by other columns first; the primary key is appended
+    as a tie-breaker, so the cursors stay unique.
+    Args:
+        conn: Database connection
+        table: Table name
+        page_size: Rows per page
+        after: Cursor from Page.next_cursor, or None for the first page
+        before: Cursor from Page.prev_cursor
+        filters: (column, op, value) tuples that every row must match
+        order_by: Columns to sort by before the primary key
+        descending: Sort the whole key in descending order
+    Returns:
+        A Page with the rows and the cursors of its neighbours
+    """
+    schema = get_schema(conn)
+    if table not in schema.columns:
+        raise Error(f'Unknown table: {table}')
+    desc = schema.describe(table)
+    pk = schema.primary_key(table) or [row[0] for row in desc]
+    order_by = list(order_by or ())
+    unknown = [col for col in order_by if col not in {row[0] for row in desc}]
+    if unknown:
+        raise Error(f'Unknown column {unknown[0]} in {table}')
+    key_columns = order_by + [col for col in pk if col not in order_by]
+    nullable = [row[0] for row in desc if row[0] in key_columns and row[2] == 'YES']
+    filters = normalize_filters(filters)
+    where, where_params = where_clause(conn, table, filters) if filters else (None, [])
+    after = tuple(after) if after is not None else None
+    before = tuple(before) if before is not None else None
+    key = ('fetch_page', table, page_size, after, before, filters, tuple(order_by), descending)
+    return _cached_read(conn, [table], key, lambda: _load_page(
+        conn, table, key_columns, page_size, after, before, where, where_params, descending, nullable))
+
+
+def _load_page(conn: MySQLConnection, table: str, key_columns: List[str], page_size: int,
+               after: Optional[Tuple], before: Optional[Tuple], where: Optional[str] = None,
+               where_params: Optional[List[Any]] = None, descending: bool = False,
+               nullable: Iterable[str] = ()) -> Page:
+    backwards = before is not None
+    # Reading backwards flips the sort; the rows are reversed again below.
+    reverse = backwards != descending
+    order = ', '.join(f"`{col}` {'DESC' if reverse else 'ASC'}" for col in key_columns)
+    query = f"SELECT * FROM `{table}`"
+    conditions = [where] if where else []
+    params: List[Any] = list(where_params or ())
+    if after is not None or before is not None:
+        clause, seek_params = _seek_predicate(key_columns, '<' if reverse else '>',
+                                              before if backwards else after, nullable)
+        conditions.append(f"({clause})")
+        params.extend(seek_params)
+    if conditions:
+        query += " WHERE " + ' AND '.join(conditions)
+    query += f" ORDER BY {order} LIMIT %s"
+    params.append(page_size + 1)
+
+    cur = conn.cursor()
+    try:
+        rows = _fetch(conn, cur, 'fetch_page', table, query, params)
+        cols = [d[0] for d in cur.description]
+    finally:
+        cur.close()
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+    positions = [cols.index(col) for col in key_columns]
+
+    def key_of(row: Tuple) -> Tuple:
+        return tuple(row[i] for i in positions)
+
+    page = Page(cols, rows, key_columns)
+    if backwards:
+        page.prev_cursor = key_of(rows[0]) if has_more else None
+        page.next_cursor = key_of(rows[-1]) if rows else before
+    else:
+        page.next_cursor = key_of(rows[-1]) if has_more else None
+        if after is not None:
+            page.prev_cursor = key_of(rows[0]) if rows else after
+    return page
+
+
+def fetch_date_range(conn: MySQLConnection, table: str, column: str, start: Any, end: Any = None,
+                     filters: Optional[Iterable[Tuple]] = None, columns: Optional[List[str]] = None,
+                     limit: Optional[int] = 1000) -> Tuple[List[str], List[Tuple]]:
+    """Rows whose date column falls in [start, end), oldest first.
+
+    The range is a plain >= / < comparison on ``column``. When the table
+    is partitioned by that column (see partitions.py), MySQL only opens the
+    partitions that overlap the range. Without partitioning an index on
+    ``column`` still limits the scan.
+    Args:
+        conn: Database connection
+        table: Table name
+        column: DATE/DATETIME column to bound
+        start: First date included
+        end: First date excluded, or None for no upper bound
+        filters: Further (column, op, value) tuples, see where_clause
+        columns: Optional subset of columns to return
+        limit: Maximum rows, or None for all
+    Returns:
+        Tuple of (column names, rows)
+    """
+    bounds = [(column, 'ge', start)] + ([(column, 'lt', end)] if end is not None else [])
+    filters = normalize_filters(bounds + list(filters or ()))
+    columns = tuple(columns) if columns else None
+
+    def load():
+        where, params = where_clause(conn, table, filters)
+        select = ', '.join(f"`{col}`" for col in columns) if columns else '*'
+        query = f"SELECT {select} FROM `{table}` WHERE {where} ORDER BY `{column}`"
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        cur = conn.cursor()
+        try:
+            rows = _fetch(conn, cur, 'fetch_date_range', table, query, params)
+            return [d[0] for d in cur.description], rows
+        finally:
+            cur.close()
+    return _cached_read(conn, [table], ('fetch_date_range', table, column, filters, columns, limit), load)
+
+
+_INT_TYPES = {FieldType.TINY, FieldType.SHORT, FieldType.INT24, FieldType.LONG,
+              FieldType.LONGLONG, FieldType.YEAR}
+_DECIMAL_TYPES = {FieldType.DECIMAL, FieldType.NEWDECIMAL}
+_FLOAT_TYPES = _DECIMAL_TYPES | {FieldType.FLOAT, FieldType.DOUBLE}
+_DATE_TYPES = {FieldType.DATE, FieldType.NEWDATE, FieldType.DATETIME, FieldType.TIMESTAMP}
+
+
+def column_dtypes(description: List[Tuple]) -> Dict[str, str]:
+    """Map cursor.description entries to pandas dtypes.
+
+    INT columns become int64 (Int64 when nullable), FLOAT/DOUBLE become
+    float64 and DATE/DATETIME become datetime64. DECIMAL columns are not
+    mapped and stay object columns of Decimal, so amounts keep their exact
+    value. Other columns are left to pandas inference.
+    """
+    dtypes = {}
+    for entry in description:
+        name, type_code, null_ok = entry[0], entry[1], entry[6]
+        if type_code in _INT_TYPES:
+            dtypes[name] = 'Int64' if null_ok else 'int64'
+        elif type_code in _DECIMAL_TYPES:
+            continue
+        elif type_code in _FLOAT_TYPES:
+            dtypes[name] = 'float64'
+        elif type_code in _DATE_TYPES:
+            dtypes[name] = 'datetime64[ns]'
+    return dtypes
+
+
+def _iter_rows(conn: MySQLConnection, function: str, table: Optional[str], query: str,
+               params: Optional[List[Any]], chunk_size: int) -> Iterator[Tuple[List[Tuple], List[Tuple]]]:
+    """Yield (cursor.description, rows) for at most chunk_size rows at a time.
+
+    Rows are read from an unbuffered cursor with fetchmany, so only one chunk
+    is held in memory at a time. If the generator is closed early the rest of
+    the result is drained so the connection stays usable. The recorded
+    QueryEvent's time excludes the consumer's work.
+    """
+    event = QueryEvent(function, table, query, _params_shape(params), params=params)
+    cur = conn.cursor(buffered=False)
+    started = time.perf_counter()
+    try:
+        cur.execute(query, params or ())
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            event.rows += len(rows)
+            event.bytes += _estimate_size(rows)
+            event.wall_time += time.perf_counter() - started
+            started = None  # the consumer's turn
+            yield cur.description, rows
+            started = time.perf_counter()
+    except Exception as e:
+        event.error = str(e)
+        raise
+    finally:
+        if started is None:
+            started = time.perf_counter()  # closed at the yield: time only the drain
+        if conn.unread_result:
+            conn.consume_results()
+        cur.close()
+        event.wall_time += time.perf_counter() - started
+        _record(event)
+
+
+def iter_query_chunks(conn: MySQLConnection, query: str, params: Optional[List[Any]] = None,
+                      chunk_size: int = 10000, table: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """Stream a query's result as DataFrames of at most chunk_size rows.
+
+    Rows are read from an unbuffered cursor with fetchmany, so only one chunk
+    is held in memory at a time. If the generator is closed early the rest of
+    the result is drained so the connection stays usable. ``table`` only
+    labels the recorded QueryEvent, whose time excludes the consumer's work.
+    """
+    for description, rows in _iter_rows(conn, 'iter_query_chunks', table, query, params, chunk_size):
+        dtypes = column_dtypes(description)
+        df = pd.DataFrame.from_records(rows, columns=[d[0] for d in description])
+        del rows
+        yield df.astype(dtypes) if dtypes else df
+
+
+def iter_query_rows(conn: MySQLConnection, query: str, params: Optional[List[Any]] = None,
+                    chunk_size: int = 10000, table: Optional[str] = None) -> Iterator[List[Tuple]]:
+    """Stream a query's result as lists of at most chunk_size row tuples.
+
+    The tuple counterpart of iter_query_chunks, for callers that work on
+    rows and want the connector's values (e.g. Decimal) unchanged.
+    """
+    for _, rows in _iter_rows(conn, 'iter_query_rows', table, query, params, chunk_size):
+        yield rows
+
+
+def iter_table_chunks(conn: MySQLConnection, table: str, chunk_size: int = 10000,
+                      columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+    """Stream a whole table as DataFrame chunks (see iter_query_chunks).
+    Args:
+        conn: Database connection
+        table: Table name
+        chunk_size: Rows per DataFrame
+        columns: Optional subset of columns to read
+    Returns:
+        Generator of DataFrames with dtypes taken from the column types
+    """
+    select = ', '.join(f"`{col}`" for col in columns) if columns else '*'
+    return iter_query_chunks(conn, f"SELECT {select} FROM `{table}`", chunk_size=chunk_size, table=table)
+
+
+# String columns with at most this many distinct values (and at least two
+# rows per value) are dictionary-encoded.
+MAX_DICTIONARY_SIZE = 32767
+
+
+@dataclass
+class ColumnarResult:
+    """A query result stored column-wise in typed NumPy arrays.
+
+    INT columns are the narrowest integer dtype that holds their values,
+    with a boolean mask when they contain NULLs. DECIMAL/FLOAT columns are
+    float64 (NULL is NaN) and DATE/DATETIME columns datetime64[ns] (NULL is
+    NaT). Repetitive string columns are dictionary-encoded as integer codes
+    into ``dictionaries[column]`` (-1 for NULL); anything else is an object
+    array.
+    """
+    columns: List[str]
+    arrays: Dict[str, np.ndarray]
+    masks: Dict[str, np.ndarray] = field(default_factory=dict)
+    dictionaries: Dict[str, List[str]] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.arrays[self.columns[0]]) if self.columns else 0
+
+    def column(self, name: str) -> pd.Series:
+        """One column as a pandas Series sharing this result's memory."""
+        values = self.arrays[name]
+        if name in self.dictionaries:
+            values = pd.Categorical.from_codes(values, categories=self.dictionaries[name])
+        elif name in self.masks:
+            values = pd.arrays.IntegerArray(values, self.masks[name])
+        elif values.dtype == object:
+            # Stop pandas from converting strings to its own string dtype (a copy)
+            return pd.Series(values, name=name, dtype=object, copy=False)
+        return pd.Series(values, name=name, copy=False)
+
+    def to_pandas(self) -> pd.DataFrame:
+        """Wrap the arrays in a DataFrame without copying them."""
+        return pd.DataFrame({name: self.column(name) for name in self.columns}, copy=False)
+
+    def column_nbytes(self) -> Dict[str, int]:
+        """Bytes held per column, including masks, dictionaries and string objects."""
+        sizes = {}
+        for name in self.columns:
+            values = self.arrays[name]
+            size = values.nbytes
+            if name in self.masks:
+                size += self.masks[name].nbytes
+            if name in self.dictionaries:
+                size += sum(sys.getsizeof(value) for value in self.dictionaries[name])
+            elif values.dtype == object and len(values):
+                size += _estimate_size(list(values[:64])) * len(values) // min(len(values), 64)
+            sizes[name] = size
+        return sizes
+
+    @property
+    def nbytes(self) -> int:
+        return sum(self.column_nbytes().values())
+
+
+def _narrow_int(values: np.ndarray) -> np.ndarray:
+    if not len(values):
+        return values
+    low, high = values.min(), values.max()
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return values.astype(dtype)
+    return values
+
+
+def _code_dtype(n_values: int):
+    # The dtype pandas itself uses for Categorical codes, so from_codes keeps the array
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_values < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+class _ColumnBuilder:
+    """Accumulates one column chunk by chunk as typed arrays."""
+
+    def __init__(self, type_code: int):
+        if type_code in _INT_TYPES:
+            self.kind = 'int'
+        elif type_code in _FLOAT_TYPES:
+            self.kind = 'float'
+        elif type_code in _DATE_TYPES:
+            self.kind = 'date'
+        elif type_code in (FieldType.VAR_STRING, FieldType.STRING, FieldType.VARCHAR, FieldType.ENUM):
+            self.kind = 'text'
+        else:
+            self.kind = 'other'
+        self.chunks: List[np.ndarray] = []
+        self.masks: List[np.ndarray] = []
+        self.codes: Dict[Any, int] = {}
+
+    def add(self, values: List[Any]) -> None:
+        if self.kind == 'int':
+            mask = np.fromiter((value is None for value in values), dtype=bool, count=len(values))
+            if mask.any():
+                values = [0 if value is None else value for value in values]
+            self.chunks.append(np.array(values, dtype=np.int64))
+            self.masks.append(mask)
+        elif self.kind == 'float':
+            self.chunks.append(np.array(values, dtype=np.float64))
+        elif self.kind == 'date':
+            self.chunks.append(np.array(values, dtype='datetime64[ns]'))
+        elif self.kind == 'text':
+            codes = self.codes
+            self.chunks.append(np.fromiter(
+                (-1 if value is None else codes.setdefault(value, len(codes)) for value in values),
+                dtype=np.int32, count=len(values)))
+        else:
+            chunk = np.empty(len(values), dtype=object)
+            chunk[:] = values
+            self.chunks.append(chunk)
+
+    def finish(self, name: str, result: ColumnarResult) -> None:
+        values = np.concatenate(self.chunks) if self.chunks else np.empty(0, dtype=self._empty_dtype())
+        self.chunks = []
+        if self.kind == 'int':
+            mask = np.concatenate(self.masks) if self.masks else np.empty(0, dtype=bool)
+            values = _narrow_int(values)
+            if mask.any():
+                result.masks[name] = mask
+        elif self.kind == 'text':
+            dictionary = list(self.codes)
+            if len(dictionary) <= min(MAX_DICTIONARY_SIZE, len(values) // 2):
+                values = values.astype(_code_dtype(len(dictionary)))
+                result.dictionaries[name] = dictionary
+            else:
+                lookup = np.empty(len(dictionary) + 1, dtype=object)
+                lookup[:-1] = dictionary
+                values = lookup[values]  # -1 picks the trailing None
+        result.arrays[name] = values
+
+    def _empty_dtype(self):
+        return {'int': np.int64, 'float': np.float64, 'date': 'datetime64[ns]', 'text': np.int32}.get(self.kind, object)
+
+
+def query_columnar(conn: MySQLConnection, query: str, params: Optional[List[Any]] = None,
+                   chunk_size: int = 10000, table: Optional[str] = None) -> ColumnarResult:
+    """Run a query and return its result column-wise.
+
+    Rows are read from an unbuffered cursor chunk_size at a time and
+    converted straight into per-column arrays, so the full result never
+    exists as Python tuples.
+    Args:
+        conn: Database connection
+        query: SELECT statement
+        params: Query parameters
+        chunk_size: Rows fetched per round trip
+        table: Table to label the recorded QueryEvent with
+    Returns:
+        ColumnarResult; ``to_pandas()`` gives a DataFrame over the same memory
+    """
+    cur = conn.cursor(buffered=False)
+    try:
+        with _track(conn, 'query_columnar', table, query, params) as event:
+            cur.execute(query, params or ())
+            columns = [d[0] for d in cur.description]
+            builders = [_ColumnBuilder(d[1]) for d in cur.description]
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for i, builder in enumerate(builders):
+                    builder.add([row[i] for row in rows])
+                event.rows += len(rows)
+            result = ColumnarResult(columns, {})
+            for name, builder in zip(columns, builders):
+                builder.finish(name, result)
+            event.bytes = result.nbytes
+    finally:
+        if conn.unread_result:
+            conn.consume_results()
+        cur.close()
+    return result
+
+
+def fetch_columnar(conn: MySQLConnection, table: str, limit: Optional[int] = None,
+                   columns: Optional[List[str]] = None, filters: Optional[Iterable[Tuple]] = None,
+                   chunk_size: int = 10000) -> ColumnarResult:
+    """Read a table (or a filtered part of it) as a ColumnarResult.
+
+    The columnar counterpart of fetch_table for large reads. Results are
+    cached like other reads and invalidated when the table changes.
+    Args:
+        conn: Database connection
+        table: Table name
+        limit: Maximum rows, or None for the whole table
+        columns: Optional subset of columns to read
+        filters: (column, op, value) tuples, see where_clause
+        chunk_size: Rows fetched per round trip
+    Returns:
+        ColumnarResult
+    """
+    filters = normalize_filters(filters)
+    columns = tuple(columns) if columns else None
+
+    def load():
+        select = ', '.join(f"`{col}`" for col in columns) if columns else '*'
+        where, params = where_clause(conn, table, filters)
+        query = f"SELECT {select} FROM `{table}` WHERE {where}"
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        return query_columnar(conn, query, params, chunk_size, table)
+    return _cached_read(conn, [table], ('fetch_columnar', table, limit, columns, filters), load)
+
+
+EXPORT_FORMATS = ('csv', 'csv.gz', 'parquet')
+
+
+@dataclass
+class ExportResult:
+    """What an export wrote."""
+    path: str
+    rows: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+_UNSIGNED = 32  # FieldFlag.UNSIGNED
+
+
+def _file_text(value: Any) -> Any:
+    """A value as the text a file should hold; None stays None."""
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value).decode('utf-8', 'replace')
+    if isinstance(value, (set, frozenset)):  # SET columns
+        return ','.join(sorted(value))
+    return str(value)
+
+
+def _csv_value(value: Any) -> Any:
+    # Decimal, date and datetime keep the connector's exact text (str(Decimal('12.50')) == '12.50')
+    if value is None:
+        return ''
+    if isinstance(value, (int, float, Decimal, datetime.date, datetime.timedelta)):
+        return value
+    return _file_text(value)
+
+
+def _arrow_type(pa, entry: Tuple, values: List[Any]):
+    """Arrow type for a result column, from its cursor.description entry.
+
+    The connector leaves precision and scale out of the description, so a
+    DECIMAL's scale is read from the first chunk's values (the server
+    sends every value of a column with the same number of decimals).
+    """
+    type_code, flags = entry[1], entry[7] or 0
+    if type_code in (FieldType.DECIMAL, FieldType.NEWDECIMAL):
+        scale = entry[5]
+        if scale is None:
+            scales = [-v.as_tuple().exponent for v in values if isinstance(v, Decimal) and v.is_finite()]
+            scale = max(scales, default=10)
+        precision = entry[4] or 38
+        return pa.decimal128(precision, scale) if precision <= 38 else pa.decimal256(precision, scale)
+    if type_code == FieldType.LONGLONG and flags & _UNSIGNED:
+        return pa.uint64()
+    if type_code in _INT_TYPES or type_code == FieldType.BIT:
+        return pa.int64()
+    if type_code in (FieldType.FLOAT, FieldType.DOUBLE):
+        return pa.float64()
+    if type_code in (FieldType.DATE, FieldType.NEWDATE):
+        return pa.date32()
+    if type_code in (FieldType.DATETIME, FieldType.TIMESTAMP):
+        return pa.timestamp('us')
+    if type_code == FieldType.TIME:
+        return pa.duration('us')
+    if entry[8] == 63 and type_code in (FieldType.BLOB, FieldType.TINY_BLOB, FieldType.MEDIUM_BLOB,
+                                        FieldType.LONG_BLOB, FieldType.STRING, FieldType.VAR_STRING):
+        return pa.binary()  # binary charset
+    return pa.string()
+
+
+def _parquet_chunk(pa, description: List[Tuple], rows: List[Tuple], schema):
+    """An Arrow table of one chunk; the schema comes from the first chunk."""
+    columns = list(zip(*rows))
+    if schema is None:
+        schema = pa.schema([pa.field(entry[0], _arrow_type(pa, entry, values))
+                            for entry, values in zip(description, columns)])
+    arrays = []
+    for field_, values in zip(schema, columns):
+        if pa.types.is_string(field_.type):
+            values = [_file_text(v) for v in values]
+        elif pa.types.is_binary(field_.type):
+            values = [bytes(v) if v is not None else None for v in values]
+        arrays.append(pa.array(values, type=field_.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def export_query(conn: MySQLConnection, query: str, path: str, fmt: str = 'csv',
+                 params: Optional[List[Any]] = None, chunk_size: int = 50000,
+                 table: Optional[str] = None) -> ExportResult:
+    """Stream a query's result into a CSV or Parquet file.
+
+    Rows come from an unbuffered cursor and each chunk is written before
+    the next is fetched, so memory use depends on chunk_size, not on the
+    size of the result. Values are written as the connector returns them:
+    DECIMAL keeps its exact digits (CSV text, Parquet decimal128) and DATE
+    stays a calendar date (Parquet date32), so a file is a faithful copy of
+    the rows. 'csv.gz' is gzip-compressed CSV; 'parquet' writes one
+    zstd-compressed row group per chunk and needs pyarrow.
+    Args:
+        conn: Database connection
+        query: SELECT statement
+        path: File to write
+        fmt: One of EXPORT_FORMATS
+        params: Query parameters
+        chunk_size: Rows per fetch (and per Parquet row group)
+        table: Table to label the recorded QueryEvent with
+    Returns:
+        ExportResult with the rows and bytes written and the time taken
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'Unknown export format {fmt!r}; expected one of {", ".join(EXPORT_FORMATS)}')
+    result = ExportResult(path)
+    started = time.perf_counter()
+    if fmt == 'parquet':
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise Error('Parquet export needs pyarrow (pip install pyarrow)')
+    chunks = _iter_rows(conn, 'export_query', table, query, params, chunk_size)
+    if fmt == 'parquet':
+        writer = None
+        try:
+            for description, rows in chunks:
+                arrow = _parquet_chunk(pa, description, rows, writer.schema if writer else None)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, arrow.schema, compression='zstd')
+                writer.write_table(arrow)
+                result.rows += len(rows)
+            if writer is None:
+                pq.write_table(pa.table({}), path)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        opener = gzip.open if fmt == 'csv.gz' else open
+        with opener(path, 'wt', newline='', encoding='utf-8') as f:
+            out = csv.writer(f)
+            for description, rows in chunks:
+                if result.rows == 0:
+                    out.writerow([entry[0] for entry in description])
+                out.writerows([_csv_value(v) for v in row] for row in rows)
+                result.rows += len(rows)
+    result.seconds = time.perf_counter() - started
+    result.bytes = os.path.getsize(path)
+    return result
+
+
+def export_table(conn: MySQLConnection, table: str, path: str, fmt: str = 'csv',
+                 filters: Optional[Iterable[Tuple]] = None, columns: Optional[List[str]] = None,
+                 chunk_size: int = 50000) -> ExportResult:
+    """Export a whole table, or the rows matching ``filters``, to a file.
+
+    Rows are written in primary key order. See export_query.
+    Args:
+        conn: Database connection
+        table: Table name
+        path: File to write
+        fmt: One of EXPORT_FORMATS
+        filters: (column, op, value) tuples, see where_clause
+        columns: Optional subset of columns to export
+        chunk_size: Rows per fetch
+    Returns:
+        ExportResult
+    """
+    where, params = where_clause(conn, table, filters or ())
+    select = ', '.join(f"`{col}`" for col in columns) if columns else '*'
+    key = get_schema(conn).primary_key(table)
+    order = f" ORDER BY {', '.join(f'`{col}`' for col in key)}" if key else ''
+    return export_query(conn, f"SELECT {select} FROM `{table}` WHERE {where}{order}", path, fmt,
+                        params, chunk_size, table)
+
+
+def export_tables(pool: ConnectionPool, tables: List[str], directory: str, fmt: str = 'csv',
+                  chunk_size: int = 50000, conn: Optional[MySQLConnection] = None) -> Dict[str, ExportResult]:
+    """Export several tables concurrently, one pooled connection each.
+
+    Files are named ``<table>.<fmt>`` inside ``directory``. Uses
+    run_parallel, so at most DB_PARALLEL_WORKERS exports run at once.
+    Returns:
+        Dict of table -> ExportResult
+    """
+    os.makedirs(directory, exist_ok=True)
+    return run_parallel(pool, {
+        table: (export_table, table, os.path.join(directory, f'{table}.{fmt}'), fmt, None, None, chunk_size)
+        for table in tables
+    }, conn)
+
+
+def call_routine(conn: MySQLConnection, name: str, args: List[Any] = None, routine_type: str = 'PROCEDURE') -> List[Any]:
+    """Call a stored procedure or function.
+    
+    Args:
+        conn: Database connection
+        name: Name of the procedure/function
+        args: List of arguments
+        routine_type: 'PROCEDURE' or 'FUNCTION'
+    Returns:
+        For procedures: List of result sets
+        For functions: Single result (the function return value)
+    """
+    cur = conn.cursor()
+    args = args or []
+    try:
+        if routine_type == 'FUNCTION':
+            # For functions, we need to use SELECT func_name(args)
+            placeholders = ', '.join(['%s'] * len(args))
+            query = f"SELECT {name}({placeholders})"
+            rows = _fetch(conn, cur, 'call_routine', name, query, args)
+            result = rows[0] if rows else None
+            return [[(result[0],)]] if result else []
+        results = _callproc(conn, cur, 'call_routine', name, args)
+    finally:
+        cur.close()
+    # Only a procedure that ran to the end is treated as a write
+    _note_routine_call(conn, name, routine_type)
+    return results
+
+
+def _callproc(conn: MySQLConnection, cur, function: str, name: str, args: List[Any]) -> List[List[Tuple]]:
+    """callproc and collect every result set, recorded as one QueryEvent."""
+    with _track(conn, function, name, f"CALL {name}({', '.join(['%s'] * len(args))})", args) as event:
+        cur.callproc(name, args)
+        results = [result.fetchall() for result in cur.stored_results()]
+        event.result([row for rows in results for row in rows])
+    return results
+
+def call_procedure(conn: MySQLConnection, name: str, args: Optional[List[Any]] = None) -> List[Any]:
+    """Legacy wrapper for call_routine with PROCEDURE type."""
+    return call_routine(conn, name, args, 'PROCEDURE')
+
+
+@dataclass
+class RoutineResults:
+    """Outcome of call_routine_many.
+
+    ``results[i]`` belongs to ``arg_rows[i]``: the return value for a
+    function, the list of result sets for a procedure, or None if that row
+    failed. ``errors`` holds (row index, message) for every failed row.
+    """
+    results: List[Any] = field(default_factory=list)
+    errors: List[Tuple[int, str]] = field(default_factory=list)
+    batches: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+@lru_cache(maxsize=256)
+def _function_batch_sql(name: str, n_args: int, n_rows: int) -> str:
+    call = f"{name}({', '.join(['%s'] * n_args)})"
+    return ' UNION ALL '.join(f"SELECT {i}, {call}" for i in range(n_rows))
+
+
+def call_routine_many(conn: MySQLConnection, name: str, arg_rows: Iterable[List[Any]],
+                      routine_type: str = 'PROCEDURE', batch_size: int = 200) -> RoutineResults:
+    """Call a routine once per argument row with far fewer round trips.
+
+    Functions: each batch is one ``SELECT 0, f(...) UNION ALL SELECT 1,
+    f(...) ...`` statement. If it fails, that batch is evaluated row by row
+    so each failing row gets its own error.
+
+    Procedures: each batch runs in one transaction (a savepoint inside
+    transaction()), so there is one commit per batch instead of one per
+    call. If a call fails the batch is rolled back and replayed with a
+    savepoint around every call; the failing rows are undone and recorded,
+    and the other rows are kept. Procedures that COMMIT themselves defeat
+    the rollback.
+    Args:
+        conn: Database connection
+        name: Name of the procedure/function
+        arg_rows: One argument list per call
+        routine_type: 'PROCEDURE' or 'FUNCTION'
+        batch_size: Calls per statement (functions) or transaction (procedures)
+    Returns:
+        RoutineResults with one result per row and the per-row errors
+    """
+    schema = get_schema(conn)
+    if name not in schema.routine_names(routine_type):
+        raise Error(f'Unknown {routine_type.lower()}: {name}')
+    params, _ = schema.procedure_info(name, routine_type)
+    n_args = len(params)
+    outcome = RoutineResults()
+    cur = conn.cursor()
+    try:
+        offset = 0
+        for batch in _batched(arg_rows, batch_size):
+            outcome.results.extend([None] * len(batch))
+            rows = []
+            for i, args in enumerate(batch, offset):
+                if len(args) != n_args:
+                    outcome.errors.append((i, f'expected {n_args} arguments, got {len(args)}'))
+                else:
+                    rows.append((i, list(args)))
+            if rows:
+                run = _function_batch if routine_type == 'FUNCTION' else _procedure_batch
+                run(conn, cur, name, rows, outcome)
+            outcome.batches += 1
+            offset += len(batch)
+    finally:
+        cur.close()
+        _note_routine_call(conn, name, routine_type)
+    outcome.errors.sort()
+    return outcome
+
+
+def _function_batch(conn: MySQLConnection, cur, name: str, rows: List[Tuple[int, List[Any]]],
+                    outcome: RoutineResults) -> None:
+    sql = _function_batch_sql(name, len(rows[0][1]), len(rows))
+    try:
+        values = _fetch(conn, cur, 'call_routine_many', name, sql, [arg for _, args in rows for arg in args])
+    except Error:
+        for i, args in rows:
+            try:
+                value = _fetch(conn, cur, 'call_routine_many', name, _function_batch_sql(name, len(args), 1), args)
+                outcome.results[i] = value[0][1]
+            except Error as e:
+                outcome.errors.append((i, str(e)))
+        return
+    for position, value in values:
+        outcome.results[rows[position][0]] = value
+
+
+def _procedure_batch(conn: MySQLConnection, cur, name: str, rows: List[Tuple[int, List[Any]]],
+                     outcome: RoutineResults) -> None:
+    try:
+        with transaction(conn):
+            results = [(i, _callproc(conn, cur, 'call_routine_many', name, args)) for i, args in rows]
+    except Error:
+        # Replay with a savepoint per call to find and undo only the failing rows
+        with transaction(conn):
+            results = []
+            for i, args in rows:
+                try:
+                    with transaction(conn):
+                        results.append((i, _callproc(conn, cur, 'call_routine_many', name, args)))
+                except Error as e:
+                    outcome.errors.append((i, str(e)))
+    for i, result in results:
+        outcome.results[i] = result
+
+# SQL templates for the single-row helpers. lru_cache hands back the same
+# string object per (table, columns), which _prepared relies on.
+
+@lru_cache(maxsize=512)
+def _insert_sql(table: str, columns: Tuple[str, ...]) -> str:
+    names = ', '.join(f"`{col}`" for col in columns)
+    placeholders = ', '.join(['%s'] * len(columns))
+    return f"INSERT INTO `{table}` ({names}) VALUES ({placeholders})"
+
+
+@lru_cache(maxsize=512)
+def _update_sql(table: str, columns: Tuple[str, ...], where: Tuple[str, ...]) -> str:
+    set_clause = ', '.join(f"`{col}` = %s" for col in columns)
+    where_clause = ' AND '.join(f"`{col}` = %s" for col in where)
+    return f"UPDATE `{table}` SET {set_clause} WHERE {where_clause}"
+
+
+@lru_cache(maxsize=512)
+def _delete_sql(table: str, where: Tuple[str, ...]) -> str:
+    where_clause = ' AND '.join(f"`{col}` = %s" for col in where)
+    return f"DELETE FROM `{table}` WHERE {where_clause}"
+
+
+@lru_cache(maxsize=512)
+def _select_by_id_sql(table: str, id_column: str) -> str:
+    return f"SELECT * FROM `{table}` WHERE `{id_column}` = %s"
+
+
+def insert_record(conn: MySQLConnection, table: str, data: dict) -> int:
+    """Insert a record into a table.
+    Args:
+        conn: Database connection
+        table: Table name
+        data: Dictionary of column_name: value pairs
+    Returns:
+        The ID of the inserted record
+    """
+    query, cur = _prepared(conn, _insert_sql(table, tuple(data.keys())))
+    with _track(conn, 'insert_record', table, query, list(data.values())) as event:
+        cur.execute(query, list(data.values()))
+        _commit(conn)
+        event.rows = cur.rowcount
+    row = dict(data)
+    key = get_schema(conn).primary_key(table)
+    if len(key) == 1 and key[0] not in row and cur.lastrowid:
+        row[key[0]] = cur.lastrowid
+    note_write(conn, table, 'insert', [row])
+    return cur.lastrowid
+
+@dataclass
+class BatchResult:
+    """Outcome of a batched write.
+
+    ``errors`` holds (batch number, offset of the batch's first row, message)
+    for every batch that was rolled back.
+    """
+    rows: int = 0
+    batches: int = 0
+    errors: List[Tuple[int, int, str]] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+def _batched(rows: Iterable[Any], batch_size: int) -> Iterator[List[Any]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _write_batches(conn: MySQLConnection, function: str, operation: str, table: str, rows: Iterable[dict],
+                   batch_size: int, build_query) -> BatchResult:
+    """Run executemany once per batch, each batch in its own transaction.
+
+    The column list is taken from the first row; every row must provide
+    those keys. A failing batch is rolled back and recorded, and the
+    remaining batches still run. Inside transaction() each batch is a
+    savepoint of the caller's transaction instead.
+    """
+    result = BatchResult()
+    columns = None
+    query = None
+    offset = 0
+    for number, batch in enumerate(_batched(rows, batch_size)):
+        if columns is None:
+            columns = list(batch[0].keys())
+            query = build_query(columns)
+        cur = conn.cursor()
+        try:
+            values = [[row[col] for col in columns] for row in batch]
+            with _track(conn, function, table, query, values) as event, transaction(conn):
+                cur.executemany(query, values)
+                note_write(conn, table, operation, batch)
+                event.rows = len(batch)
+            result.rows += len(batch)
+        except (Error, KeyError) as e:
+            result.errors.append((number, offset, str(e)))
+        finally:
+            cur.close()
+        result.batches += 1
+        offset += len(batch)
+    return result
+
+
+def insert_records(conn: MySQLConnection, table: str, rows: Iterable[dict], batch_size: int = 500) -> BatchResult:
+    """Insert many records, batch_size rows per multi-row INSERT and commit.
+    Args:
+        conn: Database connection
+        table: Table name
+        rows: Iterable of column_name: value dicts sharing the same keys
+        batch_size: Rows per statement/transaction
+    Returns:
+        BatchResult with the rows written and any per-batch errors
+    """
+    return _write_batches(conn, 'insert_records', 'insert', table, rows, batch_size,
+                          lambda columns: _insert_sql(table, tuple(columns)))
+
+
+def upsert_records(conn: MySQLConnection, table: str, rows: Iterable[dict], batch_size: int = 500,
+                   update_columns: Optional[List[str]] = None) -> BatchResult:
+    """Insert many records, updating rows whose key already exists.
+
+    Uses INSERT ... ON DUPLICATE KEY UPDATE. By default every supplied
+    column outside the primary key is updated.
+    Args:
+        conn: Database connection
+        table: Table name
+        rows: Iterable of column_name: value dicts sharing the same keys
+        batch_size: Rows per statement/transaction
+        update_columns: Columns to overwrite on a duplicate key
+    Returns:
+        BatchResult with the rows written and any per-batch errors
+    """
+    def build_query(columns: List[str]) -> str:
+        if update_columns is None:
+            key = set(get_schema(conn).primary_key(table))
+            updates = [col for col in columns if col not in key] or columns[:1]
+        else:
+            updates = update_columns
+        assignments = ', '.join(f"`{col}` = VALUES(`{col}`)" for col in updates)
+        return f"{_insert_sql(table, tuple(columns))} ON DUPLICATE KEY UPDATE {assignments}"
+
+    return _write_batches(conn, 'upsert_records', 'upsert', table, rows, batch_size, build_query)
+
+
+@lru_cache(maxsize=512)
+def _update_join_sql(table: str, set_columns: Tuple[str, ...], key_columns: Tuple[str, ...],
+                     n_rows: int, condition: str) -> str:
+    # The new values travel as a UNION ALL derived table joined on the key,
+    # so one statement updates the whole batch. Its columns are named c0..cN
+    # so unqualified names in `condition` can only mean the target table.
+    columns = key_columns + set_columns
+    first = 'SELECT ' + ', '.join(f'%s AS c{i}' for i in range(len(columns)))
+    rest = ' UNION ALL SELECT ' + ', '.join(['%s'] * len(columns))
+    on = ' AND '.join(f"t.`{col}` = v.c{i}" for i, col in enumerate(key_columns))
+    assignments = ', '.join(f"t.`{col}` = v.c{len(key_columns) + i}" for i, col in enumerate(set_columns))
+    return (f"UPDATE `{table}` t JOIN ({first}{rest * (n_rows - 1)}) v ON {on} "
+            f"SET {assignments} WHERE {condition}")
+
+
+def update_records(conn: MySQLConnection, table: str, rows: Iterable[dict], key_columns: List[str],
+                   batch_size: int = 500, filters: Optional[Iterable[Tuple]] = None) -> BatchResult:
+    """Update many records by key, one statement per batch.
+
+    Each batch is a single UPDATE joined to its rows, run in its own
+    transaction (a savepoint inside transaction()). ``filters`` use the
+    fetch_page format and restrict which target rows may change, e.g.
+    [('date_paid', 'is_null', None)] to leave already-paid fees alone.
+    Args:
+        conn: Database connection
+        table: Table name
+        rows: Iterable of dicts holding the key columns and the new values
+        key_columns: Columns identifying the row to update
+        batch_size: Rows per statement/transaction
+        filters: Extra conditions on the target rows
+    Returns:
+        BatchResult whose rows count the rows actually changed
+    """
+    condition, condition_params = where_clause(conn, table, filters or ())
+    result = BatchResult()
+    offset = 0
+    for number, batch in enumerate(_batched(rows, batch_size)):
+        cur = conn.cursor()
+        try:
+            set_columns = tuple(col for col in batch[0] if col not in key_columns)
+            query = _update_join_sql(table, set_columns, tuple(key_columns), len(batch), condition)
+            params = [row[col] for row in batch for col in (*key_columns, *set_columns)] + condition_params
+            with _track(conn, 'update_records', table, query, params) as event, transaction(conn):
+                cur.execute(query, params)
+                note_write(conn, table, 'update', batch)
+                event.rows = cur.rowcount
+            result.rows += cur.rowcount
+        except (Error, KeyError) as e:
+            result.errors.append((number, offset, str(e)))
+        finally:
+            cur.close()
+        result.batches += 1
+        offset += len(batch)
+    return result
+
+
+def update_record(conn: MySQLConnection, table: str, data: dict, where: dict) -> int:
+    """Update records in a table.
+    Args:
+        conn: Database connection
+        table: Table name
+        data: Dictionary of column_name: new_value pairs
+        where: Dictionary of column_name: value pairs for WHERE clause
+    Returns:
+        Number of rows affected
+    """
+    query, cur = _prepared(conn, _update_sql(table, tuple(data.keys()), tuple(where.keys())))
+    with _track(conn, 'update_record', table, query, list(data.values()) + list(where.values())) as event:
+        cur.execute(query, list(data.values()) + list(where.values()))
+        _commit(conn)
+        event.rows = cur.rowcount
+    note_write(conn, table, 'update', [dict(where), {**where, **data}])
+    return cur.rowcount
+
+def delete_record(conn: MySQLConnection, table: str, where: dict) -> int:
+    """Delete records from a table.
+    Args:
+        conn: Database connection
+        table: Table name
+        where: Dictionary of column_name: value pairs for WHERE clause
+    Returns:
+        Number of rows affected
+    """
+    query, cur = _prepared(conn, _delete_sql(table, tuple(where.keys())))
+    with _track(conn, 'delete_record', table, query, list(where.values())) as event:
+        cur.execute(query, list(where.values()))
+        _commit(conn)
+        event.rows = cur.rowcount
+    note_write(conn, table, 'delete', [dict(where)])
+    return cur.rowcount
+
+def get_record_by_id(conn: MySQLConnection, table: str, id_column: str, id_value: Any) -> Optional[Tuple]:
+    """Get a single record by its ID.
+    Args:
+        conn: Database connection
+        table: Table name
+        id_column: Name of the ID column
+        id_value: Value of the ID to look up
+    Returns:
+        Record tuple or None if not found
+    """
+    def load():
+        query, cur = _prepared(conn, _select_by_id_sql(table, id_column))
+        rows = _fetch(conn, cur, 'get_record_by_id', table, query, (id_value,))
+        return rows[0] if rows else None
+    return _cached_read(conn, [table], ('get_record_by_id', table, id_column, id_value), load)
+
+
+# Bands stored in student.age_group: ages up to each bound (inclusive) get the next label
+AGE_GROUP_BINS = [float('-inf'), 10, 17, 22, 35, float('inf')]
+AGE_GROUP_LABELS = ["0-10", "11-17", "18-22", "23-35", "36-above"]
+
+
+def calculate_age_group(age: int) -> str:
+    """The student.age_group label for an age."""
+    return AGE_GROUP_LABELS[bisect.bisect_left(AGE_GROUP_BINS, age) - 1]
+
+
+def _aggregate(conn: MySQLConnection, function: str, tables: List[str], sql: str,
+               params: Tuple = ()) -> Tuple[List[str], List[Tuple]]:
+    """Run a grouped query through result_cache; returns (columns, rows).
+
+    Each aggregate is invalidated only by writes to the tables it reads, so
+    a new visit refreshes the visit counts but leaves occupancy cached.
+    """
+    def load():
+        cur = conn.cursor()
+        try:
+            rows = _fetch(conn, cur, function, tables[0], sql, params)
+            return [d[0] for d in cur.description], rows
+        finally:
+            cur.close()
+    return _cached_read(conn, tables, (function, tables[0], sql, params), load)
+
+
+def hostel_occupancy(conn: MySQLConnection) -> Tuple[List[str], List[Tuple]]:
+    """Rooms, beds and occupants of every hostel in one grouped query.
+
+    Read from summary_hostel when the summary tables are installed.
+    Returns:
+        (columns, rows) with hostel_id, name, rooms, capacity, occupants, free
+    """
+    if summaries_installed(conn):
+        return _aggregate(conn, 'hostel_occupancy', ['hostel', 'summary_hostel'], """
+            SELECT h.hostel_id, h.name, COALESCE(s.rooms, 0) AS rooms, COALESCE(s.capacity, 0) AS capacity,
+                   COALESCE(s.occupants, 0) AS occupants,
+                   COALESCE(s.capacity, 0) - COALESCE(s.occupants, 0) AS free
+            FROM hostel h
+            LEFT JOIN summary_hostel s ON s.hostel_id = h.hostel_id
+            ORDER BY h.hostel_id""")
+    return _aggregate(conn, 'hostel_occupancy', ['hostel', 'room', 'allocated'], """
+        SELECT h.hostel_id, h.name, COUNT(r.room_id) AS rooms,
+               COALESCE(SUM(r.capacity), 0) AS capacity,
+               COALESCE(SUM(o.occupants), 0) AS occupants,
+               COALESCE(SUM(r.capacity), 0) - COALESCE(SUM(o.occupants), 0) AS free
+        FROM hostel h
+        LEFT JOIN room r ON r.hostel_id = h.hostel_id
+        LEFT JOIN (SELECT room_id, COUNT(*) AS occupants FROM allocated GROUP BY room_id) o
+               ON o.room_id = r.room_id
+        GROUP BY h.hostel_id, h.name
+        ORDER BY h.hostel_id""")
+
+
+def room_occupancy(conn: MySQLConnection, hostel_id: Any = None) -> Tuple[List[str], List[Tuple]]:
+    """Capacity and occupants of each room, in one hostel or in all of them.
+    Returns:
+        (columns, rows) with room_id, hostel_id, type, capacity, occupants, free
+    """
+    where, params = ("WHERE r.hostel_id = %s", (hostel_id,)) if hostel_id is not None else ("", ())
+    return _aggregate(conn, 'room_occupancy', ['room', 'allocated'], f"""
+        SELECT r.room_id, r.hostel_id, r.type, r.capacity, COUNT(a.student_id) AS occupants,
+               r.capacity - COUNT(a.student_id) AS free
+        FROM room r
+        LEFT JOIN allocated a ON a.room_id = r.room_id
+        {where}
+        GROUP BY r.room_id, r.hostel_id, r.type, r.capacity
+        ORDER BY r.room_id""", params)
+
+
+def unallocated_students(conn: MySQLConnection, limit: Optional[int] = None) -> List[int]:
+    """IDs of students without a room, in ID order."""
+    sql = """
+        SELECT s.student_id FROM student s
+        LEFT JOIN allocated a ON a.student_id = s.student_id
+        WHERE a.student_id IS NULL
+        ORDER BY s.student_id"""
+    params: Tuple = ()
+    if limit is not None:
+        sql += " LIMIT %s"
+        params = (int(limit),)
+    return [row[0] for row in _aggregate(conn, 'unallocated_students', ['student', 'allocated'], sql, params)[1]]
+
+
+def dues_summary(conn: MySQLConnection) -> Tuple[List[str], List[Tuple]]:
+    """Totals over all unpaid fees: students owing, fee count, amount and overdue amount."""
+    return _aggregate(conn, 'dues_summary', ['fees'], """
+        SELECT COUNT(DISTINCT student_id) AS students, COUNT(*) AS open_fees,
+               COALESCE(SUM(amount), 0) AS pending,
+               COALESCE(SUM(CASE WHEN due_date < CURDATE() THEN amount ELSE 0 END), 0) AS overdue
+        FROM fees
+        WHERE date_paid IS NULL""")
+
+
+def pending_dues(conn: MySQLConnection, limit: int = 100) -> Tuple[List[str], List[Tuple]]:
+    """Students with the largest unpaid totals, grouped in one query.
+
+    With the summary tables installed the students are picked from the
+    index on summary_student.pending, and only their fees are grouped.
+    Args:
+        conn: Database connection
+        limit: Number of students to return
+    Returns:
+        (columns, rows) with student_id, f_name, l_name, open_fees, pending, oldest_due
+    """
+    if summaries_installed(conn):
+        return _aggregate(conn, 'pending_dues', ['summary_student', 'student', 'fees'], """
+            SELECT s.student_id, s.f_name, s.l_name, d.open_fees, d.pending,
+                   (SELECT MIN(f.due_date) FROM fees f
+                    WHERE f.student_id = d.student_id AND f.date_paid IS NULL) AS oldest_due
+            FROM (SELECT student_id, open_fees, pending FROM summary_student
+                  WHERE pending > 0 ORDER BY pending DESC, student_id LIMIT %s) d
+            JOIN student s ON s.student_id = d.student_id
+            ORDER BY d.pending DESC, s.student_id""", (int(limit),))
+    return _aggregate(conn, 'pending_dues', ['fees', 'student'], """
+        SELECT s.student_id, s.f_name, s.l_name, d.open_fees, d.pending, d.oldest_due
+        FROM (SELECT student_id, COUNT(*) AS open_fees, SUM(amount) AS pending, MIN(due_date) AS oldest_due
+              FROM fees WHERE date_paid IS NULL GROUP BY student_id
+              ORDER BY pending DESC, student_id LIMIT %s) d
+        JOIN student s ON s.student_id = d.student_id
+        ORDER BY d.pending DESC, s.student_id""", (int(limit),))
+
+
+def visit_counts(conn: MySQLConnection, since: Optional[datetime.date] = None,
+                 limit: int = 100) -> Tuple[List[str], List[Tuple]]:
+    """Students with the most visits, optionally only visits on or after ``since``.
+
+    All-time counts come from summary_student when it is installed.
+    Returns:
+        (columns, rows) with student_id, f_name, l_name, visits, last_visit
+    """
+    if since is None and summaries_installed(conn):
+        return _aggregate(conn, 'visit_counts', ['summary_student', 'student'], """
+            SELECT s.student_id, s.f_name, s.l_name, v.visits, v.last_visit
+            FROM (SELECT student_id, visits, last_visit FROM summary_student
+                  WHERE visits > 0 ORDER BY visits DESC, student_id LIMIT %s) v
+            JOIN student s ON s.student_id = v.student_id
+            ORDER BY v.visits DESC, s.student_id""", (int(limit),))
+    where, params = ("WHERE visit_date >= %s", (since,)) if since else ("", ())
+    return _aggregate(conn, 'visit_counts', ['visits', 'student'], f"""
+        SELECT s.student_id, s.f_name, s.l_name, v.visits, v.last_visit
+        FROM (SELECT student_id, COUNT(*) AS visits, MAX(visit_date) AS last_visit
+              FROM visits {where} GROUP BY student_id
+              ORDER BY visits DESC, student_id LIMIT %s) v
+        JOIN student s ON s.student_id = v.student_id
+        ORDER BY v.visits DESC, s.student_id""", params + (int(limit),))
+
+
+# Summary tables maintained by the triggers in summary.sql:
+# table -> (key column, value columns, base table, SELECT computing the rows from scratch)
+SUMMARIES: Dict[str, Tuple[str, Tuple[str, ...], str, str]] = {
+    'summary_hostel': ('hostel_id', ('rooms', 'capacity', 'occupants'), 'hostel', """
+        SELECT h.hostel_id, COUNT(r.room_id) AS rooms, COALESCE(SUM(r.capacity), 0) AS capacity,
+               COALESCE(SUM(o.occupants), 0) AS occupants
+        FROM hostel h
+        LEFT JOIN room r ON r.hostel_id = h.hostel_id
+        LEFT JOIN (SELECT room_id, COUNT(*) AS occupants FROM allocated GROUP BY room_id) o
+               ON o.room_id = r.room_id
+        GROUP BY h.hostel_id"""),
+    'summary_student': ('student_id', ('open_fees', 'pending', 'visits', 'last_visit'), 'student', """
+        SELECT s.student_id, COALESCE(f.open_fees, 0) AS open_fees, COALESCE(f.pending, 0) AS pending,
+               COALESCE(v.visits, 0) AS visits, v.last_visit
+        FROM student s
+        LEFT JOIN (SELECT student_id, COUNT(*) AS open_fees, SUM(amount) AS pending
+                   FROM fees WHERE date_paid IS NULL GROUP BY student_id) f ON f.student_id = s.student_id
+        LEFT JOIN (SELECT student_id, COUNT(*) AS visits, MAX(visit_date) AS last_visit
+                   FROM visits GROUP BY student_id) v ON v.student_id = s.student_id"""),
+}
+
+
+def summaries_installed(conn: MySQLConnection) -> bool:
+    """Whether the summary tables from summary.sql exist in this schema."""
+    tables = get_schema(conn).tables
+    return all(table in tables for table in SUMMARIES)
+
+
+def rebuild_summaries(conn: MySQLConnection) -> Dict[str, int]:
+    """Recompute every summary table from the base tables in one transaction.
+    Returns:
+        Rows written per summary table
+    """
+    written = {}
+    with transaction(conn):
+        cur = conn.cursor()
+        try:
+            for table, (key, values, _, select) in SUMMARIES.items():
+                columns = ', '.join(f'`{col}`' for col in (key,) + values)
+                with _track(conn, 'rebuild_summaries', table, f"DELETE FROM `{table}`"):
+                    cur.execute(f"DELETE FROM `{table}`")
+                sql = f"INSERT INTO `{table}` ({columns}) {select}"
+                with _track(conn, 'rebuild_summaries', table, sql) as event:
+                    cur.execute(sql)
+                    event.rows = written[table] = cur.rowcount
+                note_write(conn, table)
+        finally:
+            cur.close()
+    return written
+
+
+def verify_summaries(conn: MySQLConnection) -> Dict[str, List[Tuple]]:
+    """Compare the summary tables with a fresh computation.
+
+    Returns the drifted rows per summary table as ``(key, expected, stored)``,
+    where expected/stored are tuples of the value columns (None for a row
+    that is missing on that side). Empty lists mean no drift.
+    """
+    drift: Dict[str, List[Tuple]] = {}
+    cur = conn.cursor()
+    try:
+        for table, (key, values, base, select) in SUMMARIES.items():
+            same = ' AND '.join(f"e.`{col}` <=> s.`{col}`" for col in values)
+            expected = ', '.join(f"e.`{col}`" for col in values)
+            stored = ', '.join(f"s.`{col}`" for col in values)
+            nulls = ', '.join('NULL' for _ in values)
+            sql = f"""
+                SELECT e.`{key}`, 1, s.`{key}` IS NOT NULL, {expected}, {stored}
+                FROM ({select}) e LEFT JOIN `{table}` s ON s.`{key}` = e.`{key}`
+                WHERE s.`{key}` IS NULL OR NOT ({same})
+                UNION ALL
+                SELECT s.`{key}`, 0, 1, {nulls}, {stored}
+                FROM `{table}` s LEFT JOIN `{base}` b ON b.`{key}` = s.`{key}`
+                WHERE b.`{key}` IS NULL"""
+            rows = _fetch(conn, cur, 'verify_summaries', table, sql)
+            n = len(values)
+            drift[table] = [(row[0], tuple(row[3:3 + n]) if row[1] else None,
+                             tuple(row[3 + n:]) if row[2] else None) for row in rows]
+    finally:
+        cur.close()
+    return drift
+
+
+def _summary_row(conn: MySQLConnection, function: str, table: str, key_value: Any) -> Optional[Dict[str, Any]]:
+    key, values, _, _ = SUMMARIES[table]
+    columns = ', '.join(f'`{col}`' for col in values)
+
+    def load():
+        cur = conn.cursor()
+        try:
+            rows = _fetch(conn, cur, function, table, f"SELECT {columns} FROM `{table}` WHERE `{key}` = %s", (key_value,))
+        finally:
+            cur.close()
+        return dict(zip(values, rows[0])) if rows else None
+    return _cached_read(conn, [table], (function, table, key_value), load)
+
+
+def hostel_summary(conn: MySQLConnection, hostel_id: Any) -> Optional[Dict[str, Any]]:
+    """Rooms, capacity and occupants of one hostel: a primary-key lookup in summary_hostel."""
+    return _summary_row(conn, 'hostel_summary', 'summary_hostel', hostel_id)
+
+
+def student_summary(conn: MySQLConnection, student_id: Any) -> Optional[Dict[str, Any]]:
+    """Open fees, pending amount, visit count and last visit of one student,
+    as a primary-key lookup in summary_student."""
+    return _summary_row(conn, 'student_summary', 'summary_student', student_id)
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=int(os.getenv('DB_PARALLEL_WORKERS', '8')),
+                                           thread_name_prefix='db-read')
+        return _executor
+
+
+_NO_SLOT = object()  # _run_pooled result when no pooled connection was free
+
+
+def _run_pooled(pool: ConnectionPool, fn: Callable, args: tuple, wait: bool = True) -> Any:
+    if wait:
+        with pool.connection() as conn:
+            return fn(conn, *args)
+    conn = pool.try_acquire()
+    if conn is None:
+        return _NO_SLOT
+    try:
+        return fn(conn, *args)
+    finally:
+        pool.release(conn)
+
+
+def run_parallel(pool: ConnectionPool, calls: Dict[str, tuple], conn: Optional[MySQLConnection] = None) -> Dict[str, Any]:
+    """Run independent reads concurrently, each on its own pooled connection.
+
+    ``calls`` maps a name to ``(function, *args)`` where function takes the
+    connection first, e.g. ``{'page': (fetch_page, 'fees', 50)}``. If the
+    caller already holds ``conn``, the first call runs on it in the current
+    thread while the others run on the worker threads, so total latency is
+    that of the slowest call rather than the sum. Workers then never wait
+    for the pool: a call that finds no free connection runs afterwards on
+    ``conn``, so callers that each hold a connection cannot starve each
+    other of the rest.
+    Returns:
+        Dict of name -> result; the first exception raised is re-raised
+        once all calls have finished
+    """
+    items = list(calls.items())
+    local = items.pop(0) if conn is not None and items else None
+    futures = {}
+    for name, (fn, *args) in items:
+        # copy_context keeps capture_queries() collecting events from the workers
+        futures[name] = _get_executor().submit(contextvars.copy_context().run, _run_pooled, pool, fn, tuple(args),
+                                               conn is None)
+    results: Dict[str, Any] = {}
+    error: Optional[BaseException] = None
+    if local is not None:
+        name, (fn, *args) = local
+        try:
+            results[name] = fn(conn, *args)
+        except Exception as e:
+            error = e
+    for name, future in futures.items():
+        try:
+            result = future.result()
+            if result is _NO_SLOT:
+                fn, *args = calls[name]
+                result = fn(conn, *args)
+            results[name] = result
+        except Exception as e:
+            error = error or e
+    if error is not None:
+        raise error
+    return {name: results[name] for name in calls}
+
+
+async def gather_reads(pool: ConnectionPool, calls: Dict[str, tuple]) -> Dict[str, Any]:
+    """asyncio version of run_parallel: each call runs via asyncio.to_thread."""
+    names = list(calls)
+    results = await asyncio.gather(*(asyncio.to_thread(_run_pooled, pool, calls[name][0], tuple(calls[name][1:]))
+                                     for name in names))
+    return dict(zip(names, results))
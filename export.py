@@ -0,0 +1,62 @@
+"""Export tables or a query to CSV, gzipped CSV or Parquet files.
+
+Rows are streamed from the server in chunks and written as they arrive, so
+memory use stays the same however large the table is. Several tables are
+exported at once on pooled connections.
+
+Example:
+    python export.py --all --format parquet --output-dir exports/
+    python export.py visits fees --format csv.gz
+    python export.py --query "SELECT * FROM fees WHERE date_paid IS NULL" --output open_fees.csv
+"""
+import argparse
+import os
+import time
+
+import db
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('tables', nargs='*', help='Tables to export')
+    parser.add_argument('--all', action='store_true', help='Export every table')
+    parser.add_argument('--query', help='Export the result of this SELECT instead')
+    parser.add_argument('--output', help='File for --query (default: export.<format>)')
+    parser.add_argument('--output-dir', default='exports', help='Directory for table exports')
+    parser.add_argument('--format', choices=db.EXPORT_FORMATS, default='csv')
+    parser.add_argument('--chunk-size', type=int, default=50000, help='Rows per fetch / Parquet row group')
+    parser.add_argument('--workers', type=int, default=4, help='Tables exported at once')
+    parser.add_argument('--database', help='Schema to use (default: DB_DATABASE)')
+    args = parser.parse_args()
+
+    if args.database:
+        os.environ['DB_DATABASE'] = args.database
+    if args.query:
+        conn = db.get_connection()
+        try:
+            result = db.export_query(conn, args.query, args.output or f'export.{args.format}', args.format,
+                                     chunk_size=args.chunk_size)
+        finally:
+            conn.close()
+        results = {'query': result}
+        elapsed = result.seconds
+    else:
+        pool = db.get_pool(max_size=args.workers)
+        with pool.connection() as conn:
+            tables = db.get_schema(conn).tables if args.all else args.tables
+        if not tables:
+            parser.error('give table names, --all or --query')
+        os.environ.setdefault('DB_PARALLEL_WORKERS', str(args.workers))
+        started = time.perf_counter()
+        results = db.export_tables(pool, tables, args.output_dir, args.format, args.chunk_size)
+        elapsed = time.perf_counter() - started
+
+    for name, result in results.items():
+        print(f'{name:20} {result.rows:>12,} rows {result.bytes / 1e6:>10,.1f} MB {result.seconds:>8.1f}s '
+              f'{result.rows_per_second:>12,.0f} rows/s  {result.path}')
+    total = sum(result.rows for result in results.values())
+    print(f'{total:,} rows in {elapsed:.1f}s ({total / elapsed if elapsed else 0:,.0f} rows/s overall)')
+
+
+if __name__ == '__main__':
+    main()
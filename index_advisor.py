@@ -0,0 +1,502 @@
+"""Recommend secondary indexes for the statements the app actually runs.
+
+Statements come from two places: everything db.py issues while the
+benchmark.py workload and the UI's filtered reads run (captured with
+db.capture_queries), and the SELECT/UPDATE/DELETE statements inside each
+stored routine body, with the routine's parameters bound to sample values.
+Each statement is EXPLAINed; where a table is read by a full scan or needs a
+filesort, the statement's predicates are turned into a composite index:
+equality columns first, then one range column, then the ORDER BY columns.
+
+Recommendations are written to an idempotent migration script (it checks
+INFORMATION_SCHEMA.STATISTICS before each CREATE INDEX). By default nothing
+else touches the schema: only EXPLAIN runs. To report before/after costs the
+plans can be EXPLAINed again with the candidate indexes in place, either
+built INVISIBLE, used only by this session and dropped afterwards
+(--try-invisible), or created for real by running the migration (--apply).
+Both build full indexes and take metadata locks, so run them against a copy
+of production rather than the live schema.
+
+Example:
+    python index_advisor.py --output migrations/add_indexes.sql
+    python index_advisor.py --try-invisible
+    python index_advisor.py --apply --analyze
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import db
+from benchmark import Fixtures, build_cases
+from db import Error, MySQLConnection
+
+
+EXPLAINABLE = re.compile(r'^\s*(SELECT|UPDATE|DELETE)\b', re.I)
+MAX_INDEX_COLUMNS = 4
+_KEYWORDS = {'WHERE', 'JOIN', 'INNER', 'LEFT', 'RIGHT', 'CROSS', 'STRAIGHT_JOIN', 'ON', 'USING', 'SET',
+             'ORDER', 'GROUP', 'HAVING', 'LIMIT', 'FOR', 'UNION', 'NATURAL', 'WINDOW', 'LOCK', 'AS'}
+_TABLE_REF = re.compile(r'\b(?:FROM|JOIN|UPDATE)\s+`?(\w+)`?(?:\s+(?:AS\s+)?`?(\w+)`?)?', re.I)
+_COLUMN = r'(?:`?(\w+)`?\.)?`?([A-Za-z_]\w*)`?'
+_PREDICATE = re.compile(_COLUMN + r'\s*(<=>|<>|!=|>=|<=|=|<|>|\bNOT\s+LIKE\b|\bLIKE\b|\bBETWEEN\b'
+                        r'|\bIS\s+NOT\s+NULL\b|\bIS\s+NULL\b|\bNOT\s+IN\b|\bIN\b)(\s*' + _COLUMN + r')?', re.I)
+_EQUALITY_OPS = {'=', '<=>', 'IS NULL', 'IN'}
+_RANGE_OPS = {'<', '>', '<=', '>=', 'BETWEEN', 'LIKE'}
+
+log = logging.getLogger('index_advisor')
+
+
+@dataclass
+class Statement:
+    source: str
+    sql: str
+    params: Tuple = ()
+    before: Optional['Plan'] = None
+    after: Optional['Plan'] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class Plan:
+    cost: Optional[float]
+    tables: Dict[str, Dict[str, Any]]  # in join order
+    filesort: bool = False
+    analyze_ms: Optional[float] = None
+
+
+@dataclass
+class Recommendation:
+    table: str
+    columns: Tuple[str, ...]
+    reasons: List[str] = field(default_factory=list)
+
+    @property
+    def name(self) -> str:
+        return f"ix_{self.table}_{'_'.join(self.columns)}"[:64]
+
+
+# --- Collecting statements ------------------------------------------------
+
+def access_patterns(conn: MySQLConnection, fixtures: Fixtures) -> Dict[str, Any]:
+    """Reads the UI issues through its filters, on top of benchmark.py's cases."""
+    visit_day = fixtures.mid_visit[2] if fixtures.mid_visit else None
+    patterns = {
+        'open fees': lambda: db.fetch_page(conn, 'fees', 50, filters=[('date_paid', 'is_null', None)]),
+        'open fees count': lambda: db.count_rows(conn, 'fees', filters=[('date_paid', 'is_null', None)]),
+        'fees of a student': lambda: db.fetch_page(conn, 'fees', 50, filters=[
+            ('student_id', 'eq', fixtures.pick(fixtures.students))], order_by=['due_date']),
+        'students by last name': lambda: db.fetch_page(conn, 'student', 50, filters=[('l_name', 'prefix', 'Re')]),
+        'students by first name': lambda: db.fetch_page(conn, 'student', 50, filters=[('f_name', 'prefix', 'Ar')]),
+        'visitors by last name': lambda: db.fetch_page(conn, 'visitor', 50, filters=[('l_name', 'prefix', 'Pa')]),
+        'latest visits': lambda: db.fetch_page(conn, 'visits', 50, order_by=['visit_date'], descending=True),
+        'occupants of a room': lambda: db.fetch_page(conn, 'allocated', 50, filters=[
+            ('room_id', 'eq', fixtures.pick(fixtures.rooms))]),
+    }
+    if visit_day is not None:
+        patterns['visits in a month'] = lambda: db.fetch_page(conn, 'visits', 50, filters=[
+            ('visit_date', 'between', (visit_day.replace(day=1), visit_day))])
+    return patterns
+
+
+def collect_workload(conn: MySQLConnection, fixtures: Fixtures) -> List[Statement]:
+    """Run the workload once and keep one instance of each distinct statement.
+
+    Routine calls are left out: their bodies are read by collect_routines
+    instead of being executed. Cases that fail with a database error are
+    logged and skipped.
+    """
+    cases = {label: fn for label, fn in build_cases(conn, fixtures).items()
+             if not label.startswith('call_routine(')}
+    cases.update(access_patterns(conn, fixtures))
+    with db.capture_queries() as events:
+        for label, fn in cases.items():
+            try:
+                fn()
+            except Error as e:
+                log.warning('Skipped workload case %s: %s', label, e)
+    statements: Dict[str, Statement] = {}
+    for event in events:
+        if event.cached or event.error or not EXPLAINABLE.match(event.sql or ''):
+            continue
+        if not isinstance(event.params, (list, tuple, type(None))):
+            continue
+        key = ' '.join(event.sql.split())
+        statements.setdefault(key, Statement(f'{event.function}({event.table or ""})', event.sql,
+                                             tuple(event.params or ())))
+    return list(statements.values())
+
+
+def _routine_statements(body: str) -> List[str]:
+    """SELECT/UPDATE/DELETE statements inside a routine body, cut at the
+    end of an enclosing parenthesis (IF EXISTS (SELECT ...), RETURN (SELECT ...))."""
+    found = []
+    start_of = re.compile(r'\b(SELECT|UPDATE|DELETE\s+FROM)\b', re.I)
+    for piece in body.split(';'):
+        match = start_of.search(piece)
+        while match:
+            text, depth = piece[match.start():], 0
+            for i, ch in enumerate(text):
+                depth += {'(': 1, ')': -1}.get(ch, 0)
+                if depth < 0:
+                    text = text[:i]
+                    break
+            # SELECT ... INTO local variables only changes where the row goes
+            found.append(re.sub(r'\bINTO\s+@?\w+(\s*,\s*@?\w+)*\s+(?=FROM\b)', '', text, flags=re.I).strip())
+            match = start_of.search(piece, match.start() + len(text))
+    return found
+
+
+def collect_routines(conn: MySQLConnection, fixtures: Fixtures) -> List[Statement]:
+    """Statements from stored routine bodies with parameters and locals bound."""
+    schema = db.get_schema(conn)
+    statements = []
+    for routine_type in ('FUNCTION', 'PROCEDURE'):
+        for name in schema.routine_names(routine_type):
+            params, _ = schema.procedure_info(name, routine_type)
+            body = schema.definitions.get((routine_type, name)) or ''
+            declared = [(var, None, var_type) for var, var_type in
+                        re.findall(r'\bDECLARE\s+(\w+)\s+(\w+)', body, re.I)]
+            variables = [p for p in params + declared if p[0]]
+            values = dict(zip([p[0].lower() for p in variables], fixtures.routine_args(variables)))
+            for text in _routine_statements(body):
+                bound: List[Any] = []
+
+                def bind(match):
+                    bound.append(values[match.group(0).lower()])
+                    return '%s'
+                if values:
+                    # Literal % signs must survive the connector's %s formatting
+                    pattern = r'(?<![.`@\w])(' + '|'.join(re.escape(v) for v in values) + r')(?![\w`])'
+                    text = re.sub(pattern, bind, text.replace('%', '%%'), flags=re.I)
+                    if not bound:
+                        text = text.replace('%%', '%')
+                statements.append(Statement(f'{name}()', text, tuple(bound)))
+    return statements
+
+
+# --- Plans ----------------------------------------------------------------
+
+def _plan_tables(node: Any, tables: Dict[str, Dict[str, Any]]) -> None:
+    if isinstance(node, dict):
+        if 'table_name' in node:
+            tables[node['table_name']] = {
+                'access_type': node.get('access_type'),
+                'key': node.get('key'),
+                'rows': node.get('rows_examined_per_scan'),
+            }
+        for value in node.values():
+            _plan_tables(value, tables)
+    elif isinstance(node, list):
+        for value in node:
+            _plan_tables(value, tables)
+
+
+def explain(conn: MySQLConnection, statement: Statement, analyze: bool = False) -> Plan:
+    """EXPLAIN FORMAT=JSON, plus EXPLAIN ANALYZE for SELECTs when asked.
+
+    EXPLAIN ANALYZE executes the query, so it is never used on writes.
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute('EXPLAIN FORMAT=JSON ' + statement.sql, statement.params)
+        doc = json.loads(cur.fetchall()[0][0])
+        tables: Dict[str, Dict[str, Any]] = {}
+        _plan_tables(doc, tables)
+        cost = doc.get('query_block', {}).get('cost_info', {}).get('query_cost')
+        plan = Plan(float(cost) if cost is not None else None, tables, '"using_filesort": true' in json.dumps(doc))
+        if analyze and statement.sql.lstrip().upper().startswith('SELECT'):
+            cur.execute('EXPLAIN ANALYZE ' + statement.sql, statement.params)
+            text = cur.fetchall()[0][0]
+            timing = re.search(r'actual time=[\d.]+\.\.([\d.]+)', text)
+            plan.analyze_ms = float(timing.group(1)) if timing else None
+        return plan
+    finally:
+        cur.close()
+
+
+def explain_all(conn: MySQLConnection, statements: List[Statement], attr: str, analyze: bool) -> None:
+    for statement in statements:
+        try:
+            setattr(statement, attr, explain(conn, statement, analyze))
+        except (Error, ValueError, KeyError, IndexError) as e:
+            statement.error = str(e)
+
+
+# --- Recommendations ------------------------------------------------------
+
+def existing_indexes(conn: MySQLConnection) -> Dict[str, List[Tuple[str, ...]]]:
+    """Column lists of every index in the current schema, per table."""
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT TABLE_NAME, INDEX_NAME, COLUMN_NAME FROM INFORMATION_SCHEMA.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX""")
+        indexes: Dict[Tuple[str, str], List[str]] = {}
+        for table, index, column in cur.fetchall():
+            indexes.setdefault((table, index), []).append(column)
+    finally:
+        cur.close()
+    by_table: Dict[str, List[Tuple[str, ...]]] = {}
+    for (table, _), columns in indexes.items():
+        by_table.setdefault(table, []).append(tuple(columns))
+    return by_table
+
+
+def _aliases(sql: str) -> Dict[str, str]:
+    aliases = {}
+    for table, alias in _TABLE_REF.findall(sql):
+        aliases[table] = table
+        if alias and alias.upper() not in _KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+
+def _conditions(sql: str) -> str:
+    """The WHERE/ON/HAVING text of a statement (not SET lists or select lists)."""
+    parts = re.split(r'\b(WHERE|ON|HAVING|ORDER\s+BY|GROUP\s+BY|LIMIT|SET|JOIN|FROM|SELECT)\b', sql, flags=re.I)
+    keep, text = False, []
+    for part in parts:
+        keyword = ' '.join(part.upper().split())
+        if keyword in ('WHERE', 'ON', 'HAVING'):
+            keep = True
+        elif keyword in ('ORDER BY', 'GROUP BY', 'LIMIT', 'SET', 'JOIN', 'FROM', 'SELECT'):
+            keep = False
+        elif keep:
+            text.append(part)
+    return ' AND '.join(text)
+
+
+def _order_columns(sql: str) -> List[Tuple[Optional[str], str]]:
+    match = re.search(r'\b(?:ORDER|GROUP)\s+BY\s+(.*?)(?:\bLIMIT\b|\bHAVING\b|$)', sql, re.I | re.S)
+    if not match:
+        return []
+    columns = []
+    for item in match.group(1).split(','):
+        ref = re.match(r'\s*' + _COLUMN + r'\s*(ASC|DESC)?\s*$', item, re.I)
+        if not ref:
+            break
+        columns.append((ref.group(1), ref.group(2)))
+    return columns
+
+
+def candidate_columns(statement: Statement, table: str, schema: db.SchemaMetadata) -> Tuple[str, ...]:
+    """Equality columns, then one range column, then ORDER BY columns of ``table``."""
+    aliases = _aliases(statement.sql)
+    tables_in_statement = {t for t in aliases.values() if t in schema.columns}
+    columns = [row[0] for row in schema.describe(table)]
+
+    def owner(qualifier: Optional[str], column: str) -> Optional[str]:
+        if qualifier:
+            return aliases.get(qualifier)
+        # An unqualified column belongs to the only table in the statement that has it
+        owners = [t for t in tables_in_statement if column in {row[0] for row in schema.describe(t)}]
+        return owners[0] if len(owners) == 1 else None
+
+    equality: List[str] = []
+    ranges: List[str] = []
+    for qualifier, column, op, rhs, rhs_qualifier, rhs_column in _PREDICATE.findall(_conditions(statement.sql)):
+        op = ' '.join(op.upper().split())
+        refs = [(qualifier, column)]
+        if rhs_column and rhs_column.upper() not in ('NULL', 'TRUE', 'FALSE'):
+            refs.append((rhs_qualifier, rhs_column))
+        for ref_qualifier, ref_column in refs:
+            if ref_column not in columns or owner(ref_qualifier, ref_column) != table:
+                continue
+            if op in _EQUALITY_OPS and ref_column not in equality:
+                equality.append(ref_column)
+            elif op in _RANGE_OPS and ref_column not in ranges:
+                ranges.append(ref_column)
+    chosen = list(equality)
+    ranges = [col for col in ranges if col not in chosen]
+    order = [col for qualifier, col in _order_columns(statement.sql)
+             if col in columns and owner(qualifier, col) == table]
+    if ranges:
+        chosen.append(ranges[0])
+    # ORDER BY can only be served from the index if no other range column sits in between
+    if not ranges or (order and order[0] == ranges[0]):
+        chosen.extend(col for col in order if col not in chosen)
+    return tuple(chosen[:MAX_INDEX_COLUMNS])
+
+
+def _covered(columns: Tuple[str, ...], indexes: List[Tuple[str, ...]]) -> bool:
+    return any(index[:len(columns)] == columns for index in indexes)
+
+
+def recommend(conn: MySQLConnection, statements: List[Statement], min_rows: int) -> List[Recommendation]:
+    """Composite indexes for tables read by full scans or filesorts."""
+    schema = db.get_schema(conn)
+    indexes = existing_indexes(conn)
+    found: Dict[Tuple[str, Tuple[str, ...]], Recommendation] = {}
+    for statement in statements:
+        if not statement.before:
+            continue
+        for position, (table, access) in enumerate(statement.before.tables.items()):
+            if table not in schema.columns:
+                continue
+            scans = access['access_type'] in ('ALL', 'index') and (access['rows'] or 0) >= min_rows
+            # A filesort sorts the rows of the first table in the join order
+            filesort = statement.before.filesort and position == 0
+            if not scans and not filesort:
+                continue
+            columns = candidate_columns(statement, table, schema)
+            # InnoDB appends the missing primary key columns to every secondary
+            # index, so trailing key columns it would add anyway are dropped.
+            pk = tuple(schema.primary_key(table))
+            for k in range(1, len(columns)):
+                prefix = columns[:k]
+                if (prefix + tuple(col for col in pk if col not in prefix))[:len(columns)] == columns:
+                    columns = prefix
+                    break
+            if not columns or columns[:len(pk)] == pk or _covered(columns, indexes.get(table, [])):
+                continue
+            rec = found.setdefault((table, columns), Recommendation(table, columns))
+            rec.reasons.append(f"{statement.source}: {access['access_type']} over ~{access['rows']} rows"
+                               + (', filesort' if filesort else ''))
+    # A candidate that is a left prefix of another on the same table is redundant
+    recs = list(found.values())
+    return [rec for rec in recs if not any(
+        other is not rec and other.table == rec.table and len(other.columns) > len(rec.columns)
+        and other.columns[:len(rec.columns)] == rec.columns for other in recs)]
+
+
+# --- Migration ------------------------------------------------------------
+
+def migration_script(recommendations: List[Recommendation]) -> str:
+    """SQL that creates each recommended index unless an index of that name exists."""
+    lines = ['-- Generated by index_advisor.py; safe to run more than once.', '']
+    for rec in recommendations:
+        columns = ', '.join(f'`{col}`' for col in rec.columns)
+        lines += [f'-- {reason}' for reason in rec.reasons[:5]]
+        lines += [
+            "SET @ddl = IF((SELECT COUNT(*) FROM INFORMATION_SCHEMA.STATISTICS"
+            f" WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = '{rec.table}' AND INDEX_NAME = '{rec.name}') = 0,",
+            f"    'CREATE INDEX `{rec.name}` ON `{rec.table}` ({columns})', 'DO 0');",
+            'PREPARE stmt FROM @ddl;',
+            'EXECUTE stmt;',
+            'DEALLOCATE PREPARE stmt;',
+            '',
+        ]
+    return '\n'.join(lines)
+
+
+def run_script(conn: MySQLConnection, script: str) -> None:
+    """Execute a migration script statement by statement."""
+    cur = conn.cursor()
+    try:
+        body = '\n'.join(line for line in script.splitlines() if not line.lstrip().startswith('--'))
+        for statement in body.split(';'):
+            if statement.strip():
+                cur.execute(statement)
+    finally:
+        cur.close()
+
+
+def evaluate_invisible(conn: MySQLConnection, statements: List[Statement],
+                       recommendations: List[Recommendation], analyze: bool) -> None:
+    """EXPLAIN again with the candidates built as invisible indexes, then drop them.
+
+    Invisible indexes are ignored by every other session, so the live
+    application's plans are unaffected while this runs.
+    """
+    cur = conn.cursor()
+    created = []
+    try:
+        for rec in recommendations:
+            columns = ', '.join(f'`{col}`' for col in rec.columns)
+            cur.execute(f"ALTER TABLE `{rec.table}` ADD INDEX `{rec.name}` ({columns}) INVISIBLE")
+            created.append(rec)
+        cur.execute("SET SESSION optimizer_switch = 'use_invisible_indexes=on'")
+        try:
+            explain_all(conn, statements, 'after', analyze)
+        finally:
+            cur.execute("SET SESSION optimizer_switch = 'use_invisible_indexes=off'")
+    finally:
+        for rec in created:
+            cur.execute(f"ALTER TABLE `{rec.table}` DROP INDEX `{rec.name}`")
+        cur.close()
+
+
+def _fmt(value: Optional[float], unit: str = '') -> str:
+    return f'{value:,.1f}{unit}' if value is not None else '-'
+
+
+def report(statements: List[Statement], recommendations: List[Recommendation]) -> None:
+    print(f'\n{len(recommendations)} index(es) recommended:')
+    for rec in recommendations:
+        print(f"  {rec.table}({', '.join(rec.columns)})  <- {len(rec.reasons)} statement(s)")
+    print(f"\n{'statement':40} {'cost before':>12} {'cost after':>12} {'ms before':>10} {'ms after':>10}  access")
+    for statement in statements:
+        if statement.before is None:
+            continue
+        after = statement.after
+        access = ', '.join(
+            f"{table}:{info['access_type']}"
+            + (f"->{after.tables[table]['access_type']}({after.tables[table]['key']})"
+               if after and table in after.tables else '')
+            for table, info in statement.before.tables.items())
+        print(f'{statement.source[:40]:40} {_fmt(statement.before.cost):>12} '
+              f'{_fmt(after.cost if after else None):>12} {_fmt(statement.before.analyze_ms):>10} '
+              f'{_fmt(after.analyze_ms if after else None):>10}  {access}')
+    failed = [s for s in statements if s.error]
+    if failed:
+        print(f'\n{len(failed)} statement(s) could not be explained:')
+        for statement in failed:
+            print(f"  {statement.source}: {statement.error}\n    {' '.join(statement.sql.split())[:160]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--database', help='Schema to analyse (default: DB_DATABASE)')
+    parser.add_argument('--output', default='index_migration.sql', help='Where to write the migration script')
+    parser.add_argument('--min-rows', type=int, default=100, help='Ignore full scans of smaller tables')
+    parser.add_argument('--analyze', action='store_true', help='Also time SELECTs with EXPLAIN ANALYZE (runs them)')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--try-invisible', action='store_true',
+                      help='Build the indexes INVISIBLE to measure them, then drop them (builds full indexes)')
+    mode.add_argument('--apply', action='store_true', help='Run the migration and measure the new plans')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if args.database:
+        os.environ['DB_DATABASE'] = args.database
+    # Every read has to reach the server to be captured with its plan
+    db.result_cache.max_bytes = 0
+
+    conn = db.get_connection()
+    try:
+        fixtures = Fixtures(conn, random.Random(args.seed))
+        statements = collect_workload(conn, fixtures) + collect_routines(conn, fixtures)
+        explain_all(conn, statements, 'before', args.analyze)
+        recommendations = recommend(conn, statements, args.min_rows)
+
+        script = migration_script(recommendations)
+        out_dir = os.path.dirname(args.output)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        with open(args.output, 'w') as f:
+            f.write(script)
+
+        if recommendations:
+            if args.apply:
+                run_script(conn, script)
+                db.invalidate_schema(conn)
+                explain_all(conn, statements, 'after', args.analyze)
+            elif args.try_invisible:
+                try:
+                    evaluate_invisible(conn, statements, recommendations, args.analyze)
+                except Error as e:
+                    print(f'Could not try the indexes invisibly ({e}); use --apply to measure them.')
+        report(statements, recommendations)
+        if recommendations and not (args.apply or args.try_invisible):
+            print('\nCosts after are not measured: rerun with --try-invisible (or --apply) on a copy of the data.')
+        print(f"\nWrote {args.output}{' and applied it' if args.apply and recommendations else ''}")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,359 @@
+"""Simulate many concurrent app sessions against a database and report how it holds up.
+
+Each session is a thread that replays what the Streamlit handlers do on a
+click: check out a connection from the shared pool (as main() does every
+rerun), then run the queries of show_tables, show_crud, show_procedures or
+show_dashboard. Between clicks a session waits for an exponentially
+distributed think time. --mode legacy instead opens a new connection per
+click and runs list_tables, describe_table and a 1000-row fetch_table, the
+way the app used to.
+
+Writes (CRUD updates/inserts and procedure calls) run in a transaction that
+is rolled back unless --commit-writes is given, so the data stays the same
+between runs.
+
+Example:
+    python loadtest.py --sessions 50 --duration 60 --think-ms 2000
+    python loadtest.py --sessions 50 --write-ratio 0.2 --pool-size 10 --output bench/load.json
+    python loadtest.py --sessions 50 --mode legacy
+
+Without --pool-size the pool gets one connection per session, since every
+simulated rerun holds one for the whole click. A smaller pool shows up as
+pool timeouts in the summary.
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+import db
+from benchmark import Fixtures, _Rollback, _scalar
+
+# Relative frequency of each click among reads and among writes.
+READ_ACTIONS = {'tables': 4, 'tables_next_page': 2, 'tables_filtered': 1, 'crud_read': 2,
+                'dashboard': 1, 'function': 1}
+WRITE_ACTIONS = {'crud_update': 3, 'crud_insert': 2, 'procedure': 1}
+
+
+class Recorder:
+    """Thread-safe latency and error collection per action."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, Counter] = {}
+        self.pool_timeouts: Counter = Counter()  # errors that were db.PoolTimeout, per action
+
+    def add(self, action: str, seconds: float, error: Optional[str] = None, pool_timeout: bool = False) -> None:
+        with self.lock:
+            if error is None:
+                self.latencies.setdefault(action, []).append(seconds)
+            else:
+                self.errors.setdefault(action, Counter())[error[:120]] += 1
+                if pool_timeout:
+                    self.pool_timeouts[action] += 1
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+
+    def at(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000
+    return {'p50_ms': at(0.50), 'p95_ms': at(0.95), 'p99_ms': at(0.99), 'max_ms': ordered[-1] * 1000}
+
+
+class Session:
+    """One simulated user clicking through the app."""
+
+    def __init__(self, pool: db.ConnectionPool, fixtures: Fixtures, rng: random.Random,
+                 commit_writes: bool, mode: str):
+        self.pool = pool
+        self.fixtures = fixtures
+        self.rng = rng
+        self.commit_writes = commit_writes
+        self.mode = mode
+        self.last_key: Dict[str, Any] = {}  # table -> next_cursor of the page on screen
+
+    def click(self, action: str) -> None:
+        if self.mode == 'legacy':
+            self._legacy()
+            return
+        conn = self.pool.acquire()
+        try:
+            getattr(self, action)(conn)
+        finally:
+            self.pool.release(conn)
+
+    def _legacy(self) -> None:
+        conn = db.get_connection(self.pool.config)
+        try:
+            table = self.rng.choice(db.list_tables(conn))
+            db.describe_table(conn, table)
+            db.fetch_table(conn, table, limit=1000)
+        finally:
+            conn.close()
+
+    def _write(self, conn, write: Callable[[], Any]) -> None:
+        if self.commit_writes:
+            write()
+            return
+        try:
+            with db.transaction(conn):
+                write()
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    # Reads, following the handlers in streamlit_app.py
+
+    def tables(self, conn) -> None:
+        schema = db.get_schema(conn)
+        table = self.rng.choice(schema.tables)
+        loaded = db.run_parallel(self.pool, {
+            'desc': (db.describe_table, table),
+            'page': (db.fetch_page, table, 50),
+            'count': (db.count_rows, table),
+        }, conn)
+        self.last_key[table] = loaded['page'].next_cursor
+
+    def tables_next_page(self, conn) -> None:
+        pages = [(table, after) for table, after in self.last_key.items() if after is not None]
+        if not pages:
+            return self.tables(conn)
+        table, after = self.rng.choice(pages)
+        loaded = db.run_parallel(self.pool, {
+            'page': (db.fetch_page, table, 50, after),
+            'count': (db.count_rows, table),
+        }, conn)
+        self.last_key[table] = loaded['page'].next_cursor
+
+    def tables_filtered(self, conn) -> None:
+        table, filters = self.rng.choice([
+            ('student', [('f_name', 'prefix', self.rng.choice('ABCDEFGHIJKLMNOPRST'))]),
+            ('fees', [('date_paid', 'is_null', None)]),
+            ('visits', [('visit_date', 'ge', (datetime.date.today() - datetime.timedelta(days=30)).isoformat())]),
+        ])
+        db.run_parallel(self.pool, {
+            'page': (db.fetch_page, table, 50, None, None, filters),
+            'count': (db.count_rows, table, False, filters),
+        }, conn)
+
+    def crud_read(self, conn) -> None:
+        table = self.rng.choice(db.get_schema(conn).tables)
+        db.run_parallel(self.pool, {
+            'page': (db.fetch_page, table, 50),
+            'count': (db.count_rows, table),
+        }, conn)
+
+    def dashboard(self, conn) -> None:
+        since = datetime.date.today() - datetime.timedelta(days=30)
+        db.run_parallel(self.pool, {
+            'occupancy': (db.hostel_occupancy,),
+            'dues': (db.dues_summary,),
+            'owing': (db.pending_dues, 20),
+            'visits': (db.visit_counts, since, 20),
+        }, conn)
+
+    def _routine(self, conn, routine_type: str) -> None:
+        schema = db.get_schema(conn)
+        names = schema.routine_names(routine_type)
+        if not names:
+            return
+        name = self.rng.choice(names)
+        params, _ = schema.procedure_info(name, routine_type)
+        args = self.fixtures.routine_args(params)
+        if routine_type == 'FUNCTION':
+            db.call_routine(conn, name, args, routine_type)
+        else:
+            self._write(conn, lambda: db.call_routine(conn, name, args, routine_type))
+
+    def function(self, conn) -> None:
+        self._routine(conn, 'FUNCTION')
+
+    # Writes
+
+    def procedure(self, conn) -> None:
+        self._routine(conn, 'PROCEDURE')
+
+    def crud_update(self, conn) -> None:
+        student_id = self.fixtures.pick(self.fixtures.students)
+        self._write(conn, lambda: db.update_record(
+            conn, 'student', {'age': 21, 'age_group': '18-22'}, {'student_id': student_id}))
+
+    def crud_insert(self, conn) -> None:
+        self._write(conn, lambda: db.insert_record(conn, 'visitor', {'f_name': 'Load', 'l_name': 'Test'}))
+
+
+def run_session(session: Session, recorder: Recorder, stop_at: float, think: float,
+                write_ratio: float, start_delay: float) -> None:
+    rng = session.rng
+    time.sleep(start_delay)
+    reads, read_weights = zip(*READ_ACTIONS.items())
+    writes, write_weights = zip(*WRITE_ACTIONS.items())
+    while time.monotonic() < stop_at:
+        if rng.random() < write_ratio:
+            action = rng.choices(writes, write_weights)[0]
+        else:
+            action = rng.choices(reads, read_weights)[0]
+        label = 'legacy' if session.mode == 'legacy' else action
+        started = time.perf_counter()
+        try:
+            session.click(action)
+        except Exception as e:
+            recorder.add(label, time.perf_counter() - started, f'{type(e).__name__}: {e}',
+                         isinstance(e, db.PoolTimeout))
+        else:
+            recorder.add(label, time.perf_counter() - started)
+        if think:
+            time.sleep(min(rng.expovariate(1 / think), max(0.0, stop_at - time.monotonic())))
+
+
+def _server_status(conn) -> Dict[str, int]:
+    cur = conn.cursor()
+    try:
+        cur.execute("SHOW GLOBAL STATUS WHERE Variable_name IN "
+                    "('Threads_connected', 'Threads_running', 'Max_used_connections', 'Connections')")
+        return {name: int(value) for name, value in cur.fetchall()}
+    finally:
+        cur.close()
+
+
+def monitor(pool: db.ConnectionPool, conn, samples: List[Dict[str, Any]], stop: threading.Event,
+            interval: float) -> None:
+    """Sample pool occupancy and server connection counts until stopped."""
+    while not stop.wait(interval):
+        sample = {'t': time.monotonic(), **{k: v for k, v in pool.stats().items() if k in ('size', 'in_use')}}
+        try:
+            sample.update(_server_status(conn))
+        except db.Error:
+            pass
+        samples.append(sample)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sessions', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=60, help='Seconds to run after ramp-up starts')
+    parser.add_argument('--ramp-up', type=float, default=5, help='Seconds over which sessions start')
+    parser.add_argument('--think-ms', type=float, default=1000, help='Mean pause between clicks (0: none)')
+    parser.add_argument('--write-ratio', type=float, default=0.1, help='Fraction of clicks that write')
+    parser.add_argument('--mode', choices=['app', 'legacy'], default='app')
+    parser.add_argument('--pool-size', type=int, help='Max pooled connections (default: one per session)')
+    parser.add_argument('--commit-writes', action='store_true', help='Keep writes instead of rolling them back')
+    parser.add_argument('--no-cache', action='store_true', help='Disable the db.py result cache')
+    parser.add_argument('--output', help='Write the JSON report here')
+    parser.add_argument('--database', help='Schema to use (default: DB_DATABASE)')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if args.database:
+        os.environ['DB_DATABASE'] = args.database
+    if args.no_cache:
+        db.result_cache.max_bytes = 0
+    pool = db.get_pool(max_size=args.pool_size or args.sessions)
+    status_conn = db.get_connection()
+    try:
+        fixtures = Fixtures(status_conn, random.Random(args.seed))
+        version = _scalar(status_conn, 'SELECT VERSION()')
+        before = _server_status(status_conn)
+        recorder = Recorder()
+        samples: List[Dict[str, Any]] = []
+        stop = threading.Event()
+        watcher = threading.Thread(target=monitor, args=(pool, status_conn, samples, stop, 1.0), daemon=True)
+        watcher.start()
+
+        started = time.monotonic()
+        stop_at = started + args.duration
+        threads = []
+        for i in range(args.sessions):
+            session = Session(pool, fixtures, random.Random(args.seed + i + 1), args.commit_writes, args.mode)
+            delay = args.ramp_up * i / args.sessions
+            threads.append(threading.Thread(target=run_session, name=f'session-{i}', args=(
+                session, recorder, stop_at, args.think_ms / 1000, args.write_ratio, delay)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+        stop.set()
+        watcher.join()
+        after = _server_status(status_conn)
+    finally:
+        status_conn.close()
+
+    results = {}
+    print(f"{'action':18} {'ok':>7} {'errors':>7} {'per s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for action in sorted(set(recorder.latencies) | set(recorder.errors)):
+        latencies = recorder.latencies.get(action, [])
+        errors = recorder.errors.get(action, Counter())
+        result: Dict[str, Any] = {'ok': len(latencies), 'errors': sum(errors.values()),
+                                  'per_second': len(latencies) / elapsed}
+        if latencies:
+            result.update(_percentiles(latencies))
+        if errors:
+            result['pool_timeouts'] = recorder.pool_timeouts[action]
+            result['top_errors'] = errors.most_common(3)
+        results[action] = result
+        timing = (f"{result['p50_ms']:9.1f} {result['p95_ms']:9.1f} {result['p99_ms']:9.1f} {result['max_ms']:9.1f}"
+                  if latencies else '')
+        print(f"{action:18} {result['ok']:7,} {result['errors']:7,} {result['per_second']:8.1f} {timing}")
+
+    all_latencies = [s for values in recorder.latencies.values() for s in values]
+    total_errors = sum(sum(c.values()) for c in recorder.errors.values())
+    pool_timeouts = sum(recorder.pool_timeouts.values())
+    overall = {'clicks': len(all_latencies) + total_errors, 'errors': total_errors, 'pool_timeouts': pool_timeouts,
+               'per_second': len(all_latencies) / elapsed, 'elapsed_s': elapsed}
+    if all_latencies:
+        overall.update(_percentiles(all_latencies))
+    connections = {
+        'pool': pool.stats(),
+        'pool_peak_in_use': max((s.get('in_use', 0) for s in samples), default=0),
+        'server_peak_threads_connected': max((s.get('Threads_connected', 0) for s in samples), default=0),
+        'server_peak_threads_running': max((s.get('Threads_running', 0) for s in samples), default=0),
+        'server_connections_opened': after.get('Connections', 0) - before.get('Connections', 0),
+        'server_max_used_connections': after.get('Max_used_connections'),
+    }
+    print(f"\n{overall['clicks']:,} clicks in {elapsed:.1f}s: {overall['per_second']:.1f}/s, "
+          f"{total_errors:,} errors ({pool_timeouts:,} pool timeouts)" + (f", p50 {overall['p50_ms']:.1f} ms, p95 {overall['p95_ms']:.1f} ms, "
+                                        f"p99 {overall['p99_ms']:.1f} ms" if all_latencies else ''))
+    pool_stats = connections['pool']
+    print(f"Pool: peak {connections['pool_peak_in_use']} of {pool_stats['max_size']} in use, "
+          f"{pool_stats['waits']:,} waits ({pool_stats['wait_time']:.1f}s total), {pool_stats['timeouts']} timeouts, "
+          f"{pool_stats['busy']:,} parallel reads run on the session's own connection")
+    if pool_timeouts:
+        print(f"Warning: {pool_timeouts:,} of {total_errors:,} errors were pool timeouts: sessions were starved of "
+              f"connections. Raise --pool-size (now {pool_stats['max_size']}) or lower --sessions.")
+    print(f"Server: peak {connections['server_peak_threads_connected']} connected / "
+          f"{connections['server_peak_threads_running']} running threads, "
+          f"{connections['server_connections_opened']:,} connections opened")
+    for action, result in results.items():
+        for message, count in result.get('top_errors', []):
+            print(f'  {action}: {count} x {message}')
+
+    if args.output:
+        report = {
+            'meta': {
+                'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                'server_version': version,
+                **{k: v for k, v in vars(args).items() if k not in ('output', 'database')},
+            },
+            'overall': overall,
+            'actions': results,
+            'connections': connections,
+            'samples': samples,
+        }
+        out_dir = os.path.dirname(args.output)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f'\nWrote {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,360 @@
+"""Partition history tables by month, archive old months and measure the effect.
+
+``visits`` (by visit_date) and ``fees`` (by due_date) only grow. Converting
+them to RANGE COLUMNS partitioning by month lets date-range queries open only
+the months they cover, and lets whole months leave the table without a
+DELETE. Archiving either swaps a month out into its own table with EXCHANGE
+PARTITION, which is instant, or streams it to a compressed file before
+dropping the partition.
+
+MySQL does not allow foreign keys on partitioned tables, so converting drops
+them and installs triggers in their place:
+
+- inserts and updates are checked against the parent table;
+- deleting a parent deletes the child rows (ON DELETE CASCADE);
+- changing a parent's key is refused while child rows reference it. The
+  triggers cannot cascade such updates without double-counting in the
+  summary tables.
+
+The partitioning column also has to be part of the primary key, so ``fees``
+gets PRIMARY KEY (receipt_no, due_date).
+
+    python partitions.py convert visits              # prints scanned rows before/after
+    python partitions.py convert fees
+    python partitions.py extend visits --months 6    # add future months
+    python partitions.py archive visits --before 2024-01-01                    # to visits_archive_YYYYMM tables
+    python partitions.py archive visits --before 2024-01-01 --to file --format parquet
+    python partitions.py report visits
+"""
+from __future__ import annotations
+
+import argparse
+import datetime
+import os
+from typing import Dict, List, Optional, Tuple
+
+import db
+from db import Error, MySQLConnection
+
+
+# Table -> the DATE column it is partitioned by
+PARTITION_COLUMNS = {'visits': 'visit_date', 'fees': 'due_date'}
+MAXVALUE_PARTITION = 'pmax'
+
+
+def _month(day: datetime.date) -> datetime.date:
+    return day.replace(day=1)
+
+
+def _next_month(day: datetime.date) -> datetime.date:
+    return (day.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+
+def _add_months(day: datetime.date, months: int) -> datetime.date:
+    for _ in range(months):
+        day = _next_month(day)
+    return day
+
+
+def _partition_name(month: datetime.date) -> str:
+    return f'p{month:%Y%m}'
+
+
+def _partition_defs(first: datetime.date, last: datetime.date) -> List[str]:
+    """One partition per month from first through last (month starts)."""
+    defs = []
+    month = first
+    while month <= last:
+        defs.append(f"PARTITION {_partition_name(month)} VALUES LESS THAN ('{_next_month(month).isoformat()}')")
+        month = _next_month(month)
+    return defs
+
+
+def _rows(conn: MySQLConnection, sql: str, params: Tuple = ()) -> List[Tuple]:
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, params)
+        return cur.fetchall()
+    finally:
+        cur.close()
+
+
+def _execute(conn: MySQLConnection, sql: str) -> None:
+    cur = conn.cursor()
+    try:
+        cur.execute(sql)
+    finally:
+        cur.close()
+
+
+def partitions(conn: MySQLConnection, table: str) -> List[Tuple[str, Optional[str], int]]:
+    """(name, upper bound, estimated rows) per partition; empty if not partitioned."""
+    rows = _rows(conn, """
+        SELECT PARTITION_NAME, PARTITION_DESCRIPTION, TABLE_ROWS FROM INFORMATION_SCHEMA.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION""", (table,))
+    return [(name, None if bound == 'MAXVALUE' else bound.strip("'"), int(rows or 0)) for name, bound, rows in rows]
+
+
+def _foreign_key_names(conn: MySQLConnection, table: str) -> List[str]:
+    return [name for (name,) in _rows(conn, """
+        SELECT CONSTRAINT_NAME FROM INFORMATION_SCHEMA.REFERENTIAL_CONSTRAINTS
+        WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = %s""", (table,))]
+
+
+def _first_trigger(conn: MySQLConnection, table: str, timing: str, event: str) -> Optional[str]:
+    rows = _rows(conn, """
+        SELECT TRIGGER_NAME FROM INFORMATION_SCHEMA.TRIGGERS
+        WHERE TRIGGER_SCHEMA = DATABASE() AND EVENT_OBJECT_TABLE = %s
+          AND ACTION_TIMING = %s AND EVENT_MANIPULATION = %s
+        ORDER BY ACTION_ORDER LIMIT 1""", (table, timing, event))
+    return rows[0][0] if rows else None
+
+
+def foreign_key_triggers(conn: MySQLConnection, table: str) -> List[Tuple[str, str]]:
+    """(name, CREATE TRIGGER statement) pairs that stand in for the table's foreign keys.
+
+    The parent-side delete trigger is ordered before any existing BEFORE
+    DELETE trigger on the parent. The summary triggers then see the child
+    rows already gone, just as they would after a real cascade.
+    """
+    fks = db.get_schema(conn).foreign_keys.get(table, [])
+    triggers = []
+    checks = []
+    for column, parent, parent_column, _, delete_rule in fks:
+        checks.append(f"""
+    IF NEW.`{column}` IS NOT NULL AND NOT EXISTS (SELECT 1 FROM `{parent}` WHERE `{parent_column}` = NEW.`{column}`) THEN
+        SET msg = CONCAT('No {parent} with {parent_column} = ', NEW.`{column}`, ' for {table}');
+        SIGNAL SQLSTATE '23000' SET MESSAGE_TEXT = msg;
+    END IF;""")
+
+        if delete_rule == 'CASCADE':
+            on_delete = f"DELETE FROM `{table}` WHERE `{column}` = OLD.`{parent_column}`;"
+        elif delete_rule == 'SET NULL':
+            on_delete = f"UPDATE `{table}` SET `{column}` = NULL WHERE `{column}` = OLD.`{parent_column}`;"
+        else:
+            on_delete = (f"IF EXISTS (SELECT 1 FROM `{table}` WHERE `{column}` = OLD.`{parent_column}`) THEN "
+                         f"SIGNAL SQLSTATE '23000' SET MESSAGE_TEXT = '{parent} row is referenced by {table}'; END IF;")
+        name = f'fk_{table}_{parent}_bd'
+        existing = _first_trigger(conn, parent, 'BEFORE', 'DELETE')
+        order = f' PRECEDES `{existing}`' if existing and existing != name else ''
+        triggers.append((name, f"""CREATE TRIGGER `{name}` BEFORE DELETE ON `{parent}` FOR EACH ROW{order}
+BEGIN
+    {on_delete}
+END"""))
+        triggers.append((f'fk_{table}_{parent}_bu', f"""CREATE TRIGGER `fk_{table}_{parent}_bu` BEFORE UPDATE ON `{parent}` FOR EACH ROW
+BEGIN
+    IF NOT (NEW.`{parent_column}` <=> OLD.`{parent_column}`)
+       AND EXISTS (SELECT 1 FROM `{table}` WHERE `{column}` = OLD.`{parent_column}`) THEN
+        SIGNAL SQLSTATE '23000' SET MESSAGE_TEXT = 'Cannot change {parent}.{parent_column} while {table} rows reference it';
+    END IF;
+END"""))
+    if checks:
+        body = ''.join(checks)
+        for event, suffix in (('INSERT', 'bi'), ('UPDATE', 'bu')):
+            triggers.append((f'fk_{table}_{suffix}', f"""CREATE TRIGGER `fk_{table}_{suffix}` BEFORE {event} ON `{table}` FOR EACH ROW
+BEGIN
+    DECLARE msg VARCHAR(255);{body}
+END"""))
+    return triggers
+
+
+def convert(conn: MySQLConnection, table: str, months_ahead: int = 3) -> List[str]:
+    """Partition a table by month of its PARTITION_COLUMNS column.
+
+    Returns the statements that were run. The ALTER rebuilds the table, so
+    it takes about as long as copying it.
+    """
+    column = PARTITION_COLUMNS[table]
+    if partitions(conn, table):
+        raise Error(f'{table} is already partitioned')
+    schema = db.get_schema(conn)
+    unique = [name for (name,) in _rows(conn, """
+        SELECT DISTINCT INDEX_NAME FROM INFORMATION_SCHEMA.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND NON_UNIQUE = 0 AND INDEX_NAME <> 'PRIMARY'""",
+        (table,))]
+    if unique:
+        raise Error(f'{table} has unique keys ({", ".join(unique)}) that would have to include {column}')
+
+    low, high = _rows(conn, f"SELECT MIN(`{column}`), MAX(`{column}`) FROM `{table}`")[0]
+    today = datetime.date.today()
+    first = _month(low or today)
+    last = max(_month(high or today), _add_months(_month(today), months_ahead))
+    defs = _partition_defs(first, last) + [f'PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN (MAXVALUE)']
+
+    statements = []
+    fk_names = _foreign_key_names(conn, table)
+    triggers = foreign_key_triggers(conn, table)
+    if fk_names:
+        statements.append(f"ALTER TABLE `{table}` " + ', '.join(f"DROP FOREIGN KEY `{fk}`" for fk in fk_names))
+    for name, create in triggers:
+        statements.append(f"DROP TRIGGER IF EXISTS `{name}`")
+        statements.append(create)
+    key = schema.primary_key(table)
+    alter = [] if column in key else [f"DROP PRIMARY KEY, ADD PRIMARY KEY ({', '.join(f'`{c}`' for c in key + [column])})"]
+    statements.append(f"ALTER TABLE `{table}` {', '.join(alter)} PARTITION BY RANGE COLUMNS(`{column}`) (\n    "
+                      + ',\n    '.join(defs) + '\n)')
+    for statement in statements:
+        _execute(conn, statement)
+    db.invalidate_schema(conn)
+    db.note_write(conn, table)
+    return statements
+
+
+def extend(conn: MySQLConnection, table: str, months_ahead: int = 3) -> List[str]:
+    """Split the MAXVALUE partition so monthly partitions reach months_ahead from now."""
+    existing = partitions(conn, table)
+    bounds = [datetime.date.fromisoformat(bound) for _, bound, _ in existing if bound]
+    if not existing or existing[-1][0] != MAXVALUE_PARTITION or not bounds:
+        raise Error(f'{table} is not partitioned by partitions.py')
+    first = bounds[-1]  # upper bound of the last month = start of the next one
+    last = _add_months(_month(datetime.date.today()), months_ahead)
+    if first > last:
+        return []
+    defs = _partition_defs(first, last) + [f'PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN (MAXVALUE)']
+    statement = (f"ALTER TABLE `{table}` REORGANIZE PARTITION {MAXVALUE_PARTITION} INTO (\n    "
+                 + ',\n    '.join(defs) + '\n)')
+    _execute(conn, statement)
+    return [statement]
+
+
+def archive(conn: MySQLConnection, table: str, before: datetime.date, to: str = 'table',
+            fmt: str = 'csv.gz', directory: str = 'archive') -> Tuple[List[Tuple[str, int, str]], List[str]]:
+    """Move every whole month before ``before`` out of a partitioned table.
+
+    ``to='table'`` exchanges each partition with a new empty table
+    ``<table>_archive_YYYYMM``, a metadata-only swap. ``to='file'`` streams
+    the partition to ``directory`` with db.export_query, checks the row
+    count and only then drops the partition. Months of ``fees`` that still
+    hold unpaid fees are skipped.
+    Returns:
+        ((partition, rows, destination) per archived month,
+         partitions skipped because they hold unpaid fees)
+    """
+    if to not in ('table', 'file'):
+        raise ValueError("to must be 'table' or 'file'")
+    done = []
+    skipped = []
+    for name, bound, _ in partitions(conn, table):
+        if bound is None or datetime.date.fromisoformat(bound) > before:
+            continue
+        rows = int(_rows(conn, f"SELECT COUNT(*) FROM `{table}` PARTITION ({name})")[0][0])
+        if table == 'fees' and _rows(conn, f"SELECT 1 FROM `fees` PARTITION ({name}) WHERE date_paid IS NULL LIMIT 1"):
+            skipped.append(name)
+            continue
+        if to == 'table':
+            target = f'{table}_archive_{name[1:]}'
+            _execute(conn, f"CREATE TABLE `{target}` LIKE `{table}`")
+            _execute(conn, f"ALTER TABLE `{target}` REMOVE PARTITIONING")
+            _execute(conn, f"ALTER TABLE `{table}` EXCHANGE PARTITION {name} WITH TABLE `{target}`")
+        else:
+            os.makedirs(directory, exist_ok=True)
+            target = os.path.join(directory, f'{table}_{name[1:]}.{fmt}')
+            result = db.export_query(conn, f"SELECT * FROM `{table}` PARTITION ({name})", target, fmt, table=table)
+            if result.rows != rows:
+                raise Error(f'{table} {name}: wrote {result.rows} rows but the partition has {rows}; not dropped')
+        _execute(conn, f"ALTER TABLE `{table}` DROP PARTITION {name}")
+        done.append((name, rows, target))
+    if done:
+        db.invalidate_schema(conn)
+        db.note_write(conn, table)
+        # Dropping partitions fires no triggers, so recount the summaries
+        if db.summaries_installed(conn):
+            db.rebuild_summaries(conn)
+    return done, skipped
+
+
+def range_queries(table: str) -> Dict[str, Tuple[str, Tuple]]:
+    """Representative date-range reads per table, as (sql, params)."""
+    column = PARTITION_COLUMNS[table]
+    today = datetime.date.today()
+    month_a_year_ago = _month(today).replace(year=today.year - 1)
+    queries = {
+        'last 30 days': (f"SELECT COUNT(*) FROM `{table}` WHERE `{column}` >= %s",
+                         (today - datetime.timedelta(days=30),)),
+        'one month, a year ago': (f"SELECT COUNT(*) FROM `{table}` WHERE `{column}` >= %s AND `{column}` < %s",
+                                  (month_a_year_ago, _next_month(month_a_year_ago))),
+    }
+    if table == 'visits':
+        queries['visits per student, last 30 days'] = (
+            "SELECT student_id, COUNT(*) FROM visits WHERE visit_date >= %s GROUP BY student_id",
+            (today - datetime.timedelta(days=30),))
+    if table == 'fees':
+        queries['unpaid, due this month'] = (
+            "SELECT COUNT(*) FROM fees WHERE due_date >= %s AND due_date < %s AND date_paid IS NULL",
+            (_month(today), _next_month(_month(today))))
+    return queries
+
+
+def scanned_rows(conn: MySQLConnection, table: str) -> Dict[str, Tuple[int, Optional[int]]]:
+    """EXPLAIN each range query: (estimated rows examined, partitions opened)."""
+    report = {}
+    cur = conn.cursor(dictionary=True)
+    try:
+        for label, (sql, params) in range_queries(table).items():
+            cur.execute(f"EXPLAIN {sql}", params)
+            plan = cur.fetchall()
+            rows = sum(int(row.get('rows') or 0) for row in plan)
+            opened = [row.get('partitions') for row in plan if row.get('partitions')]
+            report[label] = (rows, len(opened[0].split(',')) if opened else None)
+    finally:
+        cur.close()
+    return report
+
+
+def print_report(before: Dict[str, Tuple[int, Optional[int]]], after: Optional[Dict] = None) -> None:
+    if after is None:
+        for label, (rows, opened) in before.items():
+            print(f"{label:36} {rows:>14,} rows" + (f"  {opened} partitions" if opened else ''))
+        return
+    print(f"{'query':36} {'rows before':>14} {'rows after':>14} {'saved':>8}  partitions")
+    for label, (rows, _) in before.items():
+        new_rows, opened = after[label]
+        saved = 1 - new_rows / rows if rows else 0.0
+        print(f"{label:36} {rows:>14,} {new_rows:>14,} {saved:>8.0%}  {opened or '-'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('command', choices=['convert', 'extend', 'archive', 'report'])
+    parser.add_argument('table', choices=sorted(PARTITION_COLUMNS))
+    parser.add_argument('--months', type=int, default=3, help='Future months to create (convert/extend)')
+    parser.add_argument('--before', type=datetime.date.fromisoformat, help='Archive months ending on or before this date')
+    parser.add_argument('--to', choices=['table', 'file'], default='table')
+    parser.add_argument('--format', choices=db.EXPORT_FORMATS, default='csv.gz')
+    parser.add_argument('--directory', default='archive', help='Where --to file writes')
+    parser.add_argument('--database', help='Schema to use (default: DB_DATABASE)')
+    args = parser.parse_args()
+
+    if args.database:
+        os.environ['DB_DATABASE'] = args.database
+    conn = db.get_connection()
+    try:
+        if args.command == 'convert':
+            before = scanned_rows(conn, args.table)
+            statements = convert(conn, args.table, args.months)
+            print(f'Ran {len(statements)} statements; {args.table} now has '
+                  f'{len(partitions(conn, args.table))} partitions')
+            _rows(conn, f"ANALYZE TABLE `{args.table}`")  # returns a status row that must be read
+            print_report(before, scanned_rows(conn, args.table))
+        elif args.command == 'extend':
+            added = extend(conn, args.table, args.months)
+            print(f'{args.table}: added months up to {args.months} ahead' if added else f'{args.table}: nothing to add')
+        elif args.command == 'archive':
+            if args.before is None:
+                parser.error('archive needs --before')
+            done, skipped = archive(conn, args.table, args.before, args.to, args.format, args.directory)
+            for name, rows, target in done:
+                print(f'{args.table} {name}: {rows:,} rows -> {target}')
+            for name in skipped:
+                print(f'Skipped {args.table} {name}: it still has unpaid fees')
+        else:
+            for name, bound, rows in partitions(conn, args.table):
+                print(f"{name:10} < {bound or 'MAXVALUE':12} {rows:>12,} rows")
+            print_report(scanned_rows(conn, args.table))
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
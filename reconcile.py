@@ -0,0 +1,319 @@
+"""Reconcile a bank payment file against the open fees and mark them paid.
+
+The open fees (date_paid IS NULL) are streamed into two in-memory hash
+indexes, by receipt_no and by (student_id, amount). The payment file is then
+read line by line: each line is matched against the indexes, matched
+payments are written as batched updates while reading continues, and lines
+that cannot be applied are written to an exceptions file. Memory is bounded
+by the number of open fees plus one batch; the payment file is never held
+in full.
+
+A line with a receipt_no must match that open fee's amount (and student, if
+given). A line without one takes the oldest open fee of that student with
+exactly that amount. A fee paid earlier in the same file is a duplicate.
+
+The payment file is a CSV with a header row and the columns amount,
+date_paid (or date) and at least one of receipt_no and student_id.
+
+Example:
+    python reconcile.py statement.csv                    # dry run
+    python reconcile.py statement.csv --apply --exceptions flagged.csv
+"""
+import argparse
+import csv
+import datetime
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import db
+from db import MySQLConnection
+
+
+# Statuses of a payment line; everything but 'matched' ends up in the exceptions file.
+# 'already_paid' and 'apply_failed' are matched lines that were not written:
+# the fee was paid by someone else after the index was loaded, or its batch failed.
+STATUSES = ('matched', 'duplicate', 'amount_mismatch', 'student_mismatch', 'not_open', 'no_match', 'invalid',
+            'already_paid', 'apply_failed')
+
+_ALIASES = {
+    'receipt_no': ('receipt_no', 'receipt', 'receipt_number'),
+    'student_id': ('student_id', 'student'),
+    'amount': ('amount', 'paid', 'amount_paid'),
+    'date_paid': ('date_paid', 'date', 'paid_on', 'value_date'),
+}
+_DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y')
+
+
+@dataclass
+class Payment:
+    line: int
+    receipt_no: Optional[int]
+    student_id: Optional[int]
+    cents: int
+    date_paid: datetime.date
+
+
+@dataclass
+class ReconcileReport:
+    lines: int = 0
+    counts: Counter = field(default_factory=Counter)
+    open_fees: int = 0
+    applied: int = 0
+    stale: int = 0  # matched, but paid by someone else before the batch was written (also in counts)
+    batches: int = 0
+    errors: List[Tuple[int, int, str]] = field(default_factory=list)
+    load_seconds: float = 0.0
+    match_seconds: float = 0.0
+    apply_seconds: float = 0.0
+
+    def summary(self) -> str:
+        rate = self.lines / self.match_seconds if self.match_seconds else 0.0
+        apply_rate = self.applied / self.apply_seconds if self.apply_seconds else 0.0
+        parts = [f'{self.counts[status]:,} {status}' for status in STATUSES if self.counts[status]]
+        out = [
+            f'Indexed {self.open_fees:,} open fees in {self.load_seconds:.1f}s',
+            f'Read {self.lines:,} payment lines in {self.match_seconds:.1f}s ({rate:,.0f} lines/s): '
+            + (', '.join(parts) or 'nothing to do'),
+        ]
+        if self.batches:
+            out.append(f'Applied {self.applied:,} payments in {self.batches} batches, {self.apply_seconds:.1f}s '
+                       f'({apply_rate:,.0f} rows/s)' + (f'; {self.stale:,} were already paid' if self.stale else ''))
+        out.extend(f'Batch {number} (from match {offset}) failed: {message}' for number, offset, message in self.errors)
+        return '\n'.join(out)
+
+
+def _cents(value) -> int:
+    return int((Decimal(str(value)) * 100).to_integral_value())
+
+
+class FeeIndex:
+    """Open fees keyed by receipt_no and by (student_id, amount in cents)."""
+
+    def __init__(self):
+        self.by_receipt: Dict[int, Tuple[int, int]] = {}
+        self.by_student: Dict[Tuple[int, int], List[int]] = {}
+        self.has_open: Counter = Counter()  # open fees per student
+        self.settled: Dict[int, int] = {}  # receipt_no -> line that paid it
+
+    def load(self, conn: MySQLConnection, chunk_size: int = 50000) -> int:
+        """Stream every open fee into the indexes, oldest due date first."""
+        query = ("SELECT receipt_no, student_id, amount FROM fees "
+                 "WHERE date_paid IS NULL ORDER BY due_date, receipt_no")
+        for rows in db.iter_query_rows(conn, query, chunk_size=chunk_size, table='fees'):
+            for receipt_no, student_id, amount in rows:
+                cents = _cents(amount)  # amount is the connector's Decimal
+                self.by_receipt[receipt_no] = (student_id, cents)
+                self.by_student.setdefault((student_id, cents), []).append(receipt_no)
+                self.has_open[student_id] += 1
+        return len(self.by_receipt)
+
+    def match(self, payment: Payment) -> Tuple[str, str, Optional[int]]:
+        """Return (status, detail, receipt_no) and take a matched fee out of the index."""
+        if payment.receipt_no is not None:
+            receipt_no = payment.receipt_no
+            fee = self.by_receipt.get(receipt_no)
+            if fee is None:
+                if receipt_no in self.settled:
+                    return 'duplicate', f'receipt {receipt_no} already paid by line {self.settled[receipt_no]}', None
+                return 'not_open', f'receipt {receipt_no} is paid or does not exist', None
+            student_id, cents = fee
+            if payment.student_id is not None and payment.student_id != student_id:
+                return 'student_mismatch', f'receipt {receipt_no} belongs to student {student_id}', None
+            if payment.cents != cents:
+                return 'amount_mismatch', f'receipt {receipt_no} is for {cents / 100:.2f}', None
+            self.by_student[(student_id, cents)].remove(receipt_no)
+        else:
+            student_id, cents = payment.student_id, payment.cents
+            receipts = self.by_student.get((student_id, cents))
+            if not receipts:
+                if self.has_open[student_id]:
+                    return 'no_match', f'student {student_id} has no open fee of {cents / 100:.2f}', None
+                return 'no_match', f'student {student_id} has no open fees', None
+            receipt_no = receipts.pop(0)
+        del self.by_receipt[receipt_no]
+        self.has_open[student_id] -= 1
+        self.settled[receipt_no] = payment.line
+        return 'matched', '', receipt_no
+
+
+def _column_map(header: List[str]) -> Dict[str, str]:
+    lowered = {name.strip().lower(): name for name in header}
+    found = {}
+    for column, aliases in _ALIASES.items():
+        for alias in aliases:
+            if alias in lowered:
+                found[column] = lowered[alias]
+                break
+    missing = [c for c in ('amount', 'date_paid') if c not in found]
+    if missing or not ('receipt_no' in found or 'student_id' in found):
+        raise ValueError(f'Payment file needs amount, date_paid and receipt_no or student_id columns; '
+                         f'found {", ".join(header)}')
+    return found
+
+
+def _parse_date(text: str) -> datetime.date:
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f'unrecognised date {text!r}')
+
+
+def parse_payment(line: int, row: Dict[str, str], columns: Dict[str, str]) -> Payment:
+    """Convert one CSV row; raises ValueError with a readable message."""
+    def value(column: str) -> str:
+        return (row.get(columns[column]) or '').strip() if column in columns else ''
+
+    receipt, student = value('receipt_no'), value('student_id')
+    if not receipt and not student:
+        raise ValueError('no receipt_no or student_id')
+    try:
+        cents = _cents(value('amount').replace(',', '').lstrip('₹$€£ '))
+    except InvalidOperation:
+        raise ValueError(f'bad amount {value("amount")!r}')
+    if cents <= 0:
+        raise ValueError('amount must be positive')
+    try:
+        receipt_no = int(receipt) if receipt else None
+        student_id = int(student) if student else None
+    except ValueError:
+        raise ValueError(f'bad receipt_no/student_id {receipt!r}/{student!r}')
+    return Payment(line, receipt_no, student_id, cents, _parse_date(value('date_paid')))
+
+
+def reconcile(conn: MySQLConnection, rows: Iterable[Dict[str, str]], apply: bool = False,
+              batch_size: int = 500, on_flag: Optional[Callable[[int, str, str, Dict[str, str]], None]] = None,
+              index: Optional[FeeIndex] = None) -> ReconcileReport:
+    """Match payment rows against the open fees and (optionally) mark them paid.
+
+    Args:
+        conn: Database connection
+        rows: Payment rows as dicts, e.g. a csv.DictReader
+        apply: Write matched payments; otherwise only classify them
+        batch_size: Payments per UPDATE statement/transaction
+        on_flag: Called as on_flag(line, status, detail, row) for every
+            line that is not applied, including matched lines whose fee
+            was already paid or whose batch failed
+        index: A FeeIndex that is already loaded
+    Returns:
+        ReconcileReport with per-status counts and timings
+    """
+    report = ReconcileReport()
+    if index is None:
+        started = time.perf_counter()
+        index = FeeIndex()
+        index.load(conn)
+        report.load_seconds = time.perf_counter() - started
+    report.open_fees = len(index.by_receipt) + len(index.settled)
+
+    # (line, row, update) per matched payment waiting to be written
+    pending: List[Tuple[int, Dict[str, str], Dict]] = []
+    flushed = 0  # matched payments already sent to the database
+
+    def flag(status: str, detail: str, items: List[Tuple[int, Dict[str, str], Dict]]) -> None:
+        report.counts['matched'] -= len(items)
+        report.counts[status] += len(items)
+        if on_flag:
+            for line, row, _ in items:
+                on_flag(line, status, detail, row)
+
+    def flush():
+        nonlocal flushed
+        if not pending:
+            return
+        started = time.perf_counter()
+        receipts = [update['receipt_no'] for _, _, update in pending]
+        with db.transaction(conn):
+            # Lock the batch's fees and set aside those paid since the index
+            # was loaded; the update's filter leaves them untouched anyway.
+            cur = conn.cursor()
+            try:
+                cur.execute(f"SELECT receipt_no FROM fees WHERE receipt_no IN ({', '.join(['%s'] * len(receipts))}) "
+                            f"AND date_paid IS NOT NULL FOR UPDATE", receipts)
+                paid = {receipt_no for (receipt_no,) in cur.fetchall()}
+            finally:
+                cur.close()
+            stale = [item for item in pending if item[2]['receipt_no'] in paid]
+            fresh = [item for item in pending if item[2]['receipt_no'] not in paid]
+            result = db.update_records(conn, 'fees', [update for _, _, update in fresh], ['receipt_no'],
+                                       max(len(fresh), 1), filters=[('date_paid', 'is_null', None)])
+        report.apply_seconds += time.perf_counter() - started
+        report.stale += len(stale)
+        flag('already_paid', 'fee was paid after the open fees were loaded', stale)
+        if result.ok:
+            report.applied += result.rows
+        else:
+            report.errors.append((report.batches, flushed, result.errors[0][2]))
+            flag('apply_failed', f'batch {report.batches} failed: {result.errors[0][2]}', fresh)
+        report.batches += 1
+        flushed += len(pending)
+        pending.clear()
+
+    columns: Optional[Dict[str, str]] = None
+    started = time.perf_counter()
+    for line, row in enumerate(rows, start=2):
+        if columns is None:
+            columns = _column_map(list(row.keys()))
+        report.lines += 1
+        try:
+            payment = parse_payment(line, row, columns)
+        except ValueError as e:
+            status, detail, receipt_no = 'invalid', str(e), None
+        else:
+            status, detail, receipt_no = index.match(payment)
+        report.counts[status] += 1
+        if receipt_no is None:
+            if on_flag:
+                on_flag(line, status, detail, row)
+        elif apply:
+            pending.append((line, row, {'receipt_no': receipt_no, 'date_paid': payment.date_paid}))
+            if len(pending) >= batch_size:
+                flush()
+    if apply:
+        flush()
+    report.match_seconds = time.perf_counter() - started - report.apply_seconds
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('payments', help='Payment CSV file')
+    parser.add_argument('--database', help='Schema to use (default: DB_DATABASE)')
+    parser.add_argument('--apply', action='store_true', help='Mark matched fees paid (default: dry run)')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--exceptions', help='Write lines that were not applied to this CSV')
+    args = parser.parse_args()
+
+    if args.database:
+        os.environ['DB_DATABASE'] = args.database
+    conn = db.get_connection()
+    flagged = None
+    try:
+        with open(args.payments, newline='', encoding='utf-8-sig') as f:
+            writer = None
+            if args.exceptions:
+                flagged = open(args.exceptions, 'w', newline='')
+                writer = csv.writer(flagged)
+                writer.writerow(['line', 'status', 'detail'] + (csv.DictReader(f).fieldnames or []))
+                f.seek(0)
+            report = reconcile(conn, csv.DictReader(f), args.apply, args.batch_size,
+                               lambda line, status, detail, row: writer.writerow(
+                                   [line, status, detail] + list(row.values())) if writer else None)
+        print(report.summary())
+        if not args.apply:
+            print('Dry run: nothing written (use --apply)')
+        if args.exceptions:
+            print(f'Wrote {report.lines - report.counts["matched"]:,} flagged lines to {args.exceptions}')
+    finally:
+        if flagged:
+            flagged.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+"""In-memory typeahead search over names and phone numbers.
+
+Students, visitors and wardens are indexed by first name, last name and
+phone number; hostels by name and city; rooms by hostel name, number and
+type. Each table's rows are bulk-loaded once into a sorted token list, so
+a prefix lookup is a binary search. Writes made through db.py then update
+the index row by row through a write listener, without reloading the
+table.
+
+    index = SearchIndex()
+    db.add_write_listener(index.on_write)
+    index.build(conn)
+    index.search(conn, 'student', 'jo sm')   # [Match('student', 17, 'John Smith'), ...]
+
+Writes made outside db.py, e.g. from the mysql client, are not seen until
+the table is rebuilt (``index.invalidate()``).
+"""
+from __future__ import annotations
+
+import bisect
+import re
+import threading
+from dataclasses import dataclass
+from sys import intern
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import db
+from db import MySQLConnection, WriteEvent
+
+
+@dataclass(frozen=True)
+class Source:
+    """How one table's rows become search entries.
+
+    ``select`` returns (key, label) and ``phones`` (key, phone number)
+    pairs. To reload single rows either one is wrapped as
+    ``SELECT * FROM (...) s WHERE s.<key> IN (...)``. Writes to ``tables``
+    that carry ``key`` are applied row by row. A write to a table in
+    ``depends`` reloads the whole source instead.
+    """
+    key: str
+    select: str
+    phones: Optional[str] = None
+    tables: Tuple[str, ...] = ()
+    depends: Tuple[str, ...] = ()
+
+
+SOURCES = {
+    'student': Source('student_id', "SELECT student_id, CONCAT_WS(' ', f_name, l_name) AS label FROM student",
+                      'SELECT student_id, phone_no FROM phone_student', ('phone_student',)),
+    'visitor': Source('visitor_id', "SELECT visitor_id, CONCAT_WS(' ', f_name, l_name) AS label FROM visitor",
+                      'SELECT visitor_id, phone_no FROM phone_visitor', ('phone_visitor',)),
+    'warden': Source('warden_id', "SELECT warden_id, CONCAT_WS(' ', f_name, l_name) AS label FROM warden",
+                     'SELECT warden_id, phone_no FROM warden WHERE phone_no IS NOT NULL '
+                     'UNION SELECT warden_id, phone_no FROM phone_warden', ('phone_warden',)),
+    'hostel': Source('hostel_id', "SELECT hostel_id, CONCAT_WS(', ', name, city) AS label FROM hostel"),
+    'room': Source('room_id', "SELECT r.room_id, CONCAT_WS(' ', h.name, CONCAT('room ', r.room_id), r.type) AS label "
+                              "FROM room r JOIN hostel h ON h.hostel_id = r.hostel_id", depends=('hostel',)),
+}
+
+_WORD = re.compile(r'\w+')
+_PHONE = re.compile(r'^[\d\s()+.-]+$')
+
+
+@dataclass
+class Match:
+    table: str
+    key: Any
+    label: str
+
+
+def _tokens(label: str, phones: Iterable[str]) -> Tuple[str, ...]:
+    tokens = set(_WORD.findall(label.lower()))
+    for phone in phones:
+        digits = re.sub(r'\D', '', phone)
+        if digits:
+            tokens.add(digits)
+            if len(digits) > 10:
+                tokens.add(digits[-10:])  # without the country code
+    return tuple(sorted(tokens))
+
+
+def _key(value: Any) -> Any:
+    """Integer keys typed into a form arrive as strings."""
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return value
+
+
+def _terms(query: str) -> List[str]:
+    """Lower-case prefix terms; a phone number with spaces or dashes is one term."""
+    query = query.strip().lower()
+    if _PHONE.match(query) and re.sub(r'\D', '', query):
+        return [re.sub(r'\D', '', query)]
+    return _WORD.findall(query)
+
+
+class _TableIndex:
+    """Sorted tokens of one table, with the entry each token belongs to.
+
+    ``tokens`` and ``keys`` are parallel lists ordered by token, so tokens
+    with a common prefix sit next to each other and bisect finds the first.
+    """
+
+    def __init__(self, entries: Dict[Any, Tuple[str, Tuple[str, ...]]]):
+        self.entries = entries
+        # Interned so a first name shared by thousands of rows is stored once
+        pairs = sorted((token, key) for key, (_, tokens) in entries.items() for token in tokens)
+        self.tokens = [intern(token) for token, _ in pairs]
+        self.keys = [key for _, key in pairs]
+
+    def put(self, key: Any, label: str, tokens: Tuple[str, ...]) -> None:
+        self.remove(key)
+        self.entries[key] = (label, tokens)
+        for token in tokens:
+            i = bisect.bisect_right(self.tokens, token)
+            self.tokens.insert(i, intern(token))
+            self.keys.insert(i, key)
+
+    def remove(self, key: Any) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for token in entry[1]:
+            i = bisect.bisect_left(self.tokens, token)
+            while i < len(self.tokens) and self.tokens[i] == token:
+                if self.keys[i] == key:
+                    del self.tokens[i]
+                    del self.keys[i]
+                    break
+                i += 1
+
+    def prefixed(self, prefix: str) -> Iterable[Any]:
+        """Keys with a token starting with prefix, in token order (may repeat)."""
+        i = bisect.bisect_left(self.tokens, prefix)
+        while i < len(self.tokens) and self.tokens[i].startswith(prefix):
+            yield self.keys[i]
+            i += 1
+
+    def search(self, terms: List[str], limit: int) -> List[Any]:
+        if not terms:
+            return []
+        # Scan the longest (most selective) term; the others must each prefix one of the entry's tokens.
+        terms = sorted(terms, key=len, reverse=True)
+        found = []
+        seen = set()
+        for key in self.prefixed(terms[0]):
+            if key in seen:
+                continue
+            seen.add(key)
+            tokens = self.entries[key][1]
+            if all(any(token.startswith(term) for token in tokens) for term in terms[1:]):
+                found.append(key)
+                if len(found) >= limit:
+                    break
+        return found
+
+
+class SearchIndex:
+    """Prefix search over SOURCES, kept per database and updated on writes."""
+
+    def __init__(self, sources: Optional[Dict[str, Source]] = None):
+        self.sources = sources or SOURCES
+        self._lock = threading.RLock()
+        # connection_identity -> table -> index; a missing table is (re)built on next use
+        self._indexes: Dict[Tuple, Dict[str, _TableIndex]] = {}
+
+    def build(self, conn: MySQLConnection, tables: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """Bulk-load tables (default: every source) and return their entry counts."""
+        counts = {}
+        existing = set(db.get_schema(conn).tables)
+        for table in tables or self.sources:
+            if table not in existing:
+                continue
+            built = _TableIndex(self._load(conn, table))
+            with self._lock:
+                self._indexes.setdefault(db.connection_identity(conn), {})[table] = built
+            counts[table] = len(built.entries)
+        return counts
+
+    def ensure(self, conn: MySQLConnection, tables: Iterable[str]) -> None:
+        """Bulk-load whichever of ``tables`` are searchable and not loaded yet."""
+        with self._lock:
+            loaded = set(self._indexes.get(db.connection_identity(conn), {}))
+        missing = [table for table in tables if table in self.sources and table not in loaded]
+        if missing:
+            self.build(conn, missing)
+
+    def invalidate(self, conn: Optional[MySQLConnection] = None, table: Optional[str] = None) -> None:
+        """Drop indexed tables so they are reloaded on next use."""
+        with self._lock:
+            if conn is None:
+                self._indexes.clear()
+                return
+            indexes = self._indexes.get(db.connection_identity(conn), {})
+            if table is None:
+                indexes.clear()
+            else:
+                indexes.pop(table, None)
+
+    def search(self, conn: MySQLConnection, table: str, query: str, limit: int = 20) -> List[Match]:
+        """Entries whose tokens start with every word of ``query``.
+
+        A query that is a whole key (e.g. "17") lists that entry first.
+        """
+        index = self._index(conn, table)
+        terms = _terms(query)
+        with self._lock:
+            keys = index.search(terms, limit)
+            if query.strip().isdigit():
+                exact = _key(query)
+                if exact in index.entries:
+                    keys = [exact] + [key for key in keys if key != exact][:limit - 1]
+            return [Match(table, key, index.entries[key][0]) for key in keys]
+
+    def label(self, conn: MySQLConnection, table: str, key: Any) -> Optional[str]:
+        """The entry's label, or None if the key is not in the table."""
+        index = self._index(conn, table)
+        with self._lock:
+            entry = index.entries.get(_key(key))
+        return entry[0] if entry else None
+
+    def on_write(self, conn: MySQLConnection, event: WriteEvent) -> None:
+        """Write listener: apply a committed write to the indexed tables it touched."""
+        with self._lock:
+            indexes = self._indexes.get(db.connection_identity(conn))
+        if not indexes:
+            return
+        for table, source in self.sources.items():
+            if table not in indexes:
+                continue
+            keys = None
+            if event.table in (table,) + source.tables and event.rows is not None:
+                keys = {_key(row[source.key]) for row in event.rows if row.get(source.key) is not None}
+                if any(row.get(source.key) is None for row in event.rows):
+                    keys = None
+            if keys:
+                self._refresh(conn, table, keys)
+            elif event.tables & {table, *source.tables, *source.depends}:
+                with self._lock:
+                    indexes.pop(table, None)
+
+    def _index(self, conn: MySQLConnection, table: str) -> _TableIndex:
+        with self._lock:
+            index = self._indexes.get(db.connection_identity(conn), {}).get(table)
+        if index is None:
+            if table not in self.sources:
+                raise KeyError(f'{table} is not searchable')
+            self.build(conn, [table])
+            with self._lock:
+                index = self._indexes[db.connection_identity(conn)][table]
+        return index
+
+    def _refresh(self, conn: MySQLConnection, table: str, keys: Set[Any]) -> None:
+        """Reload the given rows; rows that no longer exist leave the index."""
+        entries = self._load(conn, table, keys)
+        with self._lock:
+            index = self._indexes.get(db.connection_identity(conn), {}).get(table)
+            if index is None:
+                return
+            for key in keys:
+                if key in entries:
+                    index.put(key, *entries[key])
+                else:
+                    index.remove(key)
+
+    def _load(self, conn: MySQLConnection, table: str,
+              keys: Optional[Set[Any]] = None) -> Dict[Any, Tuple[str, Tuple[str, ...]]]:
+        """key -> (label, tokens) for the whole table, or only for ``keys``."""
+        source = self.sources[table]
+
+        def rows(sql: str) -> Iterable[Tuple]:
+            params: List[Any] = []
+            if keys is not None:
+                sql = f"SELECT * FROM ({sql}) s WHERE s.`{source.key}` IN ({', '.join(['%s'] * len(keys))})"
+                params = list(keys)
+            for chunk in db.iter_query_rows(conn, sql, params, 10000, table):
+                yield from chunk
+
+        labels = {key: label or '' for key, label in rows(source.select)}
+        phones: Dict[Any, List[str]] = {}
+        if source.phones:
+            for key, phone in rows(source.phones):
+                if key in labels and phone:
+                    phones.setdefault(key, []).append(str(phone))
+        return {key: (label, _tokens(label, phones.get(key, ()))) for key, label in labels.items()}
@@ -0,0 +1,106 @@
+"""Measure cold-start cost: module imports and the first schema load.
+
+Every sample runs in a fresh interpreter, so nothing is already imported or
+cached. The schema cases need a database (DB_* settings); "cold" starts
+with an empty snapshot directory and "snapshot" with the one "cold" wrote.
+
+Example:
+    python startup_bench.py
+    python startup_bench.py --repeat 10 --skip-db --output bench/startup.json
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_CASES = {
+    'import db': 'import db',
+    'import streamlit_app': 'import streamlit_app',
+    'import db + use pandas': 'import db; db.pd.DataFrame',
+    'import pandas, numpy (eager baseline)': 'import numpy, pandas',
+}
+SCHEMA_CASES = ('first get_schema, cold', 'first get_schema, snapshot')
+
+
+def _child(case: str) -> None:
+    """Run one case in this (fresh) process and print its timing as JSON."""
+    started = time.perf_counter()
+    if case in IMPORT_CASES:
+        exec(IMPORT_CASES[case], {})
+        print(json.dumps({'seconds': time.perf_counter() - started}))
+        return
+    import db
+    imported = time.perf_counter()
+    conn = db.get_connection()
+    connected = time.perf_counter()
+    with db.capture_queries() as events:
+        db.get_schema(conn)
+    done = time.perf_counter()
+    conn.close()
+    print(json.dumps({'seconds': done - started, 'import': imported - started, 'connect': connected - imported,
+                      'schema': done - connected,
+                      'queries': sum(1 for e in events if e.sql and not e.cached)}))
+
+
+def _run(case: str, env: dict) -> dict:
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', case], cwd=HERE, env=env,
+                         capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f'{case} failed:\n{out.stderr.strip()}')
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--skip-db', action='store_true', help='Only measure imports')
+    parser.add_argument('--output', help='Write the JSON results here')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        _child(args.child)
+        return
+
+    snapshot_dir = tempfile.mkdtemp(prefix='schema-snapshots-')
+    env = dict(os.environ, DB_SCHEMA_SNAPSHOT_DIR=snapshot_dir, PYTHONWARNINGS='ignore')
+    results = {}
+    try:
+        cases = list(IMPORT_CASES) + ([] if args.skip_db else list(SCHEMA_CASES))
+        for case in cases:
+            samples = []
+            for _ in range(args.repeat):
+                if case.endswith('cold'):
+                    shutil.rmtree(snapshot_dir, ignore_errors=True)
+                samples.append(_run(case, env))
+            seconds = [s['seconds'] for s in samples]
+            result = {'median_ms': statistics.median(seconds) * 1000, 'min_ms': min(seconds) * 1000}
+            for part in ('import', 'connect', 'schema', 'queries'):
+                if part in samples[0]:
+                    values = [s[part] for s in samples]
+                    result[part if part == 'queries' else f'{part}_ms'] = (
+                        statistics.median(values) * (1 if part == 'queries' else 1000))
+            results[case] = result
+            extra = (f"  (connect {result['connect_ms']:.1f}, schema {result['schema_ms']:.1f} ms, "
+                     f"{result['queries']:.0f} queries)" if 'queries' in result else '')
+            print(f"{case:40} median {result['median_ms']:8.1f} ms  min {result['min_ms']:8.1f} ms{extra}")
+    finally:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+
+    if args.output:
+        out_dir = os.path.dirname(args.output)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'repeat': args.repeat, 'results': results}, f, indent=2)
+        print(f'\nWrote {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,28 @@
+from __future__ import annotations
+
+import datetime
+import io
 import os
-from typing import Optional, List, Any
+import tempfile
+import time
+from typing import Optional, List, Tuple
 
 import streamlit as st
-import pandas as pd
 
+import allocation
+import search
 from db import (
-    get_connection, list_tables, fetch_table, describe_table, 
-    list_procedures, list_routines, call_procedure, call_routine, insert_record, update_record,
-    delete_record, get_record_by_id, get_procedure_info
+    get_pool, ConnectionPool, describe_table, call_routine, insert_record, update_record,
+    delete_record, get_record_by_id, get_schema, invalidate_schema, fetch_page,
+    insert_records, upsert_records, BatchResult, result_cache, capture_queries, query_stats,
+    count_rows, run_parallel, column_kind, hostel_occupancy, room_occupancy, dues_summary, pending_dues,
+    visit_counts, summaries_installed, student_summary, call_routine_many, unallocated_students,
+    EXPORT_FORMATS, export_table, lazy_import, add_write_listener, calculate_age_group, AGE_GROUP_BINS,
+    AGE_GROUP_LABELS
 )
 
+pd = lazy_import('pandas')
+
 # Set the browser tab title for the app. Keep the existing icon (do not change page_icon).
 st.set_page_config(page_title="Hostel Management System")
 
@@ -31,27 +44,204 @@ def sidebar_connect():
     return st.session_state.db_config
 
 
-def show_tables(conn):
+@st.cache_resource(show_spinner=False)
+def connection_pool(db_config: dict) -> ConnectionPool:
+    """Shared pool for a connection config, kept across reruns and sessions."""
+    return get_pool(db_config)
+
+
+def sidebar_pool_stats(pool: ConnectionPool):
+    with st.sidebar.expander('Connection pool'):
+        stats = pool.stats()
+        st.text(f"Open: {stats['size']}/{stats['max_size']} (idle {stats['idle']})")
+        st.text(f"Hits: {stats['hits']}  Misses: {stats['misses']}  Hit rate: {stats['hit_rate']:.0%}")
+        st.text(f"Waits: {stats['waits']}  Avg wait: {stats['avg_wait'] * 1000:.1f} ms  Busy: {stats['busy']}")
+    with st.sidebar.expander('Query cache'):
+        stats = result_cache.stats()
+        st.text(f"Entries: {stats['entries']}  Memory: {stats['bytes'] / 1024:.0f}/{stats['max_bytes'] / 1024:.0f} KiB")
+        st.text(f"Hits: {stats['hits']}  Misses: {stats['misses']}  Hit rate: {stats['hit_rate']:.0%}")
+        st.text(f"Invalidated by writes: {stats['stale']}  Evicted: {stats['evictions']}")
+
+
+def sidebar_query_profile(events):
+    """Show the statements issued during this rerun and what they cost."""
+    with st.sidebar.expander(f'Queries this run ({len(events)})'):
+        if not events:
+            st.text('No queries.')
+        else:
+            total = sum(e.wall_time for e in events)
+            issued = sum(1 for e in events if not e.cached and e.sql)
+            st.text(f'{issued} issued, {len(events) - issued} cached/pool, {total * 1000:.1f} ms total')
+            st.dataframe(pd.DataFrame([{
+                'function': e.function, 'table': e.table or '', 'ms': round(e.wall_time * 1000, 2),
+                'wait ms': round(e.wait_time * 1000, 2), 'rows': e.rows, 'KiB': round(e.bytes / 1024, 1),
+                'cached': e.cached, 'params': e.params_shape, 'error': e.error or '', 'sql': ' '.join(e.sql.split()),
+            } for e in events]))
+    with st.sidebar.expander('Query latency (all sessions)'):
+        stats = query_stats()
+        if stats:
+            df = pd.DataFrame(stats)
+            for col in ('p50', 'p95', 'p99', 'max'):
+                df[col] = (df[col] * 1000).round(2)
+            st.dataframe(df.rename(columns={c: f'{c} ms' for c in ('p50', 'p95', 'p99', 'max')}))
+
+
+def _set_page_cursor(state_key: str, direction: Optional[str], cursor):
+    state = st.session_state[state_key]
+    state['after'] = cursor if direction == 'after' else None
+    state['before'] = cursor if direction == 'before' else None
+
+
+PAGE_SIZES = [25, 50, 100, 500]
+
+
+def filter_controls(schema, table: str, state_key: str) -> Tuple[tuple, List[str], bool]:
+    """Filter and sort widgets for a table, applied on the server by fetch_page.
+
+    Text columns get a "starts with" search and numeric/date columns a
+    from/to range. Returns (filters, order_by, descending).
+    """
+    filters = []
+    desc = schema.describe(table)
+    with st.expander('Filter and sort'):
+        for name, col_type, *_ in desc:
+            kind = column_kind(col_type)
+            key = f'{state_key}_{table}_{name}'
+            if kind == 'text':
+                value = st.text_input(f'{name} starts with', key=key)
+                if value:
+                    filters.append((name, 'prefix', value))
+            elif kind in ('int', 'decimal', 'float', 'date', 'datetime'):
+                hint = 'YYYY-MM-DD' if kind in ('date', 'datetime') else ''
+                low_col, high_col = st.columns(2)
+                low = low_col.text_input(f'{name} from', key=f'{key}_low', placeholder=hint)
+                high = high_col.text_input(f'{name} to', key=f'{key}_high', placeholder=hint)
+                if low or high:
+                    filters.append((name, 'between', (low or None, high or None)))
+        sort_col, direction_col = st.columns([3, 1])
+        order = sort_col.selectbox('Sort by', ['(primary key)'] + [row[0] for row in desc], key=f'{state_key}_{table}_sort')
+        descending = direction_col.checkbox('Descending', key=f'{state_key}_{table}_desc')
+    return tuple(filters), ([] if order == '(primary key)' else [order]), descending
+
+
+def page_call(table: str, state_key: str, filters: tuple = (), order_by: Optional[List[str]] = None,
+              descending: bool = False) -> tuple:
+    """fetch_page call for the page currently on screen, for run_parallel."""
+    query = (filters, tuple(order_by or ()), descending)
+    state = st.session_state.get(state_key)
+    if state is None or state['table'] != table or state.get('query') != query:
+        # A new table, filter or sort order starts again from the first page.
+        state = st.session_state[state_key] = {'table': table, 'query': query, 'after': None, 'before': None}
+    # The size widget is drawn later by show_page; its last value is already in session state.
+    page_size = st.session_state.get(f'{state_key}_size', PAGE_SIZES[1])
+    return fetch_page, table, page_size, state['after'], state['before'], filters, order_by, descending
+
+
+def show_page(page, state_key: str, total_rows: Optional[int] = None, filtered: bool = False):
+    """Render one keyset-paginated page of a table with Previous/Next controls."""
+    st.selectbox('Rows per page', PAGE_SIZES, index=1, key=f'{state_key}_size')
+    if total_rows is not None:
+        st.caption(f'{total_rows:,} matching rows' if filtered else f'About {total_rows:,} rows in total')
+    st.dataframe(pd.DataFrame(page.rows, columns=page.columns))
+    first_col, prev_col, next_col = st.columns(3)
+    first_col.button('First', key=f'{state_key}_first', on_click=_set_page_cursor, args=(state_key, None, None),
+                     disabled=page.prev_cursor is None)
+    prev_col.button('Previous', key=f'{state_key}_prev', on_click=_set_page_cursor,
+                    args=(state_key, 'before', page.prev_cursor), disabled=page.prev_cursor is None)
+    next_col.button('Next', key=f'{state_key}_next', on_click=_set_page_cursor,
+                    args=(state_key, 'after', page.next_cursor), disabled=page.next_cursor is None)
+    return page
+
+
+def show_tables(conn, pool: ConnectionPool):
     st.header('Tables')
     try:
-        tables = list_tables(conn)
+        schema = get_schema(conn)
     except Exception as e:
         st.error(f'Error listing tables: {e}')
         return
 
-    table = st.selectbox('Select table', options=[''] + tables)
+    table = st.selectbox('Select table', options=[''] + schema.tables)
     if table:
-        cols, rows = fetch_table(conn, table, limit=500)
+        filters, order_by, descending = filter_controls(schema, table, 'tables_page')
+        # Schema, preview page and row count are independent: fetch them together.
+        try:
+            loaded = run_parallel(pool, {
+                'desc': (describe_table, table),
+                'page': page_call(table, 'tables_page', filters, order_by, descending),
+                'count': (count_rows, table, False, filters),
+            }, conn)
+        except Exception as e:
+            st.error(f'Error loading table: {e}')
+            return
         st.subheader('Schema')
-        desc = describe_table(conn, table)
-        st.dataframe(pd.DataFrame(desc, columns=['Field', 'Type', 'Null', 'Key', 'Default', 'Extra']))
+        st.dataframe(pd.DataFrame(loaded['desc'], columns=['Field', 'Type', 'Null', 'Key', 'Default', 'Extra']))
         st.subheader('Preview')
-        df = pd.DataFrame(rows, columns=cols)
-        st.dataframe(df)
+        show_page(loaded['page'], 'tables_page', loaded['count'], bool(filters))
+        show_export(conn, table, filters)
+
+
+# The download button holds the whole file in server memory, so the app only
+# offers exports up to this size; larger ones should use export.py.
+EXPORT_DOWNLOAD_LIMIT_MB = int(os.getenv('EXPORT_DOWNLOAD_MAX_MB', '100'))
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), 'hostel-exports')
+EXPORT_MAX_AGE = 3600  # seconds an undownloaded export file is kept
 
 
+def _discard_export():
+    """Delete this session's prepared export file (also the download button's on_click)."""
+    export = st.session_state.pop('export', None)
+    if export and os.path.exists(export[2].path):
+        os.remove(export[2].path)
 
 
+def _sweep_exports():
+    """Remove export files left behind by sessions that never downloaded them."""
+    cutoff = time.time() - EXPORT_MAX_AGE
+    for entry in os.scandir(EXPORT_DIR):
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def show_export(conn, table: str, filters):
+    """Export the whole table (with the current filters) to a file for download."""
+    with st.expander('Export'):
+        fmt = st.selectbox('Format', EXPORT_FORMATS, key='export_format')
+        st.caption(f'Downloads are limited to {EXPORT_DOWNLOAD_LIMIT_MB} MB; '
+                   f'use `python export.py {table}` for larger exports.')
+        if st.button('Prepare export'):
+            _discard_export()
+            os.makedirs(EXPORT_DIR, exist_ok=True)
+            _sweep_exports()
+            # Written to a temporary file chunk by chunk rather than built up in memory
+            fd, path = tempfile.mkstemp(prefix=f'{table}-', suffix=f'.{fmt}', dir=EXPORT_DIR)
+            os.close(fd)
+            try:
+                with st.spinner('Exporting...'):
+                    result = export_table(conn, table, path, fmt, filters)
+            except Exception as e:
+                os.remove(path)
+                st.error(f'Export failed: {e}')
+                return
+            if result.bytes > EXPORT_DOWNLOAD_LIMIT_MB * 1024 * 1024:
+                os.remove(path)
+                st.warning(f'The export is {result.bytes / 1e6:,.1f} MB ({result.rows:,} rows), over the '
+                           f'{EXPORT_DOWNLOAD_LIMIT_MB} MB download limit. Run '
+                           f'`python export.py {table} --format {fmt}` instead.')
+                return
+            st.session_state['export'] = (table, tuple(filters), result, fmt)
+        export = st.session_state.get('export')
+        if export and export[:2] == (table, tuple(filters)) and os.path.exists(export[2].path):
+            _, _, result, fmt = export
+            st.caption(f'{result.rows:,} rows, {result.bytes / 1e6:,.1f} MB in {result.seconds:.1f}s '
+                       f'({result.rows_per_second:,.0f} rows/s)')
+            with open(result.path, 'rb') as f:
+                # The file is deleted once downloaded; prepare again for another copy
+                st.download_button('Download', f, file_name=f'{table}.{fmt}', on_click=_discard_export)
+
 
 def show_procedures(conn, database: Optional[str]):
     st.header('Stored Procedures & Functions')
@@ -63,7 +253,8 @@ def show_procedures(conn, database: Optional[str]):
     routine_type = 'PROCEDURE' if selection == 'Procedures' else 'FUNCTION'
     
     try:
-        routines = list_routines(conn, routine_type, schema=database)
+        schema = get_schema(conn, database)
+        routines = schema.routine_names(routine_type)
         if not routines:
             st.info(f'No stored {selection.lower()} found in the database.')
             return
@@ -75,7 +266,7 @@ def show_procedures(conn, database: Optional[str]):
     if routine_name:
         try:
             # Get routine information with correct type
-            params, description = get_procedure_info(conn, routine_name, database, routine_type)
+            params, description = schema.procedure_info(routine_name, routine_type)
             
             # Show parameter information
             if params:
@@ -87,6 +278,11 @@ def show_procedures(conn, database: Optional[str]):
                         continue
                     param_info.append(f"- **{param_name}** ({param_mode}): {param_type}")
                 st.markdown("\n".join(param_info))
+
+                if st.radio('Run', ['Single call', 'Batch from file'], horizontal=True) == 'Batch from file':
+                    show_routine_batch(conn, routine_name, routine_type,
+                                       [p[0] for p in params if not (routine_type == 'FUNCTION' and p[1] is None)])
+                    return
                 
                 # Create input fields for each parameter
                 args = []
@@ -129,38 +325,193 @@ def show_procedures(conn, database: Optional[str]):
             st.error(f'Error getting {selection.lower()[:-1]} information: {e}')
 
 
-def calculate_age_group(age: int) -> str:
-    if age <= 10:
-        return "0-10"
-    elif age <= 17:
-        return "11-17"
-    elif age <= 22:
-        return "18-22"
-    elif age <= 35:
-        return "23-35"
+def show_routine_batch(conn, name: str, routine_type: str, param_names: List[str]):
+    """Call a routine once per row of an uploaded CSV or Excel file."""
+    upload = st.file_uploader(f"CSV or Excel file, one row per call (columns: {', '.join(param_names)})",
+                              type=['csv', 'xlsx', 'xls'], key='routine_upload')
+    batch_size = int(st.number_input('Calls per batch', min_value=1, max_value=5000, value=200, step=50))
+    if upload is None or not st.button(f'Run {name} for every row'):
+        return
+
+    df = pd.concat(_read_upload(upload, 10000), ignore_index=True)
+    if all(p in df.columns for p in param_names):
+        df = df[param_names]
+    elif len(df.columns) == len(param_names):
+        # No matching header: take the columns in parameter order
+        df.columns = param_names
+    else:
+        st.error(f'Expected columns {", ".join(param_names)}; the file has {", ".join(map(str, df.columns))}.')
+        return
+    arg_rows = [list(row.values()) for row in _records(df)]
+    with st.spinner(f'Calling {name} {len(arg_rows):,} times...'):
+        try:
+            outcome = call_routine_many(conn, name, arg_rows, routine_type, batch_size)
+        except Exception as e:
+            st.error(f'Error calling {name}: {e}')
+            return
+
+    failed = len(outcome.errors)
+    if outcome.ok:
+        st.success(f'{len(arg_rows):,} calls succeeded in {outcome.batches} batches.')
+    else:
+        undone = ' and were rolled back' if routine_type == 'PROCEDURE' else ''
+        st.error(f'{len(arg_rows) - failed:,} of {len(arg_rows):,} calls succeeded; {failed:,} failed{undone}.')
+        st.dataframe(pd.DataFrame([{'row': i + 1, **df.iloc[i].to_dict(), 'error': message}
+                                   for i, message in outcome.errors]))
+    results = df.copy()
+    if routine_type == 'FUNCTION':
+        results['return value'] = outcome.results
+    else:
+        results['result rows'] = [sum(len(rs) for rs in r) if r is not None else None for r in outcome.results]
+    st.dataframe(results)
+
+
+def age_groups(ages: pd.Series) -> pd.Series:
+    """Vectorised calculate_age_group for a whole column of ages."""
+    return pd.cut(pd.to_numeric(ages, errors='coerce'), bins=AGE_GROUP_BINS, labels=AGE_GROUP_LABELS).astype(object)
+
+
+def _read_upload(upload, chunk_size: int):
+    """Yield DataFrame chunks from an uploaded CSV or Excel file."""
+    if upload.name.lower().endswith(('.xlsx', '.xls')):
+        df = pd.read_excel(upload)
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start:start + chunk_size]
     else:
-        return "36-above"
+        yield from pd.read_csv(upload, chunksize=chunk_size)
+
 
-def show_crud(conn):
+def _records(df: pd.DataFrame) -> List[dict]:
+    # NaN/NaT -> None so missing cells are inserted as NULL
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def show_bulk_import(conn, table: str, columns: List[str]):
+    upload = st.file_uploader('CSV or Excel file (first row must hold column names)', type=['csv', 'xlsx', 'xls'])
+    on_duplicate = st.radio('Rows whose key already exists', ['Reject batch', 'Update existing row'], horizontal=True)
+    batch_size = int(st.number_input('Batch size', min_value=1, max_value=10000, value=500, step=100))
+    if upload is None or not st.button('Import file'):
+        return
+
+    write = upsert_records if on_duplicate == 'Update existing row' else insert_records
+    total = BatchResult()
+    ignored = set()
+    seen = 0
+    progress = st.empty()
+    try:
+        for chunk in _read_upload(upload, batch_size * 20):
+            unknown = [col for col in chunk.columns if col not in columns]
+            ignored.update(unknown)
+            chunk = chunk.drop(columns=unknown)
+            if table == 'student' and 'age' in chunk.columns:
+                chunk['age_group'] = age_groups(chunk['age'])
+            result = write(conn, table, _records(chunk), batch_size)
+            # Report batch numbers and row offsets relative to the whole file
+            total.errors.extend((total.batches + number, seen + offset, message)
+                                for number, offset, message in result.errors)
+            total.rows += result.rows
+            total.batches += result.batches
+            seen += len(chunk)
+            progress.text(f'Imported {total.rows} rows in {total.batches} batches...')
+    except Exception as e:
+        st.error(f'Error reading file: {e}')
+        return
+
+    if ignored:
+        st.warning(f"Ignored columns not in `{table}`: {', '.join(sorted(ignored))}")
+    if total.ok:
+        st.success(f'Imported {total.rows} rows in {total.batches} batches.')
+    else:
+        st.error(f'Imported {total.rows} rows; {len(total.errors)} of {total.batches} batches failed and were rolled back.')
+        st.dataframe(pd.DataFrame(total.errors, columns=['Batch', 'First row', 'Error']))
+
+
+@st.cache_resource(show_spinner=False)
+def search_index() -> search.SearchIndex:
+    """Name/phone search index shared by all sessions and kept current by db.py writes."""
+    index = search.SearchIndex()
+    add_write_listener(index.on_write)
+    return index
+
+
+def fk_pickers(conn, schema, table: str, state_key: str, current: Optional[dict] = None) -> dict:
+    """Typeahead pickers for the table's foreign keys, shown above its form.
+
+    Each one searches the parent table by name, phone or ID in the in-memory
+    index, so no rows are fetched while typing. A number typed in is offered
+    as the key itself, even if the index has no entry for it. Returns
+    {column: chosen key, or None if nothing was chosen} for the columns that
+    got a picker.
+    """
+    index = search_index()
+    fks = [(column, parent) for column, parent, parent_column, _, _ in schema.foreign_keys.get(table, [])
+           if parent in index.sources and index.sources[parent].key == parent_column]
+    if not fks:
+        return {}
+    index.ensure(conn, {parent for _, parent in fks})
+    picked = {}
+    for column, parent in fks:
+        search_col, pick_col = st.columns(2)
+        query = search_col.text_input(f'Find {parent} for {column}', key=f'{state_key}_{column}_query',
+                                      placeholder='Name, phone or ID')
+        matches = index.search(conn, parent, query) if query else []
+        labels = {match.key: match.label for match in matches}
+        if query.strip().isdigit() and int(query) not in labels:
+            labels = {int(query): 'not in the search index', **labels}
+        value = (current or {}).get(column)
+        if value is not None and value not in labels:
+            labels = {value: index.label(conn, parent, value) or '', **labels}
+        options = list(labels)
+        picked[column] = pick_col.selectbox(column, options, index=0 if options else None,
+                                            format_func=lambda key: f'{key} · {labels.get(key, "")}',
+                                            placeholder='Type to search', key=f'{state_key}_{column}_pick')
+    return picked
+
+
+def missing_keys(picked: dict, desc) -> List[str]:
+    """NOT NULL foreign key columns whose picker has nothing chosen."""
+    required = {row[0] for row in desc if str(row[2]).upper() == 'NO'}
+    return [col for col, value in picked.items() if value is None and col in required]
+
+
+def show_crud(conn, pool: ConnectionPool):
     st.header('CRUD Operations')
     
     # Select table first
-    tables = list_tables(conn)
-    table = st.selectbox('Select table', options=[''] + tables, key='crud_table')
+    schema = get_schema(conn)
+    table = st.selectbox('Select table', options=[''] + schema.tables, key='crud_table')
     
     if not table:
         return
         
     # Get table structure
-    desc = describe_table(conn, table)
+    desc = schema.describe(table)
     columns = [row[0] for row in desc]
-    pk_col = next((row[0] for row in desc if 'PRI' in row[3]), columns[0])
+    pk_col = (schema.primary_key(table) or columns)[0]
     
     # CRUD Operations selector
     operation = st.selectbox('Operation', ['Create', 'Read', 'Update', 'Delete'])
+
+    if operation != 'Create':
+        filters, order_by, descending = filter_controls(schema, table, 'crud_page')
+        # The page on screen and the row count are fetched together.
+        try:
+            loaded = run_parallel(pool, {
+                'page': page_call(table, 'crud_page', filters, order_by, descending),
+                'count': (count_rows, table, False, filters),
+            }, conn)
+        except Exception as e:
+            st.error(f'Error loading records: {e}')
+            return
     
     if operation == 'Create':
         st.subheader('Create New Record')
+        source = st.radio('Input', ['Form', 'Upload CSV/Excel'], horizontal=True)
+        if source == 'Upload CSV/Excel':
+            show_bulk_import(conn, table, columns)
+            return
+        # Foreign keys are picked by search outside the form, which can't rerun while typing
+        picked = fk_pickers(conn, schema, table, 'crud_create')
         # Create form for inserting new record
         with st.form('insert_form'):
             data = {}
@@ -170,6 +521,9 @@ def show_crud(conn):
                 # Skip auto-increment fields
                 if 'auto_increment' in str(details[5]).lower():
                     continue
+                if col in picked:
+                    data[col] = picked[col]
+                    continue
 
                 field_type = str(details[1]).lower()
                 col_lower = col.lower()
@@ -212,6 +566,10 @@ def show_crud(conn):
                 data[col] = st.text_input(f'{col} ({field_type})')
             
             if st.form_submit_button('Insert Record'):
+                missing = missing_keys(picked, desc)
+                if missing:
+                    st.error(f"Choose {', '.join(missing)} above before inserting.")
+                    return
                 try:
                     # Set age_group automatically for student table
                     if table == 'student' and age_value is not None:
@@ -224,31 +582,35 @@ def show_crud(conn):
     
     elif operation == 'Read':
         st.subheader('View Records')
-        cols, rows = fetch_table(conn, table, limit=1000)
-        df = pd.DataFrame(rows, columns=cols)
-        st.dataframe(df)
+        show_page(loaded['page'], 'crud_page', loaded['count'], bool(filters))
         
     elif operation == 'Update':
         st.subheader('Update Record')
         # First select record to update
-        cols, rows = fetch_table(conn, table, limit=1000)
-        df = pd.DataFrame(rows, columns=cols)
-        st.dataframe(df)
+        show_page(loaded['page'], 'crud_page', loaded['count'], bool(filters))
         
         # Step 1: Form to get the record ID
         with st.form('select_record_form'):
             record_id = st.text_input(f'Enter {pk_col} of record to update')
             submit_get_record = st.form_submit_button('Get Record')
         
-        # Step 2: If we have a record ID and user clicked to get it, show update form
+        # Step 2: Remember the chosen record, so the pickers and the update form survive reruns
         if record_id and submit_get_record:
+            st.session_state['crud_update_record'] = (table, record_id)
+        selected = st.session_state.get('crud_update_record')
+        record_id = selected[1] if selected and selected[0] == table else None
+        if record_id:
             record = get_record_by_id(conn, table, pk_col, record_id)
             if record:
+                picked = fk_pickers(conn, schema, table, 'crud_update', dict(zip(columns, record)))
                 with st.form('update_record_form'):
                     data = {}
                     age_value = None
                     
                     for col, val, details in zip(columns, record, desc):
+                        if col in picked and col != pk_col:
+                            data[col] = picked[col]
+                            continue
                         if col != pk_col:  # Don't update primary key
                             field_type = str(details[1]).lower()
                             col_lower = col.lower()
@@ -310,6 +672,10 @@ def show_crud(conn):
                     
                     submit_update = st.form_submit_button('Update Record')
                     if submit_update:
+                        missing = missing_keys({col: value for col, value in picked.items() if col != pk_col}, desc)
+                        if missing:
+                            st.error(f"Choose {', '.join(missing)} above before updating.")
+                            return
                         try:
                             rows_affected = update_record(conn, table, data, {pk_col: record_id})
                             st.success(f'Updated {rows_affected} record(s) successfully!')
@@ -320,9 +686,7 @@ def show_crud(conn):
     
     elif operation == 'Delete':
         st.subheader('Delete Record')
-        cols, rows = fetch_table(conn, table, limit=1000)
-        df = pd.DataFrame(rows, columns=cols)
-        st.dataframe(df)
+        show_page(loaded['page'], 'crud_page', loaded['count'], bool(filters))
         
         with st.form('delete_form'):
             record_id = st.text_input(f'Enter {pk_col} of record to delete')
@@ -337,6 +701,117 @@ def show_crud(conn):
                     except Exception as e:
                         st.error(f'Error deleting record: {e}')
 
+def _frame(result) -> pd.DataFrame:
+    columns, rows = result
+    return pd.DataFrame(rows, columns=columns)
+
+
+def show_dashboard(conn, pool: ConnectionPool):
+    st.header('Dashboard')
+    list_col, period_col = st.columns(2)
+    top_n = list_col.selectbox('Students listed', [25, 100, 500], index=1)
+    period = period_col.selectbox('Visits in', ['Last 30 days', 'Last 365 days', 'All time'])
+    days = {'Last 30 days': 30, 'Last 365 days': 365}.get(period)
+    since = datetime.date.today() - datetime.timedelta(days=days) if days else None
+
+    # One grouped query per panel, all issued together and cached until their tables change.
+    try:
+        loaded = run_parallel(pool, {
+            'occupancy': (hostel_occupancy,),
+            'dues': (dues_summary,),
+            'owing': (pending_dues, top_n),
+            'visits': (visit_counts, since, top_n),
+        }, conn)
+    except Exception as e:
+        st.error(f'Error loading dashboard: {e}')
+        return
+
+    occupancy = _frame(loaded['occupancy'])
+    for col in ('rooms', 'capacity', 'occupants', 'free'):
+        occupancy[col] = occupancy[col].astype(int)
+    capacity, occupants = occupancy['capacity'].sum(), occupancy['occupants'].sum()
+    dues = _frame(loaded['dues']).iloc[0]
+    metrics = st.columns(4)
+    metrics[0].metric('Occupancy', f'{occupants / capacity:.0%}' if capacity else '-', help=f'{occupants:,} of {capacity:,} beds')
+    metrics[1].metric('Free beds', f'{capacity - occupants:,}')
+    metrics[2].metric('Pending dues', f"{float(dues['pending']):,.0f}", help=f"{float(dues['overdue']):,.0f} overdue")
+    metrics[3].metric('Students owing', f"{int(dues['students']):,}", help=f"{int(dues['open_fees']):,} unpaid fees")
+
+    st.subheader('Occupancy by hostel')
+    if occupancy.empty:
+        st.info('No hostels yet.')
+    else:
+        st.bar_chart(occupancy.set_index('name')[['occupants', 'free']])
+        occupancy['occupancy'] = (occupancy['occupants'] / occupancy['capacity'].where(occupancy['capacity'] > 0)).round(3)
+        st.dataframe(occupancy)
+        names = dict(zip(occupancy['hostel_id'], occupancy['name']))
+        hostel_id = st.selectbox('Rooms in hostel', list(names), format_func=lambda h: f'{h} - {names[h]}')
+        rooms = _frame(room_occupancy(conn, hostel_id))
+        if st.checkbox('Only rooms with free beds'):
+            rooms = rooms[rooms['free'] > 0]
+        st.dataframe(rooms)
+
+    if summaries_installed(conn):
+        st.subheader('Student lookup')
+        student_id = st.number_input('Student ID', min_value=1, step=1)
+        summary = student_summary(conn, int(student_id))
+        if summary is None:
+            st.info('No such student.')
+        else:
+            cols = st.columns(4)
+            cols[0].metric('Unpaid fees', summary['open_fees'])
+            cols[1].metric('Pending', f"{float(summary['pending']):,.0f}")
+            cols[2].metric('Visits', summary['visits'])
+            cols[3].metric('Last visit', str(summary['last_visit'] or '-'))
+
+    st.subheader(f'Largest pending dues (top {top_n})')
+    st.dataframe(_frame(loaded['owing']))
+    st.subheader(f'Most visited students, {period.lower()} (top {top_n})')
+    st.dataframe(_frame(loaded['visits']))
+
+
+def show_allocation(conn):
+    st.header('Room Allocation')
+    st.caption('Plan first, review, then write the whole plan in one transaction.')
+    policy = st.selectbox('Policy', allocation.POLICIES)
+    names = {row[0]: row[1] for row in hostel_occupancy(conn)[1]}
+    hostels = st.multiselect('Only hostels (empty = all)', list(names), format_func=lambda h: f'{h} - {names[h]}')
+    source = st.radio('Students', ['All unallocated', 'Upload CSV'], horizontal=True)
+    upload = None
+    if source == 'Upload CSV':
+        upload = st.file_uploader('CSV with student_id and an optional preferred hostel_id column', type=['csv'])
+    limit = int(st.number_input('At most', min_value=1, value=1000, step=100))
+
+    if st.button('Plan allocation'):
+        preferences = {}
+        if upload is None:
+            if source == 'Upload CSV':
+                st.error('Upload a CSV first.')
+                return
+            students = unallocated_students(conn, limit)
+        else:
+            # Same parser as the CLI, so a header row is optional here too
+            students, preferences = allocation.parse_students(io.StringIO(upload.getvalue().decode('utf-8-sig')))
+            students = students[:limit]
+        st.session_state['allocation_plan'] = allocation.plan_allocation(conn, students, policy, hostels, preferences)
+
+    plan = st.session_state.get('allocation_plan')
+    if plan is None:
+        return
+    st.subheader(f'Plan ({plan.policy})')
+    st.text(f'{len(plan.assignments):,} students placed, {len(plan.unplaced):,} without a free bed')
+    st.dataframe(plan.summary())
+    with st.expander('Assignments'):
+        st.dataframe(pd.DataFrame(plan.assignments, columns=['student_id', 'room_id']))
+    if plan.assignments and st.button('Apply plan'):
+        try:
+            result = allocation.apply_plan(conn, plan)
+            st.success(f'Allocated {result.rows:,} students.')
+            del st.session_state['allocation_plan']
+        except Exception as e:
+            st.error(f'Allocation not written: {e}')
+
+
 def main():
     # Centered single-line title (prevent wrapping) and centered subtitle
     st.markdown(
@@ -350,22 +825,39 @@ def main():
 
     db_config = sidebar_connect()
 
-    conn = None
-    if db_config:
-        try:
-            conn = get_connection(db_config)
-            st.success('Connected')
-        except Exception as e:
-            st.error(f'Connection error: {e}')
-
-    if conn:
-        tab = st.radio('Choose', ['Tables', 'Procedures and Functions', 'CRUD'])
-        if tab == 'Tables':
-            show_tables(conn)
-        elif tab == 'Procedures and Functions':
-            show_procedures(conn, db_config.get('database'))
-        elif tab == 'CRUD':
-            show_crud(conn)
+    with capture_queries() as events:
+        conn = None
+        pool = None
+        if db_config:
+            try:
+                pool = connection_pool(db_config)
+                conn = pool.acquire()
+                st.success('Connected')
+            except Exception as e:
+                st.error(f'Connection error: {e}')
+
+        if conn:
+            try:
+                if st.sidebar.button('Reload schema'):
+                    invalidate_schema(conn)
+                    search_index().invalidate(conn)
+                tab = st.radio('Choose', ['Tables', 'Procedures and Functions', 'CRUD', 'Dashboard', 'Allocation'])
+                if tab == 'Tables':
+                    show_tables(conn, pool)
+                elif tab == 'Procedures and Functions':
+                    show_procedures(conn, db_config.get('database'))
+                elif tab == 'CRUD':
+                    show_crud(conn, pool)
+                elif tab == 'Dashboard':
+                    show_dashboard(conn, pool)
+                elif tab == 'Allocation':
+                    show_allocation(conn)
+            finally:
+                # Hand the connection back so the next rerun reuses it.
+                pool.release(conn)
+    if pool:
+        sidebar_pool_stats(pool)
+        sidebar_query_profile(events)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,108 @@
+"""Install, rebuild and verify the trigger-maintained summary tables.
+
+    python summaries.py install          # create tables and triggers from summary.sql, then rebuild
+    python summaries.py verify           # exit 1 if any summary row has drifted
+    python summaries.py verify --fix     # rebuild when drift is found
+    python summaries.py rebuild
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Iterator
+
+import db
+from db import MySQLConnection
+
+
+SUMMARY_SQL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'summary.sql')
+
+
+def script_statements(script: str) -> Iterator[str]:
+    """Split a mysql client script into statements, honouring DELIMITER lines."""
+    delimiter = ';'
+    buffer = []
+    for line in script.splitlines():
+        stripped = line.strip()
+        if stripped.upper().startswith('DELIMITER '):
+            delimiter = stripped.split(None, 1)[1]
+            continue
+        if not buffer and (not stripped or stripped.startswith('--')):
+            continue
+        buffer.append(line)
+        if stripped.endswith(delimiter):
+            buffer[-1] = line.rstrip()[:-len(delimiter)]
+            statement = '\n'.join(buffer).strip()
+            buffer = []
+            if statement:
+                yield statement
+    if ''.join(buffer).strip():
+        yield '\n'.join(buffer).strip()
+
+
+def install(conn: MySQLConnection) -> None:
+    with open(SUMMARY_SQL) as f:
+        script = f.read()
+    cur = conn.cursor()
+    try:
+        for statement in script_statements(script):
+            cur.execute(statement)
+    finally:
+        cur.close()
+    conn.commit()
+    # New tables and triggers change what writes invalidate
+    db.invalidate_schema(conn)
+    print(f'Installed summary tables and triggers from {SUMMARY_SQL}')
+
+
+def rebuild(conn: MySQLConnection) -> None:
+    started = time.perf_counter()
+    written = db.rebuild_summaries(conn)
+    counts = ', '.join(f'{table} {rows:,} rows' for table, rows in written.items())
+    print(f'Rebuilt {counts} in {time.perf_counter() - started:.1f}s')
+
+
+def verify(conn: MySQLConnection, show: int = 10) -> int:
+    """Print drifted rows and return how many there are."""
+    started = time.perf_counter()
+    drift = db.verify_summaries(conn)
+    total = 0
+    for table, rows in drift.items():
+        key, values, _, _ = db.SUMMARIES[table]
+        total += len(rows)
+        print(f"{table}: {len(rows) or 'no'} drifted row(s)")
+        for key_value, expected, stored in rows[:show]:
+            print(f'  {key}={key_value}  expected {dict(zip(values, expected)) if expected else "no row"}'
+                  f'  stored {dict(zip(values, stored)) if stored else "no row"}')
+        if len(rows) > show:
+            print(f'  ... {len(rows) - show} more')
+    print(f'Verified in {time.perf_counter() - started:.1f}s')
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('command', choices=['install', 'rebuild', 'verify'])
+    parser.add_argument('--database', help='Schema to use (default: DB_DATABASE)')
+    parser.add_argument('--fix', action='store_true', help='With verify: rebuild if drift is found')
+    args = parser.parse_args()
+
+    if args.database:
+        os.environ['DB_DATABASE'] = args.database
+    conn = db.get_connection()
+    try:
+        if args.command == 'install':
+            install(conn)
+            rebuild(conn)
+        elif args.command == 'rebuild':
+            rebuild(conn)
+        elif verify(conn):
+            if not args.fix:
+                sys.exit(1)
+            rebuild(conn)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+-- Summary tables kept current by triggers, so occupancy, dues and visit
+-- counts are primary-key lookups instead of scans over the history tables.
+-- Install with `python summaries.py install` (or the mysql client), which
+-- also fills them from the current data.
+--
+-- Foreign key cascades do not fire triggers. Deleting a student, visitor or
+-- room therefore accounts, in a BEFORE DELETE trigger, for the child rows
+-- the cascade is about to remove. Deleting a hostel drops its summary row.
+
+CREATE TABLE IF NOT EXISTS summary_hostel (
+    hostel_id INT PRIMARY KEY,
+    rooms INT NOT NULL DEFAULT 0,
+    capacity INT NOT NULL DEFAULT 0,
+    occupants INT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS summary_student (
+    student_id INT PRIMARY KEY,
+    open_fees INT NOT NULL DEFAULT 0,
+    pending DECIMAL(12,2) NOT NULL DEFAULT 0,
+    visits INT NOT NULL DEFAULT 0,
+    last_visit DATE,
+    KEY ix_summary_student_pending (pending),
+    KEY ix_summary_student_visits (visits)
+);
+
+DELIMITER //
+
+-- hostel
+
+DROP TRIGGER IF EXISTS summary_hostel_ai //
+CREATE TRIGGER summary_hostel_ai AFTER INSERT ON hostel FOR EACH ROW
+    INSERT IGNORE INTO summary_hostel (hostel_id) VALUES (NEW.hostel_id) //
+
+DROP TRIGGER IF EXISTS summary_hostel_au //
+CREATE TRIGGER summary_hostel_au AFTER UPDATE ON hostel FOR EACH ROW
+    UPDATE summary_hostel SET hostel_id = NEW.hostel_id
+    WHERE hostel_id = OLD.hostel_id AND NEW.hostel_id <> OLD.hostel_id //
+
+DROP TRIGGER IF EXISTS summary_hostel_ad //
+CREATE TRIGGER summary_hostel_ad AFTER DELETE ON hostel FOR EACH ROW
+    DELETE FROM summary_hostel WHERE hostel_id = OLD.hostel_id //
+
+-- room
+
+DROP TRIGGER IF EXISTS summary_room_ai //
+CREATE TRIGGER summary_room_ai AFTER INSERT ON room FOR EACH ROW
+    INSERT INTO summary_hostel (hostel_id, rooms, capacity) VALUES (NEW.hostel_id, 1, COALESCE(NEW.capacity, 0))
+    ON DUPLICATE KEY UPDATE rooms = rooms + 1, capacity = capacity + COALESCE(NEW.capacity, 0) //
+
+DROP TRIGGER IF EXISTS summary_room_au //
+CREATE TRIGGER summary_room_au AFTER UPDATE ON room FOR EACH ROW
+BEGIN
+    DECLARE moved INT DEFAULT 0;
+    IF NEW.hostel_id <> OLD.hostel_id THEN
+        SELECT COUNT(*) INTO moved FROM allocated WHERE room_id = NEW.room_id;
+        UPDATE summary_hostel
+        SET rooms = rooms - 1, capacity = capacity - COALESCE(OLD.capacity, 0), occupants = occupants - moved
+        WHERE hostel_id = OLD.hostel_id;
+        INSERT INTO summary_hostel (hostel_id, rooms, capacity, occupants)
+        VALUES (NEW.hostel_id, 1, COALESCE(NEW.capacity, 0), moved)
+        ON DUPLICATE KEY UPDATE rooms = rooms + 1, capacity = capacity + COALESCE(NEW.capacity, 0),
+                                occupants = occupants + moved;
+    ELSEIF NOT (NEW.capacity <=> OLD.capacity) THEN
+        UPDATE summary_hostel SET capacity = capacity - COALESCE(OLD.capacity, 0) + COALESCE(NEW.capacity, 0)
+        WHERE hostel_id = NEW.hostel_id;
+    END IF;
+END //
+
+DROP TRIGGER IF EXISTS summary_room_bd //
+CREATE TRIGGER summary_room_bd BEFORE DELETE ON room FOR EACH ROW
+    UPDATE summary_hostel
+    SET rooms = rooms - 1, capacity = capacity - COALESCE(OLD.capacity, 0),
+        occupants = occupants - (SELECT COUNT(*) FROM allocated WHERE room_id = OLD.room_id)
+    WHERE hostel_id = OLD.hostel_id //
+
+-- allocated
+
+DROP TRIGGER IF EXISTS summary_allocated_ai //
+CREATE TRIGGER summary_allocated_ai AFTER INSERT ON allocated FOR EACH ROW
+    UPDATE summary_hostel SET occupants = occupants + 1
+    WHERE hostel_id = (SELECT hostel_id FROM room WHERE room_id = NEW.room_id) //
+
+DROP TRIGGER IF EXISTS summary_allocated_au //
+CREATE TRIGGER summary_allocated_au AFTER UPDATE ON allocated FOR EACH ROW
+BEGIN
+    IF NEW.room_id <> OLD.room_id THEN
+        UPDATE summary_hostel SET occupants = occupants - 1
+        WHERE hostel_id = (SELECT hostel_id FROM room WHERE room_id = OLD.room_id);
+        UPDATE summary_hostel SET occupants = occupants + 1
+        WHERE hostel_id = (SELECT hostel_id FROM room WHERE room_id = NEW.room_id);
+    END IF;
+END //
+
+DROP TRIGGER IF EXISTS summary_allocated_ad //
+CREATE TRIGGER summary_allocated_ad AFTER DELETE ON allocated FOR EACH ROW
+    UPDATE summary_hostel SET occupants = occupants - 1
+    WHERE hostel_id = (SELECT hostel_id FROM room WHERE room_id = OLD.room_id) //
+
+-- student
+
+DROP TRIGGER IF EXISTS summary_student_ai //
+CREATE TRIGGER summary_student_ai AFTER INSERT ON student FOR EACH ROW
+    INSERT IGNORE INTO summary_student (student_id) VALUES (NEW.student_id) //
+
+DROP TRIGGER IF EXISTS summary_student_au //
+CREATE TRIGGER summary_student_au AFTER UPDATE ON student FOR EACH ROW
+    UPDATE summary_student SET student_id = NEW.student_id
+    WHERE student_id = OLD.student_id AND NEW.student_id <> OLD.student_id //
+
+DROP TRIGGER IF EXISTS summary_student_bd //
+CREATE TRIGGER summary_student_bd BEFORE DELETE ON student FOR EACH ROW
+BEGIN
+    -- The cascade removes the student's allocations without firing their triggers
+    UPDATE summary_hostel h
+    JOIN (SELECT r.hostel_id, COUNT(*) AS n
+          FROM allocated a JOIN room r ON r.room_id = a.room_id
+          WHERE a.student_id = OLD.student_id
+          GROUP BY r.hostel_id) gone ON gone.hostel_id = h.hostel_id
+    SET h.occupants = h.occupants - gone.n;
+    DELETE FROM summary_student WHERE student_id = OLD.student_id;
+END //
+
+-- visitor
+
+DROP TRIGGER IF EXISTS summary_visitor_bd //
+CREATE TRIGGER summary_visitor_bd BEFORE DELETE ON visitor FOR EACH ROW
+    -- The cascade removes the visitor's visits without firing their triggers
+    UPDATE summary_student s
+    JOIN (SELECT student_id, COUNT(*) AS n FROM visits
+          WHERE visitor_id = OLD.visitor_id GROUP BY student_id) gone ON gone.student_id = s.student_id
+    SET s.visits = s.visits - gone.n,
+        s.last_visit = (SELECT MAX(v.visit_date) FROM visits v
+                        WHERE v.student_id = s.student_id AND v.visitor_id <> OLD.visitor_id) //
+
+-- fees: only unpaid rows count towards open_fees and pending
+
+DROP TRIGGER IF EXISTS summary_fees_ai //
+CREATE TRIGGER summary_fees_ai AFTER INSERT ON fees FOR EACH ROW
+BEGIN
+    IF NEW.date_paid IS NULL THEN
+        INSERT INTO summary_student (student_id, open_fees, pending) VALUES (NEW.student_id, 1, NEW.amount)
+        ON DUPLICATE KEY UPDATE open_fees = open_fees + 1, pending = pending + NEW.amount;
+    END IF;
+END //
+
+DROP TRIGGER IF EXISTS summary_fees_au //
+CREATE TRIGGER summary_fees_au AFTER UPDATE ON fees FOR EACH ROW
+BEGIN
+    IF OLD.date_paid IS NULL THEN
+        UPDATE summary_student SET open_fees = open_fees - 1, pending = pending - OLD.amount
+        WHERE student_id = OLD.student_id;
+    END IF;
+    IF NEW.date_paid IS NULL THEN
+        INSERT INTO summary_student (student_id, open_fees, pending) VALUES (NEW.student_id, 1, NEW.amount)
+        ON DUPLICATE KEY UPDATE open_fees = open_fees + 1, pending = pending + NEW.amount;
+    END IF;
+END //
+
+DROP TRIGGER IF EXISTS summary_fees_ad //
+CREATE TRIGGER summary_fees_ad AFTER DELETE ON fees FOR EACH ROW
+BEGIN
+    IF OLD.date_paid IS NULL THEN
+        UPDATE summary_student SET open_fees = open_fees - 1, pending = pending - OLD.amount
+        WHERE student_id = OLD.student_id;
+    END IF;
+END //
+
+-- visits
+
+DROP TRIGGER IF EXISTS summary_visits_ai //
+CREATE TRIGGER summary_visits_ai AFTER INSERT ON visits FOR EACH ROW
+    INSERT INTO summary_student (student_id, visits, last_visit) VALUES (NEW.student_id, 1, NEW.visit_date)
+    ON DUPLICATE KEY UPDATE visits = visits + 1,
+                            last_visit = GREATEST(COALESCE(last_visit, NEW.visit_date), NEW.visit_date) //
+
+DROP TRIGGER IF EXISTS summary_visits_au //
+CREATE TRIGGER summary_visits_au AFTER UPDATE ON visits FOR EACH ROW
+BEGIN
+    IF NEW.student_id <> OLD.student_id OR NEW.visit_date <> OLD.visit_date THEN
+        UPDATE summary_student
+        SET visits = visits - 1,
+            last_visit = (SELECT MAX(visit_date) FROM visits WHERE student_id = OLD.student_id)
+        WHERE student_id = OLD.student_id;
+        INSERT INTO summary_student (student_id, visits, last_visit) VALUES (NEW.student_id, 1, NEW.visit_date)
+        ON DUPLICATE KEY UPDATE visits = visits + 1,
+                                last_visit = GREATEST(COALESCE(last_visit, NEW.visit_date), NEW.visit_date);
+    END IF;
+END //
+
+DROP TRIGGER IF EXISTS summary_visits_ad //
+CREATE TRIGGER summary_visits_ad AFTER DELETE ON visits FOR EACH ROW
+    UPDATE summary_student
+    SET visits = visits - 1,
+        last_visit = IF(OLD.visit_date < last_visit, last_visit,
+                        (SELECT MAX(visit_date) FROM visits WHERE student_id = OLD.student_id))
+    WHERE student_id = OLD.student_id //
+
+DELIMITER ;
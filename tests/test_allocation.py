@@ -0,0 +1,90 @@
+"""Unit tests for the allocation policies; rooms and students are faked."""
+import pytest
+
+import db
+from allocation import parse_students, plan_allocation
+
+# room_id, hostel_id, capacity, occupants
+ROOMS = [
+    (1, 10, 3, 2),  # 1 free bed
+    (2, 10, 2, 0),  # 2 free
+    (3, 10, 1, 1),  # full
+    (4, 20, 3, 0),  # 3 free
+    (5, 20, 2, 1),  # 1 free
+]
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    columns = ['room_id', 'hostel_id', 'capacity', 'occupants']
+    monkeypatch.setattr(db, 'room_occupancy', lambda conn: (columns, [list(room) for room in ROOMS]))
+    monkeypatch.setattr(db, 'unallocated_students', lambda conn: list(range(100, 120)))
+
+
+def _beds_used(plan):
+    used = {}
+    for _, room_id in plan.assignments:
+        used[room_id] = used.get(room_id, 0) + 1
+    return used
+
+
+def _check_capacity(plan):
+    for room in plan.rooms.values():
+        assert 0 <= room.occupants <= room.capacity
+
+
+def test_fill_first_tops_up_fullest_rooms(fake_db):
+    plan = plan_allocation(None, [100, 101, 102], 'fill-first')
+    # Rooms with one free bed first (1, then 5), then the room with two
+    assert plan.assignments == [(100, 1), (101, 5), (102, 2)]
+    assert plan.unplaced == []
+    _check_capacity(plan)
+
+
+def test_spread_uses_lowest_occupancy(fake_db):
+    plan = plan_allocation(None, [100, 101, 102, 103], 'spread')
+    # Empty rooms first, the larger one breaking the tie
+    assert [room_id for _, room_id in plan.assignments[:2]] == [4, 2]
+    assert set(_beds_used(plan)) <= {1, 2, 4, 5}
+    _check_capacity(plan)
+
+
+def test_overflow_is_unplaced(fake_db):
+    students = list(range(100, 110))
+    for policy in ('fill-first', 'spread', 'same-hostel'):
+        plan = plan_allocation(None, students, policy)
+        assert len(plan.assignments) == 7  # total free beds
+        assert plan.unplaced == students[7:]
+        _check_capacity(plan)
+
+
+def test_same_hostel_honours_preferences(fake_db):
+    plan = plan_allocation(None, [100, 101, 102, 103], 'same-hostel', preferences={100: 20, 102: 10})
+    hostel = {student_id: plan.rooms[room_id].hostel_id for student_id, room_id in plan.assignments}
+    assert hostel[100] == 20
+    assert hostel[101] == 20  # next to the previous student
+    assert hostel[102] == 10
+    assert hostel[103] == 10
+
+
+def test_same_hostel_falls_back_to_roomiest_hostel(fake_db):
+    # Hostel 10 has 3 free beds, so the fourth student preferring it moves on
+    plan = plan_allocation(None, [100, 101, 102, 103, 104], 'same-hostel', preferences={s: 10 for s in range(100, 105)})
+    hostels = [plan.rooms[room_id].hostel_id for _, room_id in plan.assignments]
+    assert hostels == [10, 10, 10, 20, 20]
+    _check_capacity(plan)
+
+
+def test_skips_allocated_and_repeated_students(fake_db):
+    plan = plan_allocation(None, [100, 100, 5, 101], 'fill-first')
+    assert [student_id for student_id, _ in plan.assignments] == [100, 101]
+
+
+def test_unknown_policy(fake_db):
+    with pytest.raises(ValueError):
+        plan_allocation(None, [100], 'random')
+
+
+def test_parse_students_header_optional():
+    assert parse_students(['student_id,hostel_id', '7,2', '8', '', '9, ']) == ([7, 8, 9], {7: 2})
+    assert parse_students(['7,2', '8,3']) == ([7, 8], {7: 2, 8: 3})
@@ -0,0 +1,130 @@
+"""Unit tests for the write-aware result cache."""
+import pytest
+
+import db
+from db import ResultCache, TableVersions
+
+IDENT = ('localhost', 3306, 'hostel')
+
+
+def test_hit_until_a_read_table_is_written():
+    versions = TableVersions()
+    cache = ResultCache()
+    key = ('fetch_table', 'fees')
+    cache.put(key, versions.snapshot(IDENT, ['fees', 'student']), [(1,)])
+    assert cache.get(key, versions.snapshot(IDENT, ['fees', 'student'])) == (True, [(1,)])
+    versions.bump(IDENT, ['room'])
+    assert cache.get(key, versions.snapshot(IDENT, ['fees', 'student']))[0]
+    versions.bump(IDENT, ['student'])
+    assert cache.get(key, versions.snapshot(IDENT, ['fees', 'student'])) == (False, None)
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['stale'], stats['entries']) == (2, 1, 1, 0)
+
+
+def test_versions_are_per_schema():
+    versions = TableVersions()
+    versions.bump(IDENT, ['fees'])
+    assert versions.snapshot(IDENT, ['fees', 'room']) == (1, 0)
+    assert versions.snapshot(('localhost', 3306, 'other'), ['fees']) == (0,)
+
+
+def test_ttl_expires_entries():
+    cache = ResultCache(ttl=0)
+    cache.put(('k',), (), 1)
+    assert cache.get(('k',), ()) == (False, None)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache(max_entries=2)
+    cache.put(('a',), (), 1)
+    cache.put(('b',), (), 2)
+    cache.get(('a',), ())
+    cache.put(('c',), (), 3)
+    assert cache.get(('b',), ())[0] is False
+    assert cache.get(('a',), ())[0] and cache.get(('c',), ())[0]
+    assert cache.stats()['evictions'] == 1
+
+
+def test_memory_bound():
+    row = [(i, 'x' * 100) for i in range(100)]
+    size = db._estimate_size(row)
+    cache = ResultCache(max_bytes=size * 2 + size // 2)
+    for name in 'abc':
+        cache.put((name,), (), list(row))
+    stats = cache.stats()
+    assert stats['entries'] == 2 and stats['bytes'] <= stats['max_bytes']
+    cache.put(('huge',), (), row * 10)  # larger than the whole cache: not stored
+    assert cache.get(('huge',), ())[0] is False
+    cache.clear()
+    assert cache.stats()['bytes'] == 0
+
+
+class FakeConnection:
+    pass
+
+
+@pytest.fixture
+def cached(monkeypatch):
+    monkeypatch.setattr(db, 'connection_identity', lambda conn: IDENT)
+    monkeypatch.setattr(db, 'table_versions', TableVersions())
+    monkeypatch.setattr(db, 'result_cache', ResultCache())
+    return FakeConnection()
+
+
+def test_cached_read_reloads_after_write(cached):
+    loads = []
+
+    def load():
+        loads.append(1)
+        return [(len(loads),)]
+    assert db._cached_read(cached, ['fees'], ('count_rows', 'fees'), load) == [(1,)]
+    assert db._cached_read(cached, ['fees'], ('count_rows', 'fees'), load) == [(1,)]
+    db.table_versions.bump(IDENT, ['fees'])
+    assert db._cached_read(cached, ['fees'], ('count_rows', 'fees'), load) == [(2,)]
+    assert len(loads) == 2
+
+
+class RoutineCursor:
+    def __init__(self, fail):
+        self.fail = fail
+
+    def execute(self, sql, params=()):
+        pass
+
+    def fetchall(self):
+        return [(1,)]
+
+    def callproc(self, name, args):
+        if self.fail:
+            raise db.Error('procedure failed')
+
+    def stored_results(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class RoutineConnection:
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    def cursor(self):
+        return RoutineCursor(self.fail)
+
+
+@pytest.fixture
+def routines(cached, monkeypatch):
+    meta = db.SchemaMetadata('hostel', tables=['fees', 'room'])
+    monkeypatch.setattr(db, 'get_schema', lambda conn, schema=None: meta)
+    return lambda: db.table_versions.snapshot(IDENT, ['fees', 'room'])
+
+
+def test_only_completed_procedures_invalidate(routines):
+    db.call_routine(RoutineConnection(), 'total_due', [1], 'FUNCTION')
+    assert routines() == (0, 0)
+    with pytest.raises(db.Error, match='procedure failed'):
+        db.call_routine(RoutineConnection(fail=True), 'pay_fee', [1])
+    assert routines() == (0, 0)
+    db.call_routine(RoutineConnection(), 'pay_fee', [1])
+    assert routines() == (1, 1)  # body not visible: every table may have been written
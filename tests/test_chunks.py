@@ -0,0 +1,86 @@
+"""Unit tests for the chunked readers, fed by a fake cursor."""
+import datetime
+import time
+from decimal import Decimal
+
+from mysql.connector import FieldType
+
+import db
+
+
+class FakeCursor:
+    def __init__(self, description, rows):
+        self.description = description
+        self.rows = list(rows)
+
+    def execute(self, query, params=()):
+        pass
+
+    def fetchmany(self, size):
+        chunk, self.rows = self.rows[:size], self.rows[size:]
+        return chunk
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, description, rows):
+        self.cur = FakeCursor(description, rows)
+
+    @property
+    def unread_result(self):
+        return bool(self.cur.rows)
+
+    def consume_results(self):
+        self.cur.rows = []
+
+    def cursor(self, buffered=None):
+        return self.cur
+
+
+def _column(name, type_code, null_ok=True):
+    return (name, type_code, None, None, None, None, null_ok, 0, 0)
+
+
+DESCRIPTION = [
+    _column('receipt_no', FieldType.LONG, False),
+    _column('student_id', FieldType.LONG),
+    _column('amount', FieldType.NEWDECIMAL, False),
+    _column('rate', FieldType.DOUBLE),
+    _column('due_date', FieldType.DATE),
+]
+ROWS = [(i, None if i == 3 else i * 10, Decimal('1500.10'), 0.5, datetime.date(2024, 1, i)) for i in range(1, 11)]
+
+
+def test_column_dtypes_keep_decimal_exact():
+    assert db.column_dtypes(DESCRIPTION) == {'receipt_no': 'int64', 'student_id': 'Int64', 'rate': 'float64',
+                                             'due_date': 'datetime64[ns]'}
+
+
+def test_chunks_are_typed():
+    chunks = list(db.iter_query_chunks(FakeConnection(DESCRIPTION, ROWS), 'SELECT ...', chunk_size=4))
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+    chunk = chunks[0]
+    assert str(chunk['receipt_no'].dtype) == 'int64' and str(chunk['student_id'].dtype) == 'Int64'
+    assert chunk['amount'].tolist() == [Decimal('1500.10')] * 4
+    assert sum(sum(c['amount']) for c in chunks) == Decimal('15001.00')
+    assert chunks[0]['student_id'].isna().tolist() == [False, False, True, False]
+
+
+def test_query_rows_yield_tuples():
+    chunks = list(db.iter_query_rows(FakeConnection(DESCRIPTION, ROWS), 'SELECT ...', chunk_size=6))
+    assert chunks == [ROWS[:6], ROWS[6:]]
+
+
+def test_early_close_drains_and_excludes_consumer_time():
+    conn = FakeConnection(DESCRIPTION, ROWS)
+    with db.capture_queries() as events:
+        chunks = db.iter_query_rows(conn, 'SELECT ...', chunk_size=4)
+        next(chunks)
+        time.sleep(0.05)  # the consumer's work
+        chunks.close()
+    assert not conn.unread_result
+    event, = events
+    assert event.rows == 4
+    assert event.wall_time < 0.05
@@ -0,0 +1,103 @@
+"""Unit tests for ColumnarResult, built by query_columnar from a fake cursor."""
+import datetime
+from decimal import Decimal
+
+import numpy as np
+from mysql.connector import FieldType
+
+from db import query_columnar
+
+
+class FakeCursor:
+    def __init__(self, description, rows):
+        self.description = description
+        self.rows = list(rows)
+
+    def execute(self, query, params=()):
+        pass
+
+    def fetchmany(self, size):
+        chunk, self.rows = self.rows[:size], self.rows[size:]
+        return chunk
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    unread_result = False
+
+    def __init__(self, description, rows):
+        self.cur = FakeCursor(description, rows)
+
+    def cursor(self, buffered=None):
+        return self.cur
+
+
+def _column(name, type_code, null_ok=True):
+    return (name, type_code, None, None, None, None, null_ok, 0, 0)
+
+
+DESCRIPTION = [
+    _column('student_id', FieldType.LONG, False),
+    _column('room_id', FieldType.LONG),
+    _column('amount', FieldType.NEWDECIMAL),
+    _column('due_date', FieldType.DATE),
+    _column('status', FieldType.VAR_STRING),
+    _column('remarks', FieldType.VAR_STRING),
+]
+ROWS = [
+    (i, None if i % 3 == 0 else 100 + i % 4, Decimal('1500.50'), datetime.date(2024, 1, 1 + i % 28),
+     'Paid' if i % 2 else 'Pending', None if i == 5 else f'note {i}')
+    for i in range(1, 101)
+]
+
+
+def _result(rows=ROWS, chunk_size=7):
+    return query_columnar(FakeConnection(DESCRIPTION, rows), 'SELECT ...', chunk_size=chunk_size)
+
+
+def test_columns_are_typed_arrays():
+    result = _result()
+    assert len(result) == 100 and result.columns == [d[0] for d in DESCRIPTION]
+    assert result.arrays['student_id'].dtype == np.int8
+    assert result.arrays['amount'].dtype == np.float64
+    assert result.arrays['due_date'].dtype == np.dtype('datetime64[ns]')
+
+
+def test_nullable_ints_keep_a_mask():
+    result = _result()
+    assert 'student_id' not in result.masks
+    series = result.column('room_id')
+    assert series.isna().sum() == 33
+    assert series.dropna().tolist() == [100 + i % 4 for i in range(1, 101) if i % 3]
+
+
+def test_repetitive_strings_are_dictionary_encoded():
+    result = _result()
+    assert result.dictionaries['status'] == ['Paid', 'Pending']
+    assert result.arrays['status'].dtype == np.int8
+    assert 'remarks' not in result.dictionaries
+    assert result.arrays['remarks'][4] is None and result.arrays['remarks'][5] == 'note 6'
+
+
+def test_to_pandas_round_trip():
+    frame = _result().to_pandas()
+    assert frame['status'].tolist() == [row[4] for row in ROWS]
+    assert frame['remarks'].tolist() == [row[5] for row in ROWS]
+    assert frame['due_date'].dt.date.tolist() == [row[3] for row in ROWS]
+    assert frame['amount'].sum() == 150050.0
+
+
+def test_nbytes_counts_every_column():
+    result = _result()
+    sizes = result.column_nbytes()
+    assert set(sizes) == set(result.columns)
+    assert result.nbytes == sum(sizes.values())
+    assert sizes['status'] < sizes['remarks']
+
+
+def test_empty_result():
+    result = _result([])
+    assert len(result) == 0
+    assert len(result.to_pandas().columns) == len(DESCRIPTION)
@@ -0,0 +1,34 @@
+"""Unit tests for the visit generator; nothing is inserted."""
+import datetime
+import random
+
+import pytest
+
+from datagen import visits
+
+START = datetime.date(2024, 1, 1)
+
+
+def _keys(total, students=3, visitors=4, days=5):
+    rows = list(visits(random.Random(1), range(1, students + 1), range(10, 10 + visitors), total, START, days))
+    return [(row['student_id'], row['visitor_id'], row['visit_date']) for row in rows]
+
+
+def test_one_visit_a_day_until_the_days_run_out():
+    keys = _keys(14)
+    assert len(keys) == 14
+    per_student = {}
+    for student_id, _, date in keys:
+        per_student.setdefault(student_id, []).append(date)
+    assert all(len(dates) == len(set(dates)) for dates in per_student.values())
+
+
+def test_more_visitors_per_day_past_the_days():
+    keys = _keys(50)
+    assert len(keys) == 50 == len(set(keys))
+    assert len(_keys(60)) == 60
+
+
+def test_target_beyond_distinct_visits_raises():
+    with pytest.raises(ValueError):
+        _keys(61)
@@ -0,0 +1,76 @@
+"""Unit tests for where_clause against faked schema metadata."""
+import datetime
+from decimal import Decimal
+
+import pytest
+
+import db
+from db import Error, where_clause
+
+COLUMNS = [
+    # Field, Type, Null, Key, Default, Extra
+    ('receipt_no', 'int', 'NO', 'PRI', None, 'auto_increment'),
+    ('student_id', 'int', 'NO', 'MUL', None, ''),
+    ('amount', 'decimal(10,2)', 'NO', '', None, ''),
+    ('due_date', 'date', 'NO', '', None, ''),
+    ('date_paid', 'date', 'YES', '', None, ''),
+    ('remarks', 'varchar(100)', 'YES', '', None, ''),
+]
+
+
+@pytest.fixture(autouse=True)
+def schema(monkeypatch):
+    meta = db.SchemaMetadata('hostel', tables=['fees'], columns={'fees': COLUMNS})
+    monkeypatch.setattr(db, 'get_schema', lambda conn, schema=None: meta)
+
+
+def test_no_filters():
+    assert where_clause(None, 'fees', []) == ('1=1', [])
+
+
+def test_values_are_converted_to_column_types():
+    sql, params = where_clause(None, 'fees', [('student_id', 'eq', ' 17 '), ('amount', 'ge', '1500.50'),
+                                              ('due_date', 'lt', '2024-06-01')])
+    assert sql == '`student_id` = %s AND `amount` >= %s AND `due_date` < %s'
+    assert params == [17, Decimal('1500.50'), datetime.date(2024, 6, 1)]
+
+
+def test_between_with_open_end():
+    assert where_clause(None, 'fees', [('amount', 'between', ('100', None))]) == ('`amount` >= %s', [Decimal(100)])
+    sql, params = where_clause(None, 'fees', [('due_date', 'between', ('2024-01-01', '2024-01-31'))])
+    assert sql == '`due_date` >= %s AND `due_date` <= %s'
+    assert params == [datetime.date(2024, 1, 1), datetime.date(2024, 1, 31)]
+
+
+def test_in_and_null_checks():
+    assert where_clause(None, 'fees', [('student_id', 'in', ['1', '2'])]) == ('`student_id` IN (%s, %s)', [1, 2])
+    assert where_clause(None, 'fees', [('student_id', 'in', [])]) == ('1=0', [])
+    assert where_clause(None, 'fees', [('date_paid', 'is_null', None)]) == ('`date_paid` IS NULL', [])
+    assert where_clause(None, 'fees', [('date_paid', 'not_null')]) == ('`date_paid` IS NOT NULL', [])
+
+
+def test_prefix_escapes_like_wildcards():
+    assert where_clause(None, 'fees', [('remarks', 'prefix', '50%_off\\')]) == (
+        '`remarks` LIKE %s', ['50\\%\\_off\\\\%'])
+
+
+@pytest.mark.parametrize('filters', [
+    [('nope', 'eq', 1)],
+    [('amount', 'like', 1)],
+    [('remarks', 'gt', 'a')],
+    [('amount', 'prefix', '1')],
+])
+def test_rejects_bad_filters(filters):
+    with pytest.raises(Error):
+        where_clause(None, 'fees', filters)
+
+
+def test_unknown_table():
+    with pytest.raises(Error):
+        where_clause(None, 'nope', [])
+
+
+def test_normalized_filters_are_hashable():
+    filters = db.normalize_filters([('student_id', 'in', [1, 2]), ('date_paid', 'is_null')])
+    assert filters == (('student_id', 'in', (1, 2)), ('date_paid', 'is_null', None))
+    hash(filters)
@@ -0,0 +1,63 @@
+"""Unit tests for the keyset seek predicate, evaluated by SQLite."""
+import itertools
+import sqlite3
+
+import pytest
+
+from db import _seek_predicate
+
+
+@pytest.fixture
+def table():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE t (a INTEGER, b INTEGER, c TEXT)')
+    rows = list(itertools.product([1, 2, 3], [1, 2], ['x', 'y']))
+    conn.executemany('INSERT INTO t VALUES (?, ?, ?)', rows)
+    yield conn, rows
+    conn.close()
+
+
+def _null_first(row):
+    # MySQL (and SQLite) sort NULL before every value
+    return tuple((value is not None, value) for value in row)
+
+
+def _select(conn, key_columns, op, values, nullable=()):
+    clause, params = _seek_predicate(key_columns, op, values, nullable)
+    sql = f"SELECT a, b, c FROM t WHERE {clause.replace('%s', '?')}"
+    return sorted(conn.execute(sql, params).fetchall(), key=_null_first)
+
+
+@pytest.mark.parametrize('key_columns', [['a'], ['a', 'b'], ['a', 'b', 'c']])
+@pytest.mark.parametrize('op', ['>', '<'])
+def test_matches_row_comparison(table, key_columns, op):
+    conn, rows = table
+    width = len(key_columns)
+    for cursor in rows:
+        cursor = cursor[:width]
+        expected = sorted((row for row in rows if (row[:width] > cursor if op == '>' else row[:width] < cursor)),
+                          key=_null_first)
+        assert _select(conn, key_columns, op, cursor) == expected
+
+
+def test_leading_column_is_a_plain_range():
+    clause, params = _seek_predicate(['a', 'b'], '>', (5, 7))
+    assert clause.startswith('`a` >= %s AND ')
+    assert params == [5, 5, 7]
+
+
+@pytest.mark.parametrize('op', ['>', '<'])
+def test_nullable_columns_sort_null_first(op):
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE t (a INTEGER, b INTEGER, c TEXT)')
+    rows = list(itertools.product([1, 2], [None, 1, 2], [None, 'x']))
+    conn.executemany('INSERT INTO t VALUES (?, ?, ?)', rows)
+    try:
+        for cursor in rows:
+            compare = _null_first(cursor)
+            expected = sorted((row for row in rows
+                               if (_null_first(row) > compare if op == '>' else _null_first(row) < compare)),
+                              key=_null_first)
+            assert _select(conn, ['a', 'b', 'c'], op, cursor, ['b', 'c']) == expected, cursor
+    finally:
+        conn.close()
@@ -0,0 +1,193 @@
+"""Unit tests for ConnectionPool; connections are faked, no server is needed."""
+import threading
+import time
+
+import pytest
+
+import db
+from db import ConnectionPool, Error, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self):
+        self.healthy = True
+        self.closed = False
+        self.unread_result = False
+        self.in_transaction = False
+
+    def ping(self, reconnect=False):
+        if not self.healthy:
+            raise Error('server has gone away')
+
+    def consume_results(self):
+        self.unread_result = False
+
+    def rollback(self):
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    """Every connection the pool opens, in order."""
+    conns = []
+
+    def connect(config=None):
+        conns.append(FakeConnection())
+        return conns[-1]
+    monkeypatch.setattr(db, 'get_connection', connect)
+    return conns
+
+
+def test_reuses_most_recently_returned(opened):
+    pool = ConnectionPool({}, max_size=3)
+    a, b = pool.acquire(), pool.acquire()
+    pool.release(a)
+    pool.release(b)
+    assert pool.acquire() is b
+    assert pool.acquire() is a
+    assert len(opened) == 2
+    stats = pool.stats()
+    assert (stats['hits'], stats['misses'], stats['size'], stats['in_use']) == (2, 2, 2, 2)
+
+
+def test_checkout_times_out_when_exhausted(opened):
+    pool = ConnectionPool({}, max_size=1, checkout_timeout=0.05)
+    pool.acquire()
+    started = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert time.monotonic() - started >= 0.05
+    assert pool.stats()['timeouts'] == 1
+    assert len(opened) == 1
+
+
+def test_waiter_gets_released_connection(opened):
+    pool = ConnectionPool({}, max_size=1)
+    conn = pool.acquire()
+    threading.Timer(0.05, pool.release, [conn]).start()
+    assert pool.acquire(timeout=5) is conn
+    stats = pool.stats()
+    assert stats['waits'] >= 1 and stats['wait_time'] > 0
+
+
+def test_release_resets_connection(opened):
+    pool = ConnectionPool({})
+    with pool.connection() as conn:
+        conn.unread_result = True
+        conn.in_transaction = True
+    assert not conn.unread_result and not conn.in_transaction
+    assert pool.stats()['idle'] == 1
+
+
+def test_dead_connection_is_replaced(opened):
+    pool = ConnectionPool({}, health_check_interval=0)
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.healthy = False
+    fresh = pool.acquire()
+    assert fresh is not conn and conn.closed
+    stats = pool.stats()
+    assert (stats['discarded'], stats['size']) == (1, 1)
+
+
+def test_idle_connections_are_reaped(opened):
+    pool = ConnectionPool({}, idle_timeout=0.01)
+    with pool.connection():
+        pass
+    time.sleep(0.02)
+    assert pool.evict_idle() == 1
+    assert opened[0].closed
+    stats = pool.stats()
+    assert (stats['evicted'], stats['size'], stats['idle']) == (1, 0, 0)
+
+
+def test_failed_connect_frees_the_slot(monkeypatch):
+    def refuse(config=None):
+        raise Error('connection refused')
+    monkeypatch.setattr(db, 'get_connection', refuse)
+    pool = ConnectionPool({}, max_size=1)
+    with pytest.raises(Error):
+        pool.acquire()
+    assert pool.stats()['size'] == 0
+
+
+def test_close(opened):
+    pool = ConnectionPool({})
+    idle, busy = pool.acquire(), pool.acquire()
+    pool.release(idle)
+    pool.close()
+    assert idle.closed and not busy.closed
+    pool.release(busy)
+    assert busy.closed
+    assert pool.stats()['size'] == 0
+    with pytest.raises(Error):
+        pool.acquire()
+
+
+def test_get_pool_is_shared_per_config(opened, monkeypatch):
+    monkeypatch.setattr(db, '_pools', {})
+    pool = db.get_pool({'host': 'a'}, max_size=2)
+    assert db.get_pool({'host': 'a'}) is pool
+    assert db.get_pool({'host': 'b'}) is not pool
+    assert pool.max_size == 2
+    db.close_all_pools()
+    with pytest.raises(Error):
+        pool.acquire()
+
+
+def _where(conn, value):
+    return conn, threading.current_thread().name, value
+
+
+def test_run_parallel_uses_caller_connection_first(opened):
+    pool = ConnectionPool({}, max_size=3)
+    caller = FakeConnection()
+    loaded = db.run_parallel(pool, {'a': (_where, 1), 'b': (_where, 2), 'c': (_where, 3)}, caller)
+    assert list(loaded) == ['a', 'b', 'c']
+    assert loaded['a'] == (caller, threading.current_thread().name, 1)
+    assert {loaded['b'][0], loaded['c'][0]} <= set(opened)
+    assert all(loaded[name][1].startswith('db-read') for name in 'bc')
+    assert pool.stats()['in_use'] == 0
+
+
+def test_run_parallel_reraises_after_all_calls(opened):
+    finished = []
+
+    def fail(conn):
+        raise Error('boom')
+
+    def slow(conn):
+        time.sleep(0.05)
+        finished.append(conn)
+    pool = ConnectionPool({})
+    with pytest.raises(Error, match='boom'):
+        db.run_parallel(pool, {'fail': (fail,), 'slow': (slow,)})
+    assert len(finished) == 1
+    assert pool.stats()['in_use'] == 0
+
+
+def test_run_parallel_with_pool_exhausted_runs_on_caller(opened):
+    # Every slot is held, e.g. by concurrent reruns that each keep one connection.
+    pool = ConnectionPool({}, max_size=2, checkout_timeout=5)
+    caller, other = pool.acquire(), pool.acquire()
+    started = time.monotonic()
+    loaded = db.run_parallel(pool, {'a': (_where, 1), 'b': (_where, 2), 'c': (_where, 3)}, caller)
+    assert time.monotonic() - started < 1
+    assert [loaded[name][0] for name in 'abc'] == [caller, caller, caller]
+    assert [loaded[name][2] for name in 'abc'] == [1, 2, 3]
+    stats = pool.stats()
+    assert (stats['busy'], stats['timeouts'], stats['in_use']) == (2, 0, 2)
+    pool.release(other)
+    pool.release(caller)
+
+
+def test_try_acquire(opened):
+    pool = ConnectionPool({}, max_size=1)
+    conn = pool.try_acquire()
+    assert conn is opened[0]
+    assert pool.try_acquire() is None
+    pool.release(conn)
+    assert pool.try_acquire() is conn
@@ -0,0 +1,99 @@
+"""Unit tests for FeeIndex; open fees are added in memory or loaded from a fake cursor."""
+import datetime
+from decimal import Decimal
+
+from reconcile import FeeIndex, Payment, _cents
+
+DAY = datetime.date(2024, 5, 1)
+
+
+def _index(fees):
+    """fees: (receipt_no, student_id, amount), oldest due date first."""
+    index = FeeIndex()
+    for receipt_no, student_id, amount in fees:
+        cents = _cents(amount)
+        index.by_receipt[receipt_no] = (student_id, cents)
+        index.by_student.setdefault((student_id, cents), []).append(receipt_no)
+        index.has_open[student_id] += 1
+    return index
+
+
+def _payment(line, receipt_no=None, student_id=None, amount='0'):
+    return Payment(line, receipt_no, student_id, _cents(amount), DAY)
+
+
+def test_cents():
+    assert _cents(Decimal('1500.10')) == 150010
+    assert _cents(0.1) == 10
+    assert _cents('99.995') == 10000
+
+
+def test_match_by_receipt():
+    index = _index([(1, 7, '1500.00'), (2, 7, '1500.00')])
+    assert index.match(_payment(1, receipt_no=2, student_id=7, amount='1500')) == ('matched', '', 2)
+    assert 2 not in index.by_receipt
+    assert index.by_student[(7, 150000)] == [1]
+    assert index.has_open[7] == 1
+
+
+def test_duplicate_and_not_open():
+    index = _index([(1, 7, '1500.00')])
+    index.match(_payment(1, receipt_no=1, amount='1500'))
+    status, detail, receipt_no = index.match(_payment(2, receipt_no=1, amount='1500'))
+    assert (status, receipt_no) == ('duplicate', None)
+    assert 'line 1' in detail
+    assert index.match(_payment(3, receipt_no=99, amount='1500'))[0] == 'not_open'
+
+
+def test_receipt_mismatches_leave_fee_open():
+    index = _index([(1, 7, '1500.00')])
+    assert index.match(_payment(1, receipt_no=1, student_id=8, amount='1500'))[0] == 'student_mismatch'
+    assert index.match(_payment(2, receipt_no=1, amount='1499.99'))[0] == 'amount_mismatch'
+    assert index.match(_payment(3, receipt_no=1, amount='1500'))[0] == 'matched'
+
+
+def test_match_by_student_takes_oldest_fee():
+    index = _index([(5, 7, '200'), (3, 7, '200'), (4, 7, '300')])
+    assert index.match(_payment(1, student_id=7, amount='200.00')) == ('matched', '', 5)
+    assert index.match(_payment(2, student_id=7, amount='200')) == ('matched', '', 3)
+    status, detail, _ = index.match(_payment(3, student_id=7, amount='200'))
+    assert status == 'no_match' and 'no open fee of 200.00' in detail
+    assert index.match(_payment(4, student_id=7, amount='300'))[2] == 4
+    status, detail, _ = index.match(_payment(5, student_id=7, amount='300'))
+    assert status == 'no_match' and detail == 'student 7 has no open fees'
+
+
+class FakeCursor:
+    description = [('receipt_no',), ('student_id',), ('amount',)]
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, query, params=()):
+        pass
+
+    def fetchmany(self, size):
+        chunk, self.rows = self.rows[:size], self.rows[size:]
+        return chunk
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    unread_result = False
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self, buffered=None):
+        return FakeCursor(list(self.rows))
+
+
+def test_load_streams_exact_amounts():
+    rows = [(1, 7, Decimal('1500.10')), (2, 7, Decimal('0.29')), (3, 8, Decimal('1500.10'))]
+    index = FeeIndex()
+    assert index.load(FakeConnection(rows), chunk_size=2) == 3
+    assert index.by_receipt == {1: (7, 150010), 2: (7, 29), 3: (8, 150010)}
+    assert index.by_student[(7, 29)] == [2]
+    assert index.has_open == {7: 2, 8: 1}
@@ -0,0 +1,133 @@
+"""Unit tests for search.py that need no database."""
+import db
+from db import WriteEvent
+from search import SearchIndex, Source, _TableIndex, _terms, _tokens
+
+
+def _entries():
+    return {
+        1: ('John Smith', _tokens('John Smith', ['9876543210'])),
+        2: ('Joan Smythe', _tokens('Joan Smythe', [])),
+        3: ('Johnny Cash', _tokens('Johnny Cash', ['+91 98765 11111'])),
+    }
+
+
+def test_put_then_remove_restores_index():
+    index = _TableIndex(_entries())
+    before = (list(index.tokens), list(index.keys), dict(index.entries))
+    index.put(4, 'John Doe', _tokens('John Doe', ['5550001']))
+    assert 4 in index.entries
+    index.remove(4)
+    assert (index.tokens, index.keys, index.entries) == before
+
+
+def test_put_replaces_previous_tokens():
+    index = _TableIndex(_entries())
+    index.put(1, 'Jane Smith', _tokens('Jane Smith', []))
+    assert index.search(['john'], 10) == [3]
+    assert index.search(['jane'], 10) == [1]
+    assert index.tokens == sorted(index.tokens)
+
+
+def test_multi_term_prefix_search():
+    index = _TableIndex(_entries())
+    assert sorted(index.search(_terms('jo sm'), 10)) == [1, 2]
+    assert index.search(_terms('Sm JOH'), 10) == [1]
+    assert index.search(_terms('jo ca'), 10) == [3]
+    assert index.search(_terms('jo zz'), 10) == []
+    assert index.search([], 10) == []
+
+
+def test_search_limit_and_no_repeats():
+    index = _TableIndex(_entries())
+    # 'john' and 'johnny' both start with 'jo'; each key is returned once
+    assert len(index.search(['jo'], 10)) == 3
+    assert len(index.search(['jo'], 2)) == 2
+
+
+def test_phone_tokens_with_country_code():
+    tokens = _tokens('Johnny Cash', ['+91 98765 11111'])
+    assert '919876511111' in tokens
+    assert '9876511111' in tokens
+    assert _terms('98765-11111') == ['9876511111']
+    assert _terms('+91 98765 11111') == ['919876511111']
+    index = _TableIndex(_entries())
+    assert index.search(_terms('98765 111'), 10) == [3]
+    assert index.search(_terms('+91 9876'), 10) == [3]
+
+
+class _FakeIndex(SearchIndex):
+    """Loads from a dict instead of the database and records refreshes."""
+
+    def __init__(self, rows):
+        super().__init__({'student': Source('student_id', '', None, ('phone_student',))})
+        self.rows = rows
+        self.loaded = []
+
+    def _load(self, conn, table, keys=None):
+        self.loaded.append(keys)
+        return {key: (label, _tokens(label, [])) for key, label in self.rows.items()
+                if keys is None or key in keys}
+
+
+def _fake_index(monkeypatch, rows):
+    monkeypatch.setattr(db, 'connection_identity', lambda conn: ('test',))
+    monkeypatch.setattr(db, 'get_schema', lambda conn: db.SchemaMetadata('test', tables=['student']))
+    index = _FakeIndex(rows)
+    index.build(None)
+    return index
+
+
+def test_on_write_refreshes_written_rows(monkeypatch):
+    index = _fake_index(monkeypatch, {1: 'John Smith', 2: 'Joan Smythe'})
+    index.rows[2] = 'Joan Baker'
+    index.on_write(None, WriteEvent('student', 'update', [{'student_id': '2'}], {'student'}))
+    assert index.loaded[-1] == {2}
+    assert [m.key for m in index.search(None, 'student', 'baker')] == [2]
+    assert index.search(None, 'student', 'smythe') == []
+
+
+def test_on_write_drops_table_when_rows_lack_key(monkeypatch):
+    index = _fake_index(monkeypatch, {1: 'John Smith'})
+    index.on_write(None, WriteEvent('student', 'insert', [{'student_id': 5}, {'f_name': 'Ann'}], {'student'}))
+    assert index._indexes[('test',)] == {}
+    index.rows[6] = 'Ann Lee'
+    assert [m.label for m in index.search(None, 'student', 'ann')] == ['Ann Lee']
+    assert index.loaded[-1] is None  # rebuilt in full, not refreshed row by row
+
+
+class FakeCursor:
+    def __init__(self, results):
+        self.results = results
+        self.rows = []
+        self.description = [('key', 3, None, None, None, None, False, 0, 0)]
+
+    def execute(self, sql, params=()):
+        self.rows = list(self.results['phone' if 'phone' in sql else 'label'])
+
+    def fetchmany(self, size):
+        chunk, self.rows = self.rows[:size], self.rows[size:]
+        return chunk
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    unread_result = False
+
+    def __init__(self, results):
+        self.results = results
+
+    def cursor(self, buffered=None):
+        return FakeCursor(self.results)
+
+
+def test_load_is_instrumented():
+    conn = FakeConnection({'label': [(1, 'John Smith'), (2, None)], 'phone': [(1, '+91 98765 43210'), (3, '555')]})
+    with db.capture_queries() as events:
+        entries = SearchIndex()._load(conn, 'student')
+    assert entries[1] == ('John Smith', _tokens('John Smith', ['+91 98765 43210']))
+    assert entries[2] == ('', ())
+    assert [(e.function, e.table, e.rows) for e in events] == [('iter_query_rows', 'student', 2),
+                                                                ('iter_query_rows', 'student', 2)]